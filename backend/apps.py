@@ -7,3 +7,7 @@ class BackendConfig(AppConfig):
 
     def ready(self):
         import backend.signals
+        from backend import profiling, task_metrics
+
+        profiling.connect_task_signals()
+        task_metrics.connect_task_signals()
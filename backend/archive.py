@@ -0,0 +1,73 @@
+"""
+Архив завершённых заказов.
+
+Доставленные и отменённые заказы старше ORDER_ARCHIVE_DAYS дней переносятся
+из Order и OrderItem в ArchivedOrder: одна строка на заказ, позиции и
+контакт — снимками в JSON. Перенос идёт пачками по
+ORDER_ARCHIVE_BATCH_SIZE, каждая в своей транзакции, поэтому рабочие
+таблицы остаются маленькими и не блокируются надолго. Общий заказ
+(корзина нескольких магазинов) уходит в архив вместе с последним из
+своих заказов магазинов. Историю читает OrderArchiveView.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import Order, OrderItem, ArchivedOrder
+from backend.serializers import CONTACT_VALUES
+
+ARCHIVED_STATES = ('delivered', 'canceled')
+
+ORDER_VALUES = ('id', 'user_id', 'shop_id', 'parent_id', 'state', 'dt', 'total')
+
+
+def _order_rows(queryset):
+    rows = []
+    for row in queryset.values(*ORDER_VALUES, *(f'contact__{name}' for name in CONTACT_VALUES)):
+        contact = {name: row.pop(f'contact__{name}') for name in CONTACT_VALUES}
+        rows.append({**row, 'contact': contact if contact['id'] is not None else None})
+    return rows
+
+
+def _move(orders):
+    """Копирует заказы orders (строки _order_rows) в архив и удаляет их с позициями."""
+    ids = [order['id'] for order in orders]
+    items = {}
+    for order_id, product_info_id, external_id, name, shop_id, quantity, price in OrderItem.objects \
+            .filter(order_id__in=ids).order_by('id') \
+            .values_list('order_id', 'product_info_id', 'product_info__external_id', 'product_info__product__name',
+                         'product_info__shop_id', 'quantity', 'product_info__price'):
+        items.setdefault(order_id, []).append({
+            'product_info': product_info_id, 'external_id': external_id, 'product': name, 'shop': shop_id,
+            'quantity': quantity, 'price': price})
+    ArchivedOrder.objects.bulk_create([ArchivedOrder(**order, items=items.get(order['id'], []))
+                                       for order in orders])
+    OrderItem.objects.filter(order_id__in=ids).delete()
+    Order.objects.filter(id__in=ids).delete()
+
+
+@transaction.atomic
+def archive_batch(ids):
+    """Переносит в архив заказы ids и общие заказы, у которых не осталось заказов магазинов."""
+    orders = _order_rows(Order.objects.filter(id__in=ids))
+    _move(orders)
+    parent_ids = {order['parent_id'] for order in orders} - {None}
+    parents = _order_rows(Order.objects.filter(id__in=parent_ids, sub_orders__isnull=True)) if parent_ids else []
+    if parents:
+        _move(parents)
+    return len(orders)
+
+
+def archive_orders(days=None, batch_size=None):
+    """Переносит в архив завершённые заказы старше days дней, возвращает их число."""
+    days = settings.ORDER_ARCHIVE_DAYS if days is None else days
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    candidates = Order.objects.filter(state__in=ARCHIVED_STATES, shop__isnull=False,
+                                      dt__lt=timezone.now() - datetime.timedelta(days=days)).order_by('id')
+    archived = 0
+    # перенесённые заказы удаляются, поэтому каждая следующая пачка — снова первые строки
+    while ids := list(candidates.values_list('id', flat=True)[:batch_size]):
+        archived += archive_batch(ids)
+    return archived
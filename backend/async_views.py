@@ -0,0 +1,206 @@
+"""
+Асинхронные версии эндпоинтов с долгим вводом-выводом (для запуска под ASGI).
+
+PartnerUpdate скачивает прайс асинхронным HTTP-клиентом, корзина и размещение
+заказа работают через асинхронный ORM, постановка задач Celery выносится
+из цикла событий в поток. Авторизация — тот же токен DRF
+(заголовок ``Authorization: Token <key>``).
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import IntegrityError
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from backend.imports import parse_price_list, import_price_list
+from backend.models import Order, OrderItem, ProductInfo
+from backend.ordering import place_order
+from backend.renderers import FastJSONRenderer
+from backend.serializers import FieldSelection, serialize_orders
+from backend.tasks import new_order
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+async def fetch(url):
+    """Скачивает документ по url, не блокируя цикл событий."""
+    if httpx is None:
+        from requests import get
+        response = await sync_to_async(get, thread_sensitive=False)(url)
+        return response.content
+
+    async with httpx.AsyncClient(follow_redirects=True) as client:
+        response = await client.get(url)
+        return response.content
+
+
+async def aget_user(request):
+    """Пользователь по заголовку ``Authorization: Token <key>`` или None."""
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword != 'Token' or not key.strip():
+        return None
+    token = await Token.objects.select_related('user').filter(key=key.strip()).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def parse_body(request):
+    """Тело запроса: JSON или данные формы."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+
+def valid_items(items, id_field):
+    """items — непустой список словарей с целым id_field (строка из формы или список чисел не подходят)."""
+    return isinstance(items, list) and bool(items) and all(
+        isinstance(item, dict) and type(item.get(id_field)) == int for item in items)
+
+
+LOGIN_REQUIRED = {'Status': False, 'Error': 'Log in required'}
+ARGUMENTS_REQUIRED = {'Status': False, 'Errors': 'Не указаны все необходимые аргументы'}
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    """Базовый класс: авторизация по токену до вызова обработчика."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await aget_user(request)
+        if request.user is None:
+            return json_response(LOGIN_REQUIRED, status=status.HTTP_403_FORBIDDEN)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncPartnerUpdate(AsyncAPIView):
+    """Асинхронное обновление прайса от поставщика"""
+
+    async def post(self, request, *args, **kwargs):
+        """Метод post скачивает прайс без блокировки воркера и загружает его в каталог."""
+
+        if request.user.type != 'shop':
+            return json_response({'Status': False, 'Error': 'Только для магазинов'},
+                                 status=status.HTTP_403_FORBIDDEN)
+
+        url = parse_body(request).get('url')
+        if url:
+            try:
+                URLValidator()(url)
+            except ValidationError as e:
+                return json_response({'Status': False, 'Error': str(e)})
+
+            stream = await fetch(url)
+            data = await sync_to_async(parse_price_list, thread_sensitive=False)(stream)
+            await sync_to_async(import_price_list)(request.user.id, data)
+            return json_response({'Status': True})
+
+        return json_response(ARGUMENTS_REQUIRED, status=status.HTTP_403_FORBIDDEN)
+
+
+class AsyncBasketView(AsyncAPIView):
+    """Асинхронная работа с корзиной пользователя"""
+
+    async def get(self, request, *args, **kwargs):
+        """Метод get возвращает корзину пользователя."""
+
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
+        data = await sync_to_async(serialize_orders)(basket, FieldSelection.from_request(request))
+        return json_response(data)
+
+    async def post(self, request, *args, **kwargs):
+        """Метод post добавляет товары в корзину."""
+
+        items = parse_body(request).get('items')
+        if not valid_items(items, 'product_info'):
+            return json_response(ARGUMENTS_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
+
+        existing = {product_info_id async for product_info_id in ProductInfo.objects.filter(
+            id__in={item['product_info'] for item in items}).values_list('id', flat=True)}
+
+        basket, created = await Order.objects.aget_or_create(user_id=request.user.id, state='basket')
+        if not created:
+            # dt корзины — время последнего добавления (backend.cleanup)
+            await Order.objects.filter(id=basket.id).aupdate(dt=timezone.now())
+        objects_created = 0
+        for order_item in items:
+            product_info_id, quantity = order_item.get('product_info'), order_item.get('quantity')
+            if product_info_id not in existing or type(quantity) != int or quantity < 0:
+                return json_response({'Status': False, 'Errors': 'Неверный формат запроса'},
+                                     status=status.HTTP_400_BAD_REQUEST)
+            try:
+                await OrderItem.objects.acreate(order_id=basket.id, product_info_id=product_info_id,
+                                                quantity=quantity)
+            except IntegrityError as error:
+                return json_response({'Status': False, 'Errors': str(error)})
+            objects_created += 1
+
+        return json_response({'Status': True, 'Создано объектов': objects_created}, status=status.HTTP_201_CREATED)
+
+    async def put(self, request, *args, **kwargs):
+        """Метод put обновляет количество товаров в корзине."""
+
+        items = parse_body(request).get('items')
+        if not items or not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return json_response(ARGUMENTS_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
+
+        objects_updated = 0
+        for order_item in items:
+            if type(order_item.get('product_info_id')) == int and type(order_item.get('quantity')) == int:
+                objects_updated += await OrderItem.objects.filter(
+                    order__user_id=request.user.id, order__state='basket',
+                    product_info_id=order_item['product_info_id']).aupdate(
+                    quantity=order_item['quantity'])
+
+        return json_response({'Status': True, 'Обновлено объектов': objects_updated})
+
+    async def delete(self, request, *args, **kwargs):
+        """Метод delete удаляет товары из корзины."""
+
+        items = parse_body(request).get('items')
+        item_ids = [item_id for item_id in str(items or '').split(',') if item_id.isdigit()]
+        if not item_ids:
+            return json_response(ARGUMENTS_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
+
+        deleted_count, _ = await OrderItem.objects.filter(order__user_id=request.user.id, order__state='basket',
+                                                          id__in=item_ids).adelete()
+        return json_response({'Status': True, 'Удалено объектов': deleted_count})
+
+
+class AsyncOrderView(AsyncAPIView):
+    """Асинхронное размещение заказа"""
+
+    async def post(self, request, *args, **kwargs):
+        """Метод post переводит корзину в заказ и ставит письмо в очередь."""
+
+        data = parse_body(request)
+        if {'id', 'contact'}.issubset(data) and str(data['id']).isdigit():
+            try:
+                is_updated = await sync_to_async(place_order)(request.user.id, int(data['id']), data['contact'])
+            except IntegrityError:
+                return json_response({'Status': False, 'Errors': 'Неправильно указаны аргументы'},
+                                     status=status.HTTP_400_BAD_REQUEST)
+            if is_updated:
+                await sync_to_async(new_order.delay, thread_sensitive=False)(user_id=request.user.id)
+                return json_response({'Status': True})
+
+        return json_response(ARGUMENTS_REQUIRED, status=status.HTTP_400_BAD_REQUEST)
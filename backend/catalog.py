@@ -0,0 +1,76 @@
+"""
+Версии каталога и условные GET-запросы.
+
+Импорт прайса и смена статуса магазина увеличивают счётчики catalog_version
+у магазина и его категорий. Из этих счётчиков строятся ETag и Last-Modified
+для списков каталога, так что повторный запрос с If-None-Match получает 304
+без выборки списка и сериализации.
+"""
+import hashlib
+
+from django.db.models import Count, Sum, Max, F
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from backend.models import Shop, Category
+
+
+def bump_catalog_version(shop_ids=(), category_ids=()):
+    """Увеличивает версию каталога у магазинов и категорий."""
+    now = timezone.now()
+    for model, ids in ((Shop, shop_ids), (Category, category_ids)):
+        ids = list(ids)
+        if ids:
+            model.objects.filter(id__in=ids).update(catalog_version=F('catalog_version') + 1,
+                                                    catalog_updated_at=now)
+
+
+def bump_shop_catalog(shop_id):
+    """Увеличивает версию каталога магазина и всех его категорий."""
+    bump_catalog_version([shop_id], Category.objects.filter(shops=shop_id).values_list('id', flat=True))
+
+
+def catalog_state(queryset):
+    """Число объектов, сумма их версий и время последнего изменения — одним запросом."""
+    return queryset.aggregate(count=Count('id'), version=Sum('catalog_version'), updated=Max('catalog_updated_at'))
+
+
+def request_catalog_state(request, queryset_func):
+    """Агрегат версий (считается один раз на запрос для ETag и Last-Modified)."""
+    state = getattr(request, '_catalog_state', None)
+    if state is None:
+        state = catalog_state(queryset_func(request))
+        request._catalog_state = state
+    return state
+
+
+def catalog_condition(queryset_func, name=''):
+    """
+    Декоратор метода get/list (или класса с name=...): ETag и Last-Modified
+    по версиям объектов из queryset_func(request).
+
+    В ETag входят строка запроса (страница, фильтры, fields) и заголовок Accept,
+    поэтому разные представления одного списка не смешиваются.
+    """
+
+    def etag_func(request, *args, **kwargs):
+        state = request_catalog_state(request, queryset_func)
+        key = '|'.join(str(value) for value in (
+            request.path, request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', ''),
+            state['count'], state['version'] or 0))
+        return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        return request_catalog_state(request, queryset_func)['updated']
+
+    return method_decorator(condition(etag_func=etag_func, last_modified_func=last_modified_func), name=name)
+
+
+def product_catalog_shops(request):
+    """Магазины, от которых зависит список товаров с учётом фильтра shop_id."""
+    shops = Shop.objects.all()
+    shop_id = request.query_params.get('shop_id')
+    if shop_id and shop_id.isdigit():
+        shops = shops.filter(id=shop_id)
+    return shops
@@ -0,0 +1,123 @@
+"""
+Индекс категорий для CategoryView: число товаров с предложениями в каждой
+категории и число предложений каждого магазина в ней.
+
+Индекс хранится в памяти процесса и в кэше Django вместе с версией —
+агрегатом catalog_version категорий, который CategoryView и так считает для
+ETag, поэтому проверка актуальности не стоит отдельного запроса. Любое
+изменение каталога меняет версию, и следующий запрос перестраивает индекс.
+
+Импорт прайса после коммита обновляет индекс инкрементально: пересчитываются
+только категории импортированного магазина, если индекс в кэше построен для
+версии, с которой импорт начался, а текущая версия отличается от неё только
+изменениями самого импорта. Иначе (параллельный импорт, смена статуса
+магазина) индекс сбрасывается и строится заново при чтении: два импорта с
+одной начальной версией не запишут каждый свою заплатку под общей версией.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+
+from backend.catalog import catalog_state
+from backend.models import Category, ProductInfo
+
+CACHE_KEY = 'category-index'
+
+# индекс последней прочитанной версии в памяти процесса
+_memory = {}
+
+
+def index_version(state=None):
+    """Версия индекса из агрегата catalog_state категорий (без state — одним запросом)."""
+    state = state or catalog_state(Category.objects.all())
+    return state['count'], state['version'] or 0, state['updated']
+
+
+def _offers():
+    # предложения, которые видит покупатель в списке товаров
+    return ProductInfo.objects.filter(shop__state=True)
+
+
+def _product_counts(offers):
+    return dict(offers.values_list('product__category_id').annotate(count=Count('product_id', distinct=True))
+                .order_by())
+
+
+def _shop_counts(offers):
+    counts = {}
+    for category_id, shop_id, count in offers.values_list('product__category_id', 'shop_id') \
+            .annotate(count=Count('id')).order_by():
+        counts.setdefault(category_id, {})[shop_id] = count
+    return counts
+
+
+def _store(version, entries):
+    rows = [{**entry, 'shops': [{'id': shop_id, 'product_count': count}
+                                for shop_id, count in sorted(entry['shops'].items())]}
+            # порядок Category.Meta.ordering
+            for entry in sorted(entries.values(), key=lambda entry: entry['name'], reverse=True)]
+    index = {'version': version, 'entries': entries, 'rows': rows}
+    cache.set(CACHE_KEY, index, None)
+    _memory['index'] = index
+    return index
+
+
+def build_index(version):
+    """Полная сборка индекса: категории, число товаров и предложения магазинов — три запроса."""
+    entries = {category_id: {'id': category_id, 'name': name, 'product_count': 0, 'shops': {}}
+               for category_id, name in Category.objects.values_list('id', 'name')}
+    for category_id, count in _product_counts(_offers()).items():
+        if category_id in entries:
+            entries[category_id]['product_count'] = count
+    for category_id, shops in _shop_counts(_offers()).items():
+        if category_id in entries:
+            entries[category_id]['shops'] = shops
+    return _store(version, entries)
+
+
+def category_index(state=None):
+    """Индекс для версии state: из памяти процесса, из кэша или собранный заново."""
+    version = index_version(state)
+    index = _memory.get('index')
+    if index is None or index['version'] != version:
+        index = cache.get(CACHE_KEY)
+        if index is None or index['version'] != version:
+            index = build_index(version)
+        _memory['index'] = index
+    return index
+
+
+def update_shop_index(shop_id, base, expected, names, category_ids):
+    """
+    Обновляет индекс после импорта магазина shop_id, начатого при версии base.
+
+    expected — версия сразу после изменений импорта внутри его транзакции,
+    names — названия категорий из прайса, category_ids — категории магазина до и
+    после импорта. Пересчитываются только они: версия и два запроса по их предложениям.
+    """
+    index = cache.get(CACHE_KEY)
+    if index is None or index['version'] != base:
+        cache.delete(CACHE_KEY)
+        return
+    version = index_version()
+    if version != expected:
+        # после начала импорта каталог менял кто-то ещё
+        clear()
+        return
+    offers = _offers().filter(product__category_id__in=category_ids)
+    product_counts = _product_counts(offers)
+    shop_counts = _shop_counts(offers.filter(shop_id=shop_id))
+    entries = index['entries']
+    for category_id in category_ids:
+        entry = entries.setdefault(category_id, {'id': category_id, 'name': names.get(category_id), 'shops': {}})
+        entry['name'] = names.get(category_id, entry['name'])
+        entry['product_count'] = product_counts.get(category_id, 0)
+        entry['shops'] = {key: count for key, count in entry['shops'].items() if key != shop_id}
+        if category_id in shop_counts:
+            entry['shops'][shop_id] = shop_counts[category_id][shop_id]
+    _store(version, entries)
+
+
+def clear():
+    """Сбрасывает индекс в памяти процесса и в кэше."""
+    _memory.clear()
+    cache.delete(CACHE_KEY)
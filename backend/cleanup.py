@@ -0,0 +1,98 @@
+"""
+Сборка мусора: брошенные корзины, просроченные токены, профили без пользователя
+и доставленные события вебхуков.
+
+collect_garbage удаляет строки пачками по GC_BATCH_SIZE: каждая пачка —
+короткая транзакция с DELETE по первичному ключу, поэтому блокировки не
+держатся долго, а за один запуск удаляется не больше GC_MAX_BATCHES пачек
+каждого вида — остальное заберёт следующий запуск. Результат — число
+удалённых строк по видам; он же пишется в лог.
+
+Корзина (Order со state='basket') считается брошенной, если в неё ничего не
+добавляли BASKET_ABANDONED_DAYS дней (dt корзины обновляет BasketView.post),
+пустая корзина — через EMPTY_BASKET_HOURS часов. Доставленные события
+вебхуков хранятся WEBHOOK_EVENT_RETENTION_DAYS дней. На PostgreSQL таблицы, где
+что-то удалено, проходят VACUUM ANALYZE: место в таблице и индексах
+переиспользуется и статистика планировщика обновляется, не дожидаясь autovacuum.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django_rest_passwordreset.models import ResetPasswordToken, get_password_reset_token_expiry_time
+
+from backend.models import Order, OrderItem, ConfirmEmailToken, Profile, User, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+def _batches(queryset):
+    """Списки первичных ключей queryset пачками по GC_BATCH_SIZE, не больше GC_MAX_BATCHES пачек."""
+    for _ in range(settings.GC_MAX_BATCHES):
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:settings.GC_BATCH_SIZE])
+        if not ids:
+            return
+        yield ids
+
+
+def _delete(queryset):
+    deleted = 0
+    for ids in _batches(queryset):
+        # условие повторяется в DELETE: строка могла измениться после выборки
+        deleted += queryset.filter(pk__in=ids).delete()[0]
+    return deleted
+
+
+def _delete_baskets(queryset):
+    baskets = items = 0
+    for ids in _batches(queryset):
+        with transaction.atomic():
+            # корзину могли оформить или пополнить после выборки: удаляем только то,
+            # что под блокировкой всё ещё подходит под условие
+            ids = list(queryset.filter(pk__in=ids).select_for_update(of=('self',)).values_list('pk', flat=True))
+            items += OrderItem.objects.filter(order_id__in=ids).delete()[0]
+            baskets += Order.objects.filter(id__in=ids).delete()[0]
+    return baskets, items
+
+
+def confirm_token_cutoff():
+    """Токены подтверждения почты, созданные раньше, считаются просроченными."""
+    return timezone.now() - datetime.timedelta(hours=settings.CONFIRM_TOKEN_TTL_HOURS)
+
+
+def _vacuum(models):
+    if connection.vendor != 'postgresql' or connection.in_atomic_block:
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'VACUUM (ANALYZE) {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def collect_garbage():
+    """Удаляет брошенные корзины, просроченные токены, осиротевшие профили и старые события вебхуков,
+    возвращает отчёт."""
+    now = timezone.now()
+    baskets = Order.objects.filter(state='basket')
+    empty, empty_items = _delete_baskets(baskets.filter(
+        dt__lt=now - datetime.timedelta(hours=settings.EMPTY_BASKET_HOURS), ordered_items__isnull=True))
+    abandoned, abandoned_items = _delete_baskets(baskets.filter(
+        dt__lt=now - datetime.timedelta(days=settings.BASKET_ABANDONED_DAYS)))
+    report = {
+        'baskets': empty + abandoned,
+        'basket_items': empty_items + abandoned_items,
+        'confirm_tokens': _delete(ConfirmEmailToken.objects.filter(created_at__lt=confirm_token_cutoff())),
+        'reset_tokens': _delete(ResetPasswordToken.objects.filter(
+            created_at__lt=now - datetime.timedelta(hours=get_password_reset_token_expiry_time()))),
+        # профили, чей пользователь удалён в обход каскада (сырым SQL или без внешних ключей)
+        'profiles': _delete(Profile.objects.exclude(user_id__in=User.objects.values('id'))),
+        # недоставленные события не трогаем: их доставка ещё повторяется
+        'webhook_events': _delete(WebhookEvent.objects.filter(
+            delivered_at__lt=now - datetime.timedelta(days=settings.WEBHOOK_EVENT_RETENTION_DAYS))),
+    }
+    tables = ((Order, 'baskets'), (OrderItem, 'basket_items'), (ConfirmEmailToken, 'confirm_tokens'),
+              (ResetPasswordToken, 'reset_tokens'), (Profile, 'profiles'), (WebhookEvent, 'webhook_events'))
+    _vacuum([model for model, name in tables if report[name]])
+    logger.info('Сборка мусора: удалено %s строк', sum(report.values()), extra={'reclaimed': report})
+    return report
@@ -0,0 +1,142 @@
+"""
+Потоковая выгрузка заказов и каталога поставщика в CSV и NDJSON.
+
+Строки читаются из базы порциями (QuerySet.iterator(chunk_size=EXPORT_CHUNK_SIZE),
+на PostgreSQL — серверным курсором) и сразу отдаются через
+StreamingHttpResponse, поэтому память не растёт с размером магазина,
+а заголовок CSV уходит клиенту до первого запроса к базе.
+
+cachalot кладёт в кэш результат запроса целиком, для выгрузки он
+отключается. Под ASGI ответ отдаётся асинхронным итератором, который
+забирает порции через sync_to_async(next): штатный StreamingHttpResponse
+собрал бы синхронный генератор в список целиком. База (реплика или default) выбирается в view, пока
+действует маршрутизация запроса, и фиксируется для всего потока.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from cachalot.api import cachalot_disabled
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.http import StreamingHttpResponse
+
+from backend.models import OrderItem, ProductInfo, ProductParameter
+from backend.renderers import dumps
+
+ORDER_COLUMNS = ('order_id', 'dt', 'state', 'email', 'phone', 'city', 'street', 'house', 'apartment',
+                 'product_info_id', 'external_id', 'product', 'quantity', 'price', 'sum')
+CATALOG_COLUMNS = ('id', 'external_id', 'model', 'product', 'category', 'price', 'price_rrc', 'quantity',
+                   'parameters')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def order_rows(user_id, using, state=None, since=None):
+    """Позиции заказов магазина пользователя user_id — по строке на позицию, без корзин."""
+    items = OrderItem.objects.using(using).filter(order__shop__user_id=user_id) \
+        .exclude(order__state='basket').order_by('order_id', 'id')
+    if state:
+        items = items.filter(order__state=state)
+    if since:
+        items = items.filter(order__dt__gte=since)
+    rows = items.values_list(
+        'order_id', 'order__dt', 'order__state', 'order__user__email', 'order__contact__phone',
+        'order__contact__city', 'order__contact__street', 'order__contact__house', 'order__contact__apartment',
+        'product_info_id', 'product_info__external_id', 'product_info__product__name', 'quantity',
+        'product_info__price')
+    for row in rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield {**dict(zip(ORDER_COLUMNS, row)), 'dt': row[1].isoformat(), 'sum': row[12] * row[13]}
+
+
+def catalog_rows(shop_id, using):
+    """Предложения магазина с параметрами; параметры догружаются одним запросом на порцию."""
+    infos = ProductInfo.objects.using(using).filter(shop_id=shop_id).order_by('id').values_list(
+        'id', 'external_id', 'model', 'product__name', 'product__category__name', 'price', 'price_rrc',
+        'quantity').iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    while chunk := list(islice(infos, settings.EXPORT_CHUNK_SIZE)):
+        parameters = {}
+        for info_id, name, value in ProductParameter.objects.using(using) \
+                .filter(product_info_id__in=[row[0] for row in chunk]) \
+                .values_list('product_info_id', F('parameter__name'), 'value'):
+            parameters.setdefault(info_id, {})[name] = value
+        for row in chunk:
+            yield {**dict(zip(CATALOG_COLUMNS, row)), 'parameters': parameters.get(row[0], {})}
+
+
+def _csv_value(value):
+    if isinstance(value, dict):
+        return '; '.join(f'{name}={item}' for name, item in value.items())
+    return value
+
+
+def encode_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    while batch := list(islice(rows, 500)):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(row[column]) for column in columns] for row in batch)
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(rows):
+    encode = dumps or (lambda row: json.dumps(row, ensure_ascii=False).encode())
+    while batch := list(islice(rows, 500)):
+        yield b''.join(encode(row) + b'\n' for row in batch)
+
+
+def _without_cachalot(chunks):
+    # cachalot_disabled возвращает прежнее значение только при выходе без исключения,
+    # поэтому обрыв соединения (GeneratorExit) и ошибки пробрасываются уже после него
+    error = None
+    with cachalot_disabled():
+        try:
+            yield from chunks
+        except GeneratorExit:
+            pass
+        except Exception as exc:  # noqa: BLE001
+            error = exc
+    if error is not None:
+        raise error
+
+
+class ExportResponse(StreamingHttpResponse):
+    """Потоковый ответ, который и под WSGI, и под ASGI отдаёт chunks порциями."""
+
+    def __init__(self, chunks, *args, **kwargs):
+        self._chunks = chunks
+        super().__init__(_without_cachalot(chunks), *args, **kwargs)
+
+    async def __aiter__(self):
+        # next выполняется в потоке запроса (thread_sensitive), где открыт курсор выгрузки;
+        # cachalot хранит флаг в asgiref.Local, и он доходит до этого потока
+        pull = sync_to_async(next, thread_sensitive=True)
+        error = None
+        with cachalot_disabled():
+            try:
+                while (chunk := await pull(self._chunks, None)) is not None:
+                    yield chunk
+            except BaseException as exc:  # noqa: BLE001
+                error = exc
+        if error is not None:
+            # обрыв соединения или отмена: закрываем генератор и курсор в том же потоке
+            await sync_to_async(self._chunks.close, thread_sensitive=True)()
+            raise error
+
+
+def streaming_export(export_format, columns, rows, filename):
+    """ExportResponse с rows в формате export_format ('csv' или 'ndjson')."""
+    chunks = encode_csv(columns, rows) if export_format == 'csv' else encode_ndjson(rows)
+    response = ExportResponse(chunks, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    # не даём прокси (nginx) буферизовать ответ целиком
+    response['X-Accel-Buffering'] = 'no'
+    return response
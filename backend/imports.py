@@ -0,0 +1,179 @@
+"""
+Импорт прайса поставщика.
+
+Общая логика для синхронного и асинхронного PartnerUpdate: разбор YAML
+и загрузка товаров магазина в каталог. update_stock — быстрое обновление
+только цен и остатков (PartnerStock). Оба пересчитывают сводки предложений
+затронутых товаров (backend.offers) и дописывают изменившиеся цены и остатки
+в историю (backend.price_history).
+"""
+from cachalot.api import invalidate
+from django.db import connection, transaction
+from yaml import load as load_yaml, Loader
+
+from backend.catalog import bump_catalog_version, bump_shop_catalog
+from backend.category_index import index_version, update_shop_index
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.offers import refresh_offers
+from backend.price_history import record_prices
+
+
+def parse_price_list(stream):
+    """Разбирает YAML-прайс (bytes или str) в словарь."""
+    return load_yaml(stream, Loader=Loader)
+
+
+def _product_ids(goods):
+    """Словарь (название, категория) -> id товара; недостающие товары создаются одним запросом."""
+    ids = {}
+    for product_id, name, category_id in Product.objects.filter(
+            category_id__in={item['category'] for item in goods}).values_list('id', 'name', 'category_id'):
+        ids.setdefault((name, category_id), product_id)
+    missing = {(item['name'], item['category']): None for item in goods if (item['name'], item['category']) not in ids}
+    # bulk_create не вызывает Product.save(), у импортированных товаров ещё нет изображений
+    for product in Product.objects.bulk_create([Product(name=name, category_id=category_id)
+                                                for name, category_id in missing]):
+        ids[(product.name, product.category_id)] = product.id
+    return ids
+
+
+def _link_categories(shop_id, names):
+    """
+    Создаёт недостающие категории прайса и связывает с ними магазин.
+
+    Меняются только отличающиеся строки: новые категории, переименованные и
+    связи магазина, которых не было или которых больше нет в прайсе.
+    Возвращает категории, связанные с магазином до импорта.
+    """
+    existing = dict(Category.objects.filter(id__in=names).values_list('id', 'name'))
+    Category.objects.bulk_create([Category(id=category_id, name=name) for category_id, name in names.items()
+                                  if category_id not in existing])
+    renamed = [Category(id=category_id, name=name) for category_id, name in names.items()
+               if category_id in existing and existing[category_id] != name]
+    if renamed:
+        Category.objects.bulk_update(renamed, ['name'])
+
+    links = Category.shops.through.objects
+    linked = set(links.filter(shop_id=shop_id).values_list('category_id', flat=True))
+    links.bulk_create([Category.shops.through(category_id=category_id, shop_id=shop_id)
+                       for category_id in names.keys() - linked])
+    if linked - names.keys():
+        links.filter(shop_id=shop_id, category_id__in=linked - names.keys()).delete()
+    return linked
+
+
+def parameter_ids(names):
+    """Словарь название -> id параметра; недостающие параметры создаются одним запросом."""
+    ids = {}
+    for parameter_id, name in Parameter.objects.filter(name__in=names).values_list('id', 'name'):
+        ids.setdefault(name, parameter_id)
+    for parameter in Parameter.objects.bulk_create([Parameter(name=name) for name in names if name not in ids]):
+        ids[parameter.name] = parameter.id
+    return ids
+
+
+@transaction.atomic
+def import_price_list(user_id, data):
+    """
+    Заменяет каталог магазина пользователя user_id данными прайса, возвращает магазин.
+
+    Товары, параметры и позиции магазина создаются пакетно, поэтому число
+    запросов не зависит от размера прайса (кроме разбиения bulk_create на пачки).
+    После коммита индекс категорий обновляется только по категориям магазина.
+    """
+    base = index_version()
+    shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
+    names = {category['id']: category['name'] for category in data['categories']}
+    category_ids = _link_categories(shop.id, names) | names.keys()
+    previous = {external_id: (product_id, tuple(values)) for external_id, product_id, *values in ProductInfo.objects
+                .filter(shop_id=shop.id).values_list('external_id', 'product_id', *STOCK_FIELDS)}
+    ProductInfo.objects.filter(shop_id=shop.id).delete()
+
+    goods = data['goods']
+    products = _product_ids(goods)
+    parameters = parameter_ids({name for item in goods for name in item['parameters']})
+    product_infos = ProductInfo.objects.bulk_create([
+        ProductInfo(product_id=products[(item['name'], item['category'])],
+                    external_id=item['id'],
+                    model=item['model'],
+                    price=item['price'],
+                    price_rrc=item['price_rrc'],
+                    quantity=item['quantity'],
+                    shop_id=shop.id)
+        for item in goods])
+    ProductParameter.objects.bulk_create([
+        ProductParameter(product_info_id=product_info.id, parameter_id=parameters[name], value=value)
+        for product_info, item in zip(product_infos, goods)
+        for name, value in item['parameters'].items()])
+
+    # товары, которые магазин перестаёт продавать, тоже теряют предложение в сводке
+    refresh_offers({product_id for product_id, _ in previous.values()} | {info.product_id for info in product_infos})
+    prices = {item['id']: (item['price'], item['price_rrc'], item['quantity']) for item in goods}
+    # снятая с продажи позиция попадает в историю с нулевым остатком
+    prices.update({external_id: (price, price_rrc, 0) for external_id, (_, (price, price_rrc, quantity))
+                   in previous.items() if external_id not in prices and quantity})
+    record_prices(shop.id, {external_id: values for external_id, values in prices.items()
+                            if previous.get(external_id, (None, None))[1] != values})
+    # категории, из которых магазин ушёл, тоже изменились
+    bump_catalog_version([shop.id], category_ids)
+    expected = index_version()
+    transaction.on_commit(lambda: update_shop_index(shop.id, base, expected, names, category_ids))
+    return shop
+
+
+STOCK_FIELDS = ('price', 'price_rrc', 'quantity')
+
+
+def _stock_update_sql(rows):
+    """UPDATE ... FROM (VALUES ...) на rows строк; столбцы VALUES в SQLite и PostgreSQL — column1..column4."""
+    table = connection.ops.quote_name(ProductInfo._meta.db_table)
+    assignments = ', '.join(f'{field} = v.column{index}' for index, field in enumerate(STOCK_FIELDS, 2))
+    changed = ' OR '.join(f'{table}.{field} <> v.column{index}' for index, field in enumerate(STOCK_FIELDS, 2))
+    return (f'UPDATE {table} SET {assignments} '
+            f'FROM (VALUES {", ".join(["(%s, %s, %s, %s)"] * rows)}) AS v '
+            f'WHERE {table}.shop_id = %s AND {table}.external_id = v.column1 AND ({changed})')
+
+
+def _affects_offers(current, new):
+    """Меняет ли строка (price, price_rrc, quantity) сводку предложений: наличие или цену в наличии."""
+    (price, _, quantity), (new_price, _, new_quantity) = current, new
+    return (quantity > 0) != (new_quantity > 0) or (new_quantity > 0 and new_price != price)
+
+
+@transaction.atomic
+def update_stock(shop_id, items, batch_size=1000):
+    """
+    Обновляет цены и остатки позиций магазина по списку (external_id, price, price_rrc, quantity).
+
+    bulk_update строит CASE на каждую строку и на 10 000 позиций работает секунды,
+    поэтому пачка позиций обновляется одним UPDATE с соединением по индексу
+    (shop, external_id); строки с прежними значениями не перезаписываются.
+    Сводки предложений пересчитываются только для товаров, у которых
+    поменялось наличие или цена в наличии.
+    Возвращает число изменённых позиций и список неизвестных external_id.
+    """
+    rows = list({external_id: (external_id, *values) for external_id, *values in items}.values())
+    updated, unknown, changed_products, prices = 0, [], set(), {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            current = {external_id: (product_id, tuple(values)) for external_id, product_id, *values in ProductInfo
+                       .objects.filter(shop_id=shop_id, external_id__in=[row[0] for row in batch])
+                       .values_list('external_id', 'product_id', *STOCK_FIELDS)}
+            unknown.extend(row[0] for row in batch if row[0] not in current)
+            changed = [row for row in batch if row[0] in current and current[row[0]][1] != row[1:]]
+            if not changed:
+                continue
+            cursor.execute(_stock_update_sql(len(changed)), [value for row in changed for value in row] + [shop_id])
+            updated += cursor.rowcount
+            # рекомендуемая цена и остаток без перехода через ноль сводку не меняют
+            changed_products.update(current[row[0]][0] for row in changed
+                                    if _affects_offers(current[row[0]][1], row[1:]))
+            prices.update((row[0], row[1:]) for row in changed)
+    if updated:
+        # сырой UPDATE cachalot не разбирает, кэш позиций сбрасываем сами
+        invalidate(ProductInfo)
+        refresh_offers(changed_products)
+        record_prices(shop_id, prices)
+        bump_shop_catalog(shop_id)
+    return updated, unknown
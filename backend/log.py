@@ -0,0 +1,179 @@
+"""
+Неблокирующее логирование.
+
+configure_logging (LOGGING_CONFIG) применяет LOGGING через dictConfig, а затем
+переносит обработчики каждого логгера в фоновый QueueListener: в потоке
+запроса запись только кладётся в ограниченную очередь, форматирование,
+вывод и отправка в Rollbar выполняются в отдельном потоке. Если очередь
+переполнена, запись отбрасывается, а не задерживает запрос.
+
+BatchingRollbarHandler копит ошибки и отправляет их пачками из своего
+потока; одинаковые ошибки внутри пачки уходят один раз с числом повторов.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import logging.handlers
+import queue
+import threading
+from datetime import datetime, timezone
+
+import rollbar
+from rollbar.logger import RollbarHandler
+
+# стандартные атрибуты LogRecord, всё остальное — extra
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listeners = []
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, сообщение, extra и трассировка."""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key in RECORD_ATTRIBUTES or key.startswith('_'):
+                continue
+            if key == 'request':
+                data['method'], data['path'] = getattr(value, 'method', None), getattr(value, 'path', None)
+            else:
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не блокирует и не пишет ошибок при переполнении очереди."""
+
+    def __init__(self, queue_):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # сообщение подставляется сразу (аргументы могут измениться после возврата),
+        # exc_info сохраняется: по нему Rollbar строит трассировку
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingRollbarHandler(RollbarHandler):
+    """Отправляет записи в Rollbar из фонового потока раз в flush_interval секунд или по batch_size записей."""
+
+    def __init__(self, batch_size=20, flush_interval=2.0, max_buffer=1000, **kwargs):
+        super().__init__(history_size=0, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def emit(self, record):
+        if record.levelno < self.notify_level or record.name == rollbar.__log_name__ \
+                or not rollbar.SETTINGS.get('access_token'):
+            return
+        with self._buffer_lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.batch_size
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='rollbar-batch', daemon=True)
+                self._worker.start()
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+        groups = {}
+        for record in batch:
+            key = (record.name, record.levelno, str(record.msg), record.exc_info[0] if record.exc_info else None)
+            groups.setdefault(key, []).append(record)
+        for records in groups.values():
+            record = records[0]
+            if len(records) > 1:
+                record.extra_data = {**getattr(record, 'extra_data', {}), 'occurrences': len(records)}
+            super().emit(record)
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def start_listener(handlers, queue_size):
+    """Запускает фоновый поток для handlers и возвращает обработчик-очередь для логгеров."""
+    queue_ = queue.Queue(queue_size)
+    listener = logging.handlers.QueueListener(queue_, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return BackgroundQueueHandler(queue_)
+
+
+def stop_listeners():
+    """Дописывает очереди и останавливает фоновые потоки (вызывается при выходе)."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def configure_logging(config):
+    """
+    LOGGING_CONFIG: dictConfig(config), затем обработчики логгеров уходят за очереди.
+
+    Логгеры с одинаковым набором обработчиков делят одну очередь и один поток.
+    Ключ queue_size в LOGGING (по умолчанию 10000) задаёт размер очереди,
+    0 отключает очереди совсем.
+    """
+    from django.conf import settings
+
+    config = dict(config)
+    queue_size = config.pop('queue_size', 10000)
+    stop_listeners()
+    logging.config.dictConfig(config)
+
+    rollbar_settings = getattr(settings, 'ROLLBAR', {})
+    if rollbar_settings.get('access_token'):
+        rollbar.init(**rollbar_settings)
+
+    if not queue_size:
+        return
+    queue_handlers = {}
+    loggers = [logging.getLogger(name) for name in config.get('loggers', {})] + [logging.getLogger()]
+    for logger in loggers:
+        if not logger.handlers or any(isinstance(handler, BackgroundQueueHandler) for handler in logger.handlers):
+            continue
+        key = tuple(logger.handlers)
+        if key not in queue_handlers:
+            queue_handlers[key] = start_listener(key, queue_size)
+        logger.handlers = [queue_handlers[key]]
+
+
+atexit.register(stop_listeners)
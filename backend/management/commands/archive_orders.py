@@ -0,0 +1,23 @@
+"""
+Перенос завершённых заказов в архив (backend.archive).
+
+    python manage.py archive_orders [--days 180] [--batch-size 1000]
+
+То же делает задача do_archive; команда удобна для первого переноса
+накопленной истории и для запуска из cron.
+"""
+from django.core.management.base import BaseCommand
+
+from backend.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Переносит доставленные и отменённые заказы старше --days дней в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='возраст заказа в днях, по умолчанию ORDER_ARCHIVE_DAYS')
+        parser.add_argument('--batch-size', type=int, help='заказов в транзакции, по умолчанию ORDER_ARCHIVE_BATCH_SIZE')
+
+    def handle(self, *args, **options):
+        archived = archive_orders(options['days'], options['batch_size'])
+        self.stdout.write(f'перенесено в архив: {archived}')
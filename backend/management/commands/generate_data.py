@@ -0,0 +1,249 @@
+"""
+Синтетические данные для нагрузочного тестирования.
+
+    python manage.py generate_data --shops 50 --products 200000 --offers 100000 --users 50000 --orders 300000
+    python manage.py generate_data --feed shop.yaml --feed-size 100000
+
+Первая форма наполняет базу магазинами, категориями, товарами с параметрами,
+покупателями и заказами (bulk_create пачками по --batch-size). Вторая пишет
+прайс поставщика в формате PartnerUpdate (YAML или JSON по расширению файла)
+и базу не трогает. Одинаковый --seed даёт одинаковые данные.
+
+Первая форма запускается один раз на базу: аккаунты магазинов и покупателей
+получают фиксированные адреса shopN@example.com и buyerN@example.com, поэтому
+при найденных аккаунтах прошлого запуска команда останавливается с ошибкой.
+Параметры товаров с теми же названиями, например из импортированных прайсов,
+используются повторно.
+"""
+import json
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from backend.imports import parameter_ids
+from backend.models import User, Shop, Category, Product, ProductInfo, ProductParameter, Contact, Order, OrderItem
+from backend.offers import refresh_offers
+
+CATEGORIES = (
+    'Смартфоны', 'Ноутбуки', 'Планшеты', 'Телевизоры', 'Наушники', 'Умные часы', 'Фотоаппараты',
+    'Мониторы', 'Принтеры', 'Роутеры', 'Игровые приставки', 'Колонки',
+)
+
+BRANDS = ('Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Lenovo', 'Asus', 'Acer', 'Sony', 'LG', 'Philips', 'HP', 'Dell')
+
+# значения идут по убыванию популярности
+PARAMETERS = {
+    'Цвет': ('черный', 'белый', 'серый', 'синий', 'золотистый', 'красный', 'зеленый'),
+    'Встроенная память (Гб)': ('128', '256', '64', '512', '32', '1024'),
+    'Оперативная память (Гб)': ('8', '4', '16', '6', '12', '32'),
+    'Диагональ (дюйм)': ('6.1', '6.5', '15.6', '13.3', '10.9', '55', '43', '27'),
+    'Разрешение (пикс)': ('1920x1080', '2532x1170', '2560x1440', '3840x2160', '1280x720'),
+    'Вес (г)': tuple(str(weight) for weight in range(150, 2500, 50)),
+    'Гарантия (мес)': ('12', '24', '6', '36'),
+    'Беспроводная связь': ('Wi-Fi, Bluetooth', 'Bluetooth', 'Wi-Fi', 'Wi-Fi, Bluetooth, NFC'),
+    'Страна производства': ('Китай', 'Вьетнам', 'Корея', 'Тайвань', 'Индия'),
+}
+
+ORDER_STATES = ('new', 'confirmed', 'assembled', 'sent', 'delivered', 'canceled')
+ORDER_STATE_WEIGHTS = (10, 5, 5, 10, 60, 10)
+
+CITIES = ('Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Самара')
+STREETS = ('Ленина', 'Тверская', 'Мира', 'Садовая', 'Гагарина', 'Баумана')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def skewed_choice(rnd, values):
+    """Значение с убывающей вероятностью 1/(i+1): первые встречаются чаще."""
+    return rnd.choices(values, weights=[1 / (index + 1) for index in range(len(values))])[0]
+
+
+class Catalog:
+    """Генератор товаров и их параметров для базы и для прайсов."""
+
+    def __init__(self, rnd, categories):
+        self.rnd = rnd
+        self.categories = CATEGORIES[:categories] if categories <= len(CATEGORIES) else \
+            CATEGORIES + tuple(f'Категория {index}' for index in range(len(CATEGORIES), categories))
+        names = list(PARAMETERS)
+        # у каждой категории свой набор параметров
+        self.category_parameters = [rnd.sample(names, rnd.randint(3, 6)) for _ in self.categories]
+
+    def product(self, index):
+        """Пара (индекс категории, название товара)."""
+        category = self.rnd.randrange(len(self.categories))
+        brand = skewed_choice(self.rnd, BRANDS)
+        return category, f'{self.categories[category]} {brand} {self.rnd.choice("ABCXZ")}{index}'[:80]
+
+    def offer(self, category):
+        """Цена, РРЦ, количество и параметры предложения товара категории category."""
+        price = int(self.rnd.lognormvariate(9.5, 0.8)) + 100
+        parameters = {name: skewed_choice(self.rnd, PARAMETERS[name])
+                      for name in self.category_parameters[category] if self.rnd.random() < 0.9}
+        return {'price': price, 'price_rrc': price + price * self.rnd.randint(0, 20) // 100,
+                'quantity': self.rnd.randint(0, 50), 'parameters': parameters}
+
+
+class Command(BaseCommand):
+    help = 'Генерирует магазины, товары, покупателей и заказы или прайс поставщика заданного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--shops', type=int, default=10)
+        parser.add_argument('--categories', type=int, default=len(CATEGORIES))
+        parser.add_argument('--products', type=int, default=10000, help='число товаров (Product)')
+        parser.add_argument('--offers', type=int, default=5000, help='предложений (ProductInfo) на магазин')
+        parser.add_argument('--users', type=int, default=1000, help='число покупателей')
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--items', type=int, default=3, help='среднее число позиций в заказе')
+        parser.add_argument('--feed', help='записать прайс поставщика в файл .yaml или .json вместо базы')
+        parser.add_argument('--feed-size', type=int, default=1000, help='число позиций в прайсе')
+        parser.add_argument('--feed-shop', default='Синтетический магазин')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        catalog = Catalog(rnd, options['categories'])
+        if options['feed']:
+            self.write_feed(catalog, options['feed'], options['feed_size'], options['feed_shop'])
+            return
+
+        if options['offers'] > options['products']:
+            raise CommandError('--offers не может быть больше --products')
+        if User.objects.filter(email__regex=r'^(shop|buyer)[0-9]+@example\.com$').exists():
+            raise CommandError('В базе уже есть аккаунты generate_data: команда заполняет базу один раз')
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            categories, shops = self.create_shops(catalog, options['shops'])
+            products = self.create_products(catalog, categories, options['products'])
+            offers = self.create_offers(catalog, shops, products, options['offers'])
+            self.create_orders(rnd, offers, options['users'], options['orders'], options['items'])
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def create_shops(self, catalog, count):
+        categories = Category.objects.bulk_create([Category(name=name[:40]) for name in catalog.categories])
+        owners = User.objects.bulk_create([
+            User(email=f'shop{index}@example.com', username=f'shop{index}', type='shop', is_active=True,
+                 password=make_password(None))
+            for index in range(count)])
+        shops = Shop.objects.bulk_create([Shop(name=f'Магазин {index}', user=owner)
+                                          for index, owner in enumerate(owners)])
+        Category.shops.through.objects.bulk_create([
+            Category.shops.through(category_id=category.id, shop_id=shop.id)
+            for category in categories for shop in shops])
+        self.log(f'магазинов: {len(shops)}, категорий: {len(categories)}')
+        return categories, shops
+
+    def create_products(self, catalog, categories, count):
+        """Создаёт товары, возвращает список пар (id, индекс категории)."""
+        products = []
+        for batch in batched((catalog.product(index) for index in range(count)), self.batch_size):
+            created = Product.objects.bulk_create([Product(name=name, category_id=categories[category].id)
+                                                   for category, name in batch])
+            products.extend((product.id, category) for product, (category, _) in zip(created, batch))
+        self.log(f'товаров: {len(products)}')
+        return products
+
+    def create_offers(self, catalog, shops, products, count):
+        """Создаёт предложения магазинов с параметрами, возвращает {id магазина: [(id предложения, цена)]}."""
+        parameters = parameter_ids(list(PARAMETERS))
+        offers_by_shop = {}
+        parameter_count = 0
+        for shop in shops:
+            sample = catalog.rnd.sample(products, count)
+            for batch in batched(sample, self.batch_size):
+                offers = [catalog.offer(category) for _, category in batch]
+                created = ProductInfo.objects.bulk_create([
+                    ProductInfo(product_id=product_id, shop_id=shop.id, external_id=product_id,
+                                model=f'model-{product_id}', price=offer['price'], price_rrc=offer['price_rrc'],
+                                quantity=offer['quantity'])
+                    for (product_id, _), offer in zip(batch, offers)])
+                product_parameters = [
+                    ProductParameter(product_info_id=info.id, parameter_id=parameters[name], value=value)
+                    for info, offer in zip(created, offers) for name, value in offer['parameters'].items()]
+                for parameter_batch in batched(product_parameters, self.batch_size):
+                    ProductParameter.objects.bulk_create(parameter_batch)
+                parameter_count += len(product_parameters)
+                offers_by_shop.setdefault(shop.id, []).extend((info.id, info.price) for info in created)
+        refresh_offers(product_id for product_id, _ in products)
+        self.log(f'предложений: {sum(map(len, offers_by_shop.values()))}, параметров: {parameter_count}')
+        return offers_by_shop
+
+    def create_orders(self, rnd, offers, users, orders, items):
+        # хэш пароля считается один раз: PBKDF2 на каждого пользователя занял бы минуты
+        password = make_password('password')
+        buyers = []
+        for batch in batched(range(users), self.batch_size):
+            buyers.extend(User.objects.bulk_create([
+                User(email=f'buyer{index}@example.com', username=f'buyer{index}', is_active=True, password=password)
+                for index in batch]))
+        contacts = []
+        for batch in batched(buyers, self.batch_size):
+            contacts.extend(Contact.objects.bulk_create([
+                Contact(user_id=buyer.id, city=rnd.choice(CITIES), street=rnd.choice(STREETS),
+                        house=str(rnd.randint(1, 150)), phone=f'+7900{rnd.randrange(10 ** 7):07d}')
+                for buyer in batch]))
+        self.log(f'покупателей: {len(buyers)}')
+        if not buyers or not offers:
+            return
+
+        # заказы уже разделены по магазинам, как после оформления корзины (backend.ordering)
+        shop_ids = list(offers)
+        item_count = 0
+        for batch in batched(range(orders), self.batch_size):
+            plans = []
+            for _ in batch:
+                owner, shop_id = rnd.randrange(len(buyers)), rnd.choice(shop_ids)
+                picked = rnd.sample(offers[shop_id], min(len(offers[shop_id]),
+                                                         max(1, round(rnd.expovariate(1 / items)))))
+                plans.append((owner, shop_id, [(offer, price, rnd.randint(1, 3)) for offer, price in picked]))
+            created = Order.objects.bulk_create([
+                Order(user_id=buyers[owner].id, contact_id=contacts[owner].id, shop_id=shop_id,
+                      total=sum(price * quantity for _, price, quantity in lines),
+                      state=rnd.choices(ORDER_STATES, ORDER_STATE_WEIGHTS)[0])
+                for owner, shop_id, lines in plans])
+            order_items = [
+                OrderItem(order_id=order.id, product_info_id=offer, quantity=quantity)
+                for order, (_, _, lines) in zip(created, plans)
+                for offer, _, quantity in lines]
+            OrderItem.objects.bulk_create(order_items, batch_size=self.batch_size)
+            item_count += len(order_items)
+        self.log(f'заказов: {orders}, позиций: {item_count}')
+
+    def write_feed(self, catalog, path, size, shop):
+        """Пишет прайс потоково: каждая позиция — отдельная строка, в YAML — в flow-стиле."""
+        if not path.endswith(('.yaml', '.yml', '.json')):
+            raise CommandError('Файл прайса должен иметь расширение .yaml, .yml или .json')
+        as_json = path.endswith('.json')
+        categories = [{'id': index + 1, 'name': name} for index, name in enumerate(catalog.categories)]
+
+        def goods():
+            for index in range(size):
+                category, name = catalog.product(index)
+                yield {'id': index + 1, 'category': category + 1, 'model': f'model-{index + 1}', 'name': name,
+                       **catalog.offer(category)}
+
+        with open(path, 'w', encoding='utf-8') as file:
+            if as_json:
+                file.write(f'{{"shop": {json.dumps(shop, ensure_ascii=False)}, "categories": '
+                           f'{json.dumps(categories, ensure_ascii=False)}, "goods": [\n')
+                for index, item in enumerate(goods()):
+                    file.write((',\n' if index else '') + json.dumps(item, ensure_ascii=False))
+                file.write('\n]}\n')
+            else:
+                file.write(f'shop: {json.dumps(shop, ensure_ascii=False)}\ncategories:\n')
+                for category in categories:
+                    file.write(f'  - {json.dumps(category, ensure_ascii=False)}\n')
+                file.write('goods:\n')
+                for item in goods():
+                    file.write(f'  - {json.dumps(item, ensure_ascii=False)}\n')
+        self.log(f'прайс {path}: {size} позиций')
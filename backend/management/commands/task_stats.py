@@ -0,0 +1,75 @@
+"""
+Сводка метрик задач Celery (backend.task_metrics).
+
+    python manage.py task_stats [--interval 2] [--once]
+
+Каждые --interval секунд печатает по каждой задаче: сколько выполнено,
+упало и ушло на повтор, скорость за последний интервал, p50/p95 ожидания в
+очереди и времени выполнения (оценка по корзинам гистограмм).
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import task_metrics
+
+HEADER = f'{"задача":<28} {"успех":>7} {"ошибки":>7} {"повторы":>7} {"в сек":>6} ' \
+         f'{"ожид p50":>9} {"ожид p95":>9} {"вып p50":>9} {"вып p95":>9}'
+
+
+def format_seconds(value):
+    if value is None:
+        return '-'
+    return f'{value * 1000:.0f} ms' if value < 1 else f'{value:.1f} s'
+
+
+class Command(BaseCommand):
+    help = 'Печатает обновляемую сводку по задачам Celery: очередь, время выполнения, ошибки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2.0, help='период обновления, секунд')
+        parser.add_argument('--once', action='store_true', help='напечатать один раз и выйти')
+
+    def handle(self, *args, **options):
+        if not settings.TASK_METRICS_ENABLED:
+            raise CommandError('Метрики задач выключены: задайте TASK_METRICS_ENABLED=true')
+        previous, previous_time = None, None
+        try:
+            while True:
+                now = time.monotonic()
+                current = self.collect()
+                if not options['once']:
+                    # очистка экрана, как у top
+                    self.stdout.write('\x1b[2J\x1b[H', ending='')
+                self.stdout.write(HEADER)
+                for task, row in current.items():
+                    done = sum(row[state] for state in task_metrics.STATES)
+                    rate = '-'
+                    if previous and task in previous:
+                        before = sum(previous[task][state] for state in task_metrics.STATES)
+                        rate = f'{(done - before) / (now - previous_time):.1f}'
+                    self.stdout.write(
+                        f'{task[:28]:<28} {row["success"]:>7} {row["failure"]:>7} {row["retry"]:>7} {rate:>6} '
+                        + ' '.join(f'{format_seconds(value):>9}' for value in row['quantiles']))
+                if options['once']:
+                    return
+                previous, previous_time = current, now
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def collect(self):
+        histograms, counters = task_metrics.snapshot()
+        rows = {}
+        for task in task_metrics.task_names():
+            labels = (('task', task),)
+            wait = histograms.get(('celery_task_queue_wait_seconds', labels))
+            runtime = histograms.get(('celery_task_runtime_seconds', labels))
+            rows[task] = {
+                **{state: counters.get(('celery_task_total', (('state', state),) + labels), 0)
+                   for state in task_metrics.STATES},
+                'quantiles': [histogram.quantile(q) if histogram else None
+                              for histogram in (wait, runtime) for q in (0.5, 0.95)],
+            }
+        return rows
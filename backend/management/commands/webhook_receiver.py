@@ -0,0 +1,72 @@
+"""
+Локальный получатель вебхуков для проверки доставки.
+
+    python manage.py webhook_receiver [--port 8001] [--secret <ключ подписки>] [--fail 0.2]
+
+Принимает POST на любой путь, проверяет подпись (если задан --secret) и
+печатает полученные события. --fail задаёт долю ответов 500, чтобы
+посмотреть на повторы с нарастающей паузой.
+"""
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from backend.webhooks import verify
+
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+    """Обработчик: server.secret, server.fail и server.on_batch(events) задаются у сервера."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        if server.secret and not verify(server.secret, self.headers.get('X-Webhook-Timestamp', 0), body,
+                                        self.headers.get('X-Webhook-Signature', '')):
+            self.respond(401)
+            return
+        if server.fail and random.random() < server.fail:
+            self.respond(500)
+            return
+        server.on_batch(json.loads(body)['events'])
+        self.respond(204)
+
+    def respond(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_receiver(port=0, secret=None, fail=0.0, on_batch=print):
+    """HTTP-сервер получателя на 127.0.0.1:port (0 — любой свободный порт)."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), ReceiverHandler)
+    server.secret, server.fail, server.on_batch = secret, fail, on_batch
+    return server
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальный HTTP-сервер, принимающий вебхуки магазина'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--secret', help='ключ подписи из partner/webhooks; без него подпись не проверяется')
+        parser.add_argument('--fail', type=float, default=0.0, help='доля ответов 500')
+
+    def handle(self, *args, **options):
+        def on_batch(events):
+            self.stdout.write(f'пачка из {len(events)} событий')
+            for event in events:
+                self.stdout.write('  ' + json.dumps(event, ensure_ascii=False))
+
+        server = make_receiver(options['port'], options['secret'], options['fail'], on_batch)
+        self.stdout.write(f'http://127.0.0.1:{server.server_port}/ (Ctrl+C — выход)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
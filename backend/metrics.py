@@ -0,0 +1,288 @@
+"""
+Метрики запросов: число и время SQL-запросов, время сериализации и полное
+время обработки по каждому view.
+
+Включаются настройкой REQUEST_METRICS_ENABLED. Выключенный middleware
+удаляется Django при старте (MiddlewareNotUsed), а декоратор timed
+проверяет одну contextvar, так что накладные расходы почти нулевые.
+Каждый ответ получает заголовок Server-Timing, а накопленные гистограммы
+отдаются в текстовом формате Prometheus по адресу /api/v1/metrics — сборщику
+с ключом METRICS_TOKEN или пользователю из персонала.
+"""
+import hmac
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden, Http404
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """Гистограмма в стиле Prometheus: накопительные корзины, сумма и количество."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Потокобезопасное хранилище гистограмм и счётчиков процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS, help_text=''):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1, help_text=''):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._help.setdefault(name, help_text)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Копия данных: {(имя, метки): Histogram} и {(имя, метки): значение}."""
+        with self._lock:
+            histograms = {}
+            for key, histogram in self._histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+                histograms[key] = copy
+            return histograms, dict(self._counters)
+
+    def render_prometheus(self):
+        histograms, counters = self.snapshot()
+        return render_prometheus(histograms, counters, self._help)
+
+
+def render_prometheus(histograms, counters, help_texts):
+    """Текстовый формат Prometheus для {(имя, метки): Histogram} и {(имя, метки): значение}."""
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            if help_texts.get(name):
+                lines.append(f'# HELP {name} {help_texts[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        describe(name, 'histogram')
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    values = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                      for key, value in labels)
+    return '{' + values + '}'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """Счётчики одного запроса."""
+
+    __slots__ = ('queries', 'db_time', 'phases')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.phases = {}
+
+    def add(self, phase, duration):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: считает запросы и время в базе."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+
+
+def current_metrics():
+    """Метрики текущего запроса или None, если сбор выключен."""
+    return _current.get()
+
+
+def timed(phase):
+    """Декоратор: добавляет время выполнения функции к фазе phase текущего запроса."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _current.get()
+            if metrics is None:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.add(phase, perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def execute_wrappers(wrapper):
+    """
+    Подключает wrapper ко всем соединениям текущего потока, отключение — close() у результата.
+
+    Соединения у каждого потока свои, поэтому под ASGI обёртку ставят через
+    sync_to_async: в тот же поток запроса, где выполняются синхронные view и ORM.
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+    return stack
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запроса, пишет Server-Timing и обновляет гистограммы по view."""
+
+    async_capable = sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = perf_counter()
+        try:
+            with execute_wrappers(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = perf_counter()
+        try:
+            stack = await sync_to_async(execute_wrappers)(metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, perf_counter() - start)
+
+    @staticmethod
+    def finish(request, response, metrics, total):
+
+        match = request.resolver_match
+        labels = {'view': match.view_name if match else 'unresolved', 'method': request.method}
+        registry.observe('http_request_duration_seconds', labels, total,
+                         help_text='Полное время обработки запроса')
+        registry.observe('http_request_db_queries', labels, metrics.queries, COUNT_BUCKETS,
+                         help_text='Число SQL-запросов за запрос')
+        registry.observe('http_request_db_duration_seconds', labels, metrics.db_time,
+                         help_text='Время SQL-запросов за запрос')
+        for phase, duration in metrics.phases.items():
+            registry.observe(f'http_request_{phase}_duration_seconds', labels, duration,
+                             help_text=f'Время фазы {phase} за запрос')
+
+        timings = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"']
+        timings.extend(f'{phase};dur={duration * 1000:.1f}' for phase, duration in metrics.phases.items())
+        timings.append(f'total;dur={total * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+
+def _metrics_allowed(request):
+    keyword, _, token = request.headers.get('Authorization', '').partition(' ')
+    if settings.METRICS_TOKEN and keyword == 'Bearer' \
+            and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    """Гистограммы процесса и метрики задач Celery в текстовом формате Prometheus."""
+    if not settings.REQUEST_METRICS_ENABLED and not settings.TASK_METRICS_ENABLED:
+        raise Http404
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    from backend import task_metrics
+
+    body = registry.render_prometheus() if settings.REQUEST_METRICS_ENABLED else ''
+    if settings.TASK_METRICS_ENABLED:
+        body += task_metrics.render()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
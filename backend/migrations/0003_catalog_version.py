@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='catalog_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Каталог обновлен'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия каталога'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Каталог обновлен'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия каталога'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:51
+
+import backend.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_product_info_shop_external'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Webhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Адрес')),
+                ('secret', models.CharField(default=backend.models.generate_webhook_secret, max_length=64, verbose_name='Ключ подписи')),
+                ('events', models.CharField(blank=True, max_length=100, verbose_name='События')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhooks', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Вебхук',
+                'verbose_name_plural': 'Список вебхуков',
+            },
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('order.created', 'Новый заказ'), ('order.state_changed', 'Смена статуса заказа')], max_length=30, verbose_name='Событие')),
+                ('payload', models.JSONField(verbose_name='Данные')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='Доставлено')),
+                ('webhook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_events', to='backend.webhook', verbose_name='Вебхук')),
+            ],
+            options={
+                'verbose_name': 'Событие вебхука',
+                'verbose_name_plural': 'События вебхуков',
+                'indexes': [models.Index(fields=['webhook', 'delivered_at', 'id'], name='webhook_event_pending')],
+            },
+        ),
+    ]
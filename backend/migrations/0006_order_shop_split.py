@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum, F
+
+
+def split_order(Order, OrderItem, order):
+    """Копия backend.ordering.split_order на момент миграции: позиции заказа по заказам магазинов."""
+    totals = dict(OrderItem.objects.filter(order_id=order['id']).values_list('product_info__shop_id')
+                  .annotate(total=Sum(F('quantity') * F('product_info__price'))).order_by())
+    if len(totals) <= 1:
+        shop_id, total = next(iter(totals.items()), (None, None))
+        Order.objects.filter(id=order['id']).update(shop_id=shop_id, total=total)
+        return
+
+    sub_orders = Order.objects.bulk_create([
+        Order(user_id=order['user_id'], contact_id=order['contact_id'], state=order['state'],
+              parent_id=order['id'], shop_id=shop_id, total=total)
+        for shop_id, total in sorted(totals.items())])
+    for sub_order in sub_orders:
+        OrderItem.objects.filter(order_id=order['id'], product_info__shop_id=sub_order.shop_id) \
+            .update(order_id=sub_order.id)
+    Order.objects.filter(id=order['id']).update(total=sum(totals.values()))
+    # заказы магазинов получают дату исходного заказа
+    Order.objects.filter(parent_id=order['id']).update(dt=order['dt'])
+
+
+def split_placed_orders(apps, schema_editor):
+    """Разносит позиции уже оформленных заказов по магазинам, как это делает place_order."""
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    orders = Order.objects.filter(shop__isnull=True, parent__isnull=True).exclude(state='basket').order_by('id')
+    last_id = 0
+    while batch := list(orders.filter(id__gt=last_id).values('id', 'user_id', 'contact_id', 'state', 'dt')[:1000]):
+        last_id = batch[-1]['id']
+        for order in batch:
+            split_order(Order, OrderItem, order)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_webhooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sub_orders', to='backend.order', verbose_name='Общий заказ'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Сумма'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shop', '-dt'], name='order_shop_dt'),
+        ),
+        migrations.RunPython(split_placed_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+
+def fill_product_offers(apps, schema_editor):
+    """Строит сводки предложений для всех товаров, у которых есть предложения (логика refresh_offers)."""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductOffers = apps.get_model('backend', 'ProductOffers')
+    in_stock = Q(quantity__gt=0)
+    product_ids = sorted(ProductInfo.objects.values_list('product_id', flat=True).distinct())
+    now = timezone.now()
+    for start in range(0, len(product_ids), 1000):
+        batch = product_ids[start:start + 1000]
+        totals = {row['product_id']: row for row in ProductInfo.objects
+                  .filter(product_id__in=batch, shop__state=True).values('product_id')
+                  .annotate(offer_count=Count('id'), in_stock_count=Count('id', filter=in_stock),
+                            min_price=Min('price', filter=in_stock)).order_by()}
+        ProductOffers.objects.bulk_create([
+            ProductOffers(product_id=product_id, updated_at=now,
+                          min_price=totals.get(product_id, {}).get('min_price'),
+                          offer_count=totals.get(product_id, {}).get('offer_count', 0),
+                          in_stock_count=totals.get(product_id, {}).get('in_stock_count', 0))
+            for product_id in batch])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_order_shop_split'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductOffers',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='offers_summary', serialize=False, to='backend.product', verbose_name='Продукт')),
+                ('min_price', models.PositiveIntegerField(blank=True, null=True, verbose_name='Минимальная цена')),
+                ('offer_count', models.PositiveIntegerField(default=0, verbose_name='Предложений')),
+                ('in_stock_count', models.PositiveIntegerField(default=0, verbose_name='Предложений в наличии')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Сводка предложений',
+                'verbose_name_plural': 'Сводки предложений',
+                'indexes': [models.Index(fields=['min_price'], name='product_offers_min_price')],
+            },
+        ),
+        migrations.RunPython(fill_product_offers, migrations.RunPython.noop),
+    ]
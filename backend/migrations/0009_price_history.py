@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:19
+
+import struct
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_price_series(apps, schema_editor):
+    """Начинает историю каждой позиции с текущих цены и остатка."""
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    PriceSeries = apps.get_model('backend', 'PriceSeries')
+    now = timezone.now()
+    # формат точки backend.price_history на момент миграции: время, цена, рекомендуемая цена, остаток
+    point = struct.Struct('<qIII')
+    rows = ProductInfo.objects.order_by('shop_id', 'external_id') \
+        .values_list('shop_id', 'external_id', 'price', 'price_rrc', 'quantity').iterator(chunk_size=1000)
+    PriceSeries.objects.bulk_create(
+        (PriceSeries(shop_id=shop_id, external_id=external_id, count=1, updated_at=now,
+                     points=point.pack(int(now.timestamp()), price, price_rrc, quantity))
+         for shop_id, external_id, price, price_rrc, quantity in rows),
+        batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+                ('points', models.BinaryField(verbose_name='Точки')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Число точек')),
+                ('updated_at', models.DateTimeField(verbose_name='Последнее изменение')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_series', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'История цены',
+                'verbose_name_plural': 'История цен',
+                'constraints': [models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_price_series')],
+            },
+        ),
+        migrations.RunPython(fill_price_series, migrations.RunPython.noop),
+    ]
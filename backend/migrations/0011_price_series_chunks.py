@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_archived_order_shop_id'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='priceseries',
+            name='unique_price_series',
+        ),
+        migrations.AddField(
+            model_name='priceseries',
+            name='chunk',
+            field=models.PositiveIntegerField(default=0, verbose_name='Номер куска'),
+        ),
+        migrations.AddConstraint(
+            model_name='priceseries',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id', 'chunk'), name='unique_price_series_chunk'),
+        ),
+    ]
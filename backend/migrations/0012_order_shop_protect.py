@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_price_series_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='shop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='backend.shop', verbose_name='Магазин'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import secrets
+
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
@@ -16,6 +18,14 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+# статусы, в которые поставщик может перевести заказ из текущего
+ORDER_TRANSITIONS = {
+    'new': ('confirmed', 'canceled'),
+    'confirmed': ('assembled', 'canceled'),
+    'assembled': ('sent', 'canceled'),
+    'sent': ('delivered',),
+}
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -111,7 +121,8 @@ class Shop(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='статус получения заказов', default=True)
-
+    catalog_version = models.PositiveIntegerField(verbose_name='Версия каталога', default=0)
+    catalog_updated_at = models.DateTimeField(verbose_name='Каталог обновлен', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -125,6 +136,8 @@ class Shop(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=40, verbose_name='Название')
     shops = models.ManyToManyField(Shop, verbose_name='Магазины', related_name='categories', blank=True)
+    catalog_version = models.PositiveIntegerField(verbose_name='Версия каталога', default=0)
+    catalog_updated_at = models.DateTimeField(verbose_name='Каталог обновлен', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Категория'
@@ -143,9 +156,11 @@ class Product(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        from .tasks import generate_thumbnails
-        # Вызов задачи Celery для создания миниатюр
-        generate_thumbnails.delay(self.image.path, {'small': (100, 100), 'medium': (200, 200)})
+        image = getattr(self, 'image', None)
+        if image:
+            from .tasks import generate_thumbnails
+            # Вызов задачи Celery для создания миниатюр
+            generate_thumbnails.delay(image.path, {'small': (100, 100), 'medium': (200, 200)})
 
     class Meta:
         verbose_name = 'Продукт'
@@ -173,6 +188,54 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
         ]
+        # поиск позиции по external_id внутри магазина (PartnerStock)
+        indexes = [
+            models.Index(fields=['shop', 'external_id'], name='product_info_shop_external'),
+        ]
+
+
+class ProductOffers(models.Model):
+    """Сводка предложений товара в активных магазинах, её пересчитывает backend.offers."""
+    product = models.OneToOneField(Product, verbose_name='Продукт', related_name='offers_summary',
+                                   primary_key=True, on_delete=models.CASCADE)
+    # минимальная цена среди предложений в наличии
+    min_price = models.PositiveIntegerField(verbose_name='Минимальная цена', null=True, blank=True)
+    offer_count = models.PositiveIntegerField(verbose_name='Предложений', default=0)
+    in_stock_count = models.PositiveIntegerField(verbose_name='Предложений в наличии', default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Сводка предложений'
+        verbose_name_plural = 'Сводки предложений'
+        indexes = [
+            models.Index(fields=['min_price'], name='product_offers_min_price'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.min_price} ({self.offer_count})'
+
+
+class PriceSeries(models.Model):
+    """
+    Кусок истории цены и остатка позиции магазина (shop, external_id): точки одинаковой
+    длины дописываются в конец points последнего куска (backend.price_history).
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='price_series', on_delete=models.CASCADE)
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    chunk = models.PositiveIntegerField(verbose_name='Номер куска', default=0)
+    points = models.BinaryField(verbose_name='Точки')
+    count = models.PositiveIntegerField(verbose_name='Число точек', default=0)
+    updated_at = models.DateTimeField(verbose_name='Последнее изменение')
+
+    class Meta:
+        verbose_name = 'История цены'
+        verbose_name_plural = 'История цен'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'external_id', 'chunk'], name='unique_price_series_chunk'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop_id}/{self.external_id}#{self.chunk}: {self.count}'
 
 
 class Parameter(models.Model):
@@ -233,11 +296,24 @@ class Order(models.Model):
     contact = models.ForeignKey(Contact, verbose_name='Контакт',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    # при оформлении корзина становится общим заказом, а позиции расходятся
+    # по заказам магазинов (shop задан только у них)
+    parent = models.ForeignKey('self', verbose_name='Общий заказ', related_name='sub_orders',
+                               blank=True, null=True, on_delete=models.CASCADE)
+    # удаление магазина не должно уносить заказы покупателей
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='orders',
+                             blank=True, null=True, on_delete=models.PROTECT)
+    total = models.PositiveIntegerField(verbose_name='Сумма', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказ"
         ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['shop', '-dt'], name='order_shop_dt'),
+            # отбор завершённых заказов для архива (backend.archive)
+            models.Index(fields=['state', 'dt'], name='order_state_dt'),
+        ]
 
     def __str__(self):
         return str(self.dt)
@@ -260,6 +336,85 @@ class OrderItem(models.Model):
         ]
 
 
+class ArchivedOrder(models.Model):
+    """Завершённый заказ, перенесённый из Order вместе с позициями и контактом (backend.archive)."""
+    # id исходного заказа
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='archived_orders',
+                             on_delete=models.CASCADE)
+    # без внешнего ключа в базе, как parent_id: удаление магазина не стирает магазин из истории
+    # покупателя, а пустой shop_id по-прежнему означает только общий заказ
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='archived_orders',
+                             blank=True, null=True, on_delete=models.DO_NOTHING, db_constraint=False)
+    parent_id = models.BigIntegerField(verbose_name='Общий заказ', blank=True, null=True)
+    state = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
+    dt = models.DateTimeField()
+    total = models.PositiveIntegerField(verbose_name='Сумма', null=True, blank=True)
+    # снимки на момент переноса: позиции и контакт могут быть удалены вместе с каталогом магазина
+    contact = models.JSONField(verbose_name='Контакт', null=True, blank=True)
+    items = models.JSONField(verbose_name='Позиции', default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['user', '-dt'], name='archived_order_user_dt'),
+            models.Index(fields=['shop', '-dt'], name='archived_order_shop_dt'),
+        ]
+
+    def __str__(self):
+        return str(self.dt)
+
+
+WEBHOOK_EVENTS = (
+    ('order.created', 'Новый заказ'),
+    ('order.state_changed', 'Смена статуса заказа'),
+)
+
+
+def generate_webhook_secret():
+    return secrets.token_hex(32)
+
+
+class Webhook(models.Model):
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='webhooks', on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Адрес')
+    secret = models.CharField(verbose_name='Ключ подписи', max_length=64, default=generate_webhook_secret)
+    # события через запятую, пусто — все
+    events = models.CharField(verbose_name='События', max_length=100, blank=True)
+    is_active = models.BooleanField(verbose_name='Активен', default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Вебхук'
+        verbose_name_plural = 'Список вебхуков'
+
+    def subscribed(self, event):
+        return not self.events or event in self.events.split(',')
+
+    def __str__(self):
+        return self.url
+
+
+class WebhookEvent(models.Model):
+    """Событие, ожидающее доставки; пишется в той же транзакции, что и изменение заказа."""
+    webhook = models.ForeignKey(Webhook, verbose_name='Вебхук', related_name='pending_events',
+                                on_delete=models.CASCADE)
+    event = models.CharField(verbose_name='Событие', choices=WEBHOOK_EVENTS, max_length=30)
+    payload = models.JSONField(verbose_name='Данные')
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(verbose_name='Доставлено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Событие вебхука'
+        verbose_name_plural = 'События вебхуков'
+        indexes = [
+            models.Index(fields=['webhook', 'delivered_at', 'id'], name='webhook_event_pending'),
+        ]
+
+
 class ConfirmEmailToken(models.Model):
     class Meta:
         verbose_name = 'Токен подтверждения Email'
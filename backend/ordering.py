@@ -0,0 +1,59 @@
+"""
+Размещение заказа: общая логика синхронного и асинхронного OrderView.
+
+Корзина может содержать позиции разных магазинов. При оформлении позиции
+расходятся по заказам магазинов (Order.shop) с суммой, посчитанной в момент
+разделения, а корзина становится общим заказом (parent) с полной суммой.
+Если магазин один, корзина сама становится заказом магазина. Поставщик видит
+только свои заказы простым отбором по shop_id, покупатель — заказы магазинов.
+"""
+from django.db import transaction
+from django.db.models import Sum, F
+
+from backend.models import Order, OrderItem
+from backend.webhooks import emit_order_events
+
+
+def split_order(order_id, user_id, contact_id, state):
+    """
+    Разносит позиции заказа order_id по заказам магазинов и возвращает их id.
+
+    Запросов: суммы по магазинам, создание заказов магазинов и перенос позиций
+    (по UPDATE на магазин).
+    """
+    totals = dict(OrderItem.objects.filter(order_id=order_id).values_list('product_info__shop_id')
+                  .annotate(total=Sum(F('quantity') * F('product_info__price'))).order_by())
+    if len(totals) <= 1:
+        shop_id, total = next(iter(totals.items()), (None, None))
+        Order.objects.filter(id=order_id).update(shop_id=shop_id, total=total)
+        return [order_id] if shop_id else []
+
+    sub_orders = Order.objects.bulk_create([
+        Order(user_id=user_id, contact_id=contact_id, state=state, parent_id=order_id, shop_id=shop_id,
+              total=total)
+        for shop_id, total in sorted(totals.items())])
+    for sub_order in sub_orders:
+        OrderItem.objects.filter(order_id=order_id, product_info__shop_id=sub_order.shop_id) \
+            .update(order_id=sub_order.id)
+    Order.objects.filter(id=order_id).update(total=sum(totals.values()))
+    return [sub_order.id for sub_order in sub_orders]
+
+
+@transaction.atomic
+def place_order(user_id, basket_id, contact_id):
+    """
+    Переводит корзину basket_id покупателя в заказ с контактом contact_id.
+
+    Возвращает число обновлённых заказов (0, если такой корзины нет или она
+    пуста); события вебхуков пишутся в той же транзакции.
+    """
+    is_updated = Order.objects.filter(user_id=user_id, id=basket_id, state='basket').update(
+        contact_id=contact_id, state='new')
+    if not is_updated:
+        return 0
+    shop_order_ids = split_order(basket_id, user_id, contact_id, 'new')
+    if not shop_order_ids:
+        transaction.set_rollback(True)
+        return 0
+    emit_order_events('order.created', shop_order_ids, 'new')
+    return is_updated
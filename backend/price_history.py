@@ -0,0 +1,103 @@
+"""
+История цен и остатков позиций магазинов.
+
+Точка — время, цена, рекомендуемая цена и остаток, упакованные в POINT.size
+байт. Точки позиции (shop, external_id) лежат подряд в поле PriceSeries.points
+кусками по CHUNK_POINTS точек: ряд читается без обращения к ProductInfo, а
+таблица растёт на строку за CHUNK_POINTS изменений позиции. ProductInfo
+пересоздаётся при каждом импорте, поэтому ряд привязан к external_id.
+
+Импорт прайса и PartnerStock передают в record_prices только изменившиеся
+позиции. Запись — агрегат по открытым кускам и один INSERT ... ON CONFLICT на
+пачку: точка дописывается к последнему куску, а заполненный кусок больше не
+меняется и следующая точка открывает новый. Дописывание переписывает значение
+открытого куска целиком, поэтому стоимость записи ограничена размером куска,
+а не длиной истории; кусок в 2000 байт остаётся в строке таблицы и в
+PostgreSQL не уходит в TOAST.
+"""
+import datetime
+import struct
+
+from cachalot.api import invalidate
+from django.db import connection
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from backend.models import PriceSeries
+
+# время (unix, секунды), цена, рекомендуемая цена, остаток
+POINT = struct.Struct('<qIII')
+COLUMNS = ('price', 'price_rrc', 'quantity')
+
+BATCH_SIZE = 1000
+
+# точек в куске ряда: 100 * 20 байт
+CHUNK_POINTS = 100
+
+
+def encode(timestamp, price, price_rrc, quantity):
+    return POINT.pack(timestamp, price, price_rrc, quantity)
+
+
+def _append_sql(rows):
+    """Вставка кусков rows позиций с дописыванием точки к уже существующим."""
+    table = connection.ops.quote_name(PriceSeries._meta.db_table)
+    points, count = connection.ops.quote_name('points'), connection.ops.quote_name('count')
+    # в SQLite || над BLOB даёт TEXT, CAST возвращает те же байты; в PostgreSQL это bytea || bytea
+    blob = PriceSeries._meta.get_field('points').db_type(connection)
+    return (f'INSERT INTO {table} (shop_id, external_id, chunk, {points}, {count}, updated_at) '
+            f'VALUES {", ".join(["(%s, %s, %s, %s, 1, %s)"] * rows)} '
+            f'ON CONFLICT (shop_id, external_id, chunk) DO UPDATE SET '
+            f'{points} = CAST({table}.{points} || excluded.{points} AS {blob}), '
+            f'{count} = {table}.{count} + 1, updated_at = excluded.updated_at')
+
+
+def _chunks(shop_id, external_ids):
+    """Номер куска для следующей точки каждой позиции: открытый последний кусок или новый."""
+    chunks = {}
+    for external_id, last, open_chunk in PriceSeries.objects.filter(shop_id=shop_id, external_id__in=external_ids) \
+            .values_list('external_id').annotate(last=Max('chunk'),
+                                                 open=Max('chunk', filter=Q(count__lt=CHUNK_POINTS))).order_by():
+        chunks[external_id] = last if open_chunk == last else last + 1
+    return chunks
+
+
+def record_prices(shop_id, changes, at=None):
+    """Дописывает точку к рядам позиций: changes — {external_id: (price, price_rrc, quantity)}."""
+    if not changes:
+        return
+    at = at or timezone.now()
+    timestamp, updated_at = int(at.timestamp()), connection.ops.adapt_datetimefield_value(at)
+    changes = list(changes.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(changes), BATCH_SIZE):
+            batch = changes[start:start + BATCH_SIZE]
+            chunks = _chunks(shop_id, [external_id for external_id, _ in batch])
+            cursor.execute(_append_sql(len(batch)), [
+                value for external_id, values in batch
+                for value in (shop_id, external_id, chunks.get(external_id, 0), encode(timestamp, *values), updated_at)])
+    # сырой INSERT cachalot не разбирает
+    invalidate(PriceSeries)
+
+
+def decode(points, since=None):
+    """Точки ряда по столбцам: {'dt': [...], 'price': [...], 'price_rrc': [...], 'quantity': [...]}."""
+    since = int(since.timestamp()) if since else None
+    series = {'dt': [], **{column: [] for column in COLUMNS}}
+    for timestamp, *values in POINT.iter_unpack(bytes(points)):
+        if since is not None and timestamp < since:
+            continue
+        series['dt'].append(datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat())
+        for column, value in zip(COLUMNS, values):
+            series[column].append(value)
+    return series
+
+
+def price_series(shop_id, external_ids, since=None):
+    """Ряды позиций магазина одним запросом, в порядке external_ids; позиции без истории пропускаются."""
+    points = {}
+    for external_id, chunk in PriceSeries.objects.filter(shop_id=shop_id, external_id__in=external_ids) \
+            .order_by('external_id', 'chunk').values_list('external_id', 'points'):
+        points[external_id] = points.get(external_id, b'') + bytes(chunk)
+    return [{'external_id': external_id, **decode(points[external_id], since)}
+            for external_id in external_ids if external_id in points]
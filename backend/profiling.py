@@ -0,0 +1,266 @@
+"""
+Сэмплирующий профилировщик медленных запросов и задач Celery.
+
+Включается настройкой SLOW_PROFILER_ENABLED. Пока запрос или задача
+выполняются, один фоновый поток раз в SLOW_PROFILER_INTERVAL_MS снимает
+стек их потока (sys._current_frames). Если выполнение заняло больше
+SLOW_PROFILER_THRESHOLD_MS, профиль сохраняется в SLOW_PROFILER_DIR в формате
+speedscope (https://www.speedscope.app) или collapsed stack (flamegraph.pl),
+вместе с именем view или задачи и статистикой SQL-запросов.
+
+Накладные расходы ограничены: на запрос — регистрация в словаре и
+execute_wrapper, в фоне — один обход стека на интервал, не глубже
+SLOW_PROFILER_MAX_DEPTH кадров и не больше SLOW_PROFILER_MAX_SAMPLES сэмплов.
+Асинхронные view выполняются в общем цикле событий и профилируются
+только в синхронных частях.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from backend.metrics import RequestMetrics, execute_wrappers
+
+
+class ProfileSession:
+    """Сэмплы одного запроса или задачи."""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.start = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.queries = RequestMetrics()
+
+    def add(self, frame, max_depth, max_samples):
+        if self.samples >= max_samples:
+            return
+        codes = []
+        while frame is not None and len(codes) < max_depth:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        # от корня к листу; названия кадров строятся только при записи медленного профиля
+        self.stacks[tuple(reversed(codes))] += 1
+        self.samples += 1
+
+
+class Sampler(threading.Thread):
+    """Фоновый поток, снимающий стеки всех зарегистрированных сессий (поток -> список сессий)."""
+
+    def __init__(self, interval, max_depth, max_samples):
+        super().__init__(name='slow-profiler', daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_samples = max_samples
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+
+    def register(self, session):
+        with self.lock:
+            self.sessions.setdefault(session.thread_id, []).append(session)
+            self.active.set()
+
+    def unregister(self, session):
+        with self.lock:
+            thread_sessions = self.sessions.get(session.thread_id, [])
+            if session in thread_sessions:
+                thread_sessions.remove(session)
+            if not thread_sessions:
+                self.sessions.pop(session.thread_id, None)
+            if not self.sessions:
+                self.active.clear()
+
+    def run(self):
+        while True:
+            self.active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            # задача Celery, выполненная внутри запроса (eager), сэмплируется в обе сессии
+            for thread_id, thread_sessions in list(self.sessions.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    for session in list(thread_sessions):
+                        session.add(frame, self.max_depth, self.max_samples)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler(settings.SLOW_PROFILER_INTERVAL_MS / 1000, settings.SLOW_PROFILER_MAX_DEPTH,
+                                   settings.SLOW_PROFILER_MAX_SAMPLES)
+                _sampler.start()
+    return _sampler
+
+
+def start_session():
+    """Начинает сэмплирование текущего потока."""
+    session = ProfileSession(threading.get_ident())
+    get_sampler().register(session)
+    return session
+
+
+def finish_session(session, kind, name, **extra):
+    """Останавливает сэмплирование; если порог превышен, сохраняет профиль и возвращает путь к нему."""
+    get_sampler().unregister(session)
+    duration_ms = (time.perf_counter() - session.start) * 1000
+    if duration_ms < settings.SLOW_PROFILER_THRESHOLD_MS:
+        return None
+    metadata = {'kind': kind, 'name': name, 'duration_ms': round(duration_ms, 1),
+                'queries': session.queries.queries, 'db_ms': round(session.queries.db_time * 1000, 1),
+                'samples': session.samples, 'interval_ms': settings.SLOW_PROFILER_INTERVAL_MS,
+                'started_at': (datetime.now() - timedelta(milliseconds=duration_ms)).isoformat(timespec='seconds'),
+                **extra}
+    return write_profile(session, metadata)
+
+
+def frame_label(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    else:
+        filename = re.sub(r'^.*[/\\]site-packages[/\\]', '', filename)
+    return code.co_name, filename, code.co_firstlineno
+
+
+def write_profile(session, metadata):
+    directory = settings.SLOW_PROFILER_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, '{}-{:%Y%m%dT%H%M%S}-{}-{:.0f}ms'.format(
+        metadata['kind'], datetime.now(), re.sub(r'[^\w.-]+', '_', metadata['name'])[:80],
+        metadata['duration_ms']))
+
+    labels = {}
+    for codes in session.stacks:
+        for code in codes:
+            if code not in labels:
+                labels[code] = frame_label(code)
+    stacks = [([labels[code] for code in codes], count) for codes, count in session.stacks.items()]
+
+    if settings.SLOW_PROFILER_FORMAT == 'collapsed':
+        path = base + '.collapsed.txt'
+        with open(path, 'w', encoding='utf-8') as file:
+            for frames, count in stacks:
+                file.write(';'.join(f'{name} ({filename}:{line})' for name, filename, line in frames) + f' {count}\n')
+        with open(base + '.meta.json', 'w', encoding='utf-8') as file:
+            json.dump(metadata, file, ensure_ascii=False, indent=2)
+        return path
+
+    index = {}
+    for frames, _ in stacks:
+        for frame in frames:
+            index.setdefault(frame, len(index))
+    title = f'{metadata["name"]} {metadata["duration_ms"]} ms, {metadata["queries"]} SQL ({metadata["db_ms"]} ms)'
+    interval = metadata['interval_ms']
+    profile = {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': title,
+        'exporter': 'backend.profiling',
+        'activeProfileIndex': 0,
+        'metadata': metadata,
+        'shared': {'frames': [{'name': name, 'file': filename, 'line': line} for name, filename, line in index]},
+        'profiles': [{
+            'type': 'sampled',
+            'name': title,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(count for _, count in stacks) * interval,
+            'samples': [[index[frame] for frame in frames] for frames, _ in stacks],
+            'weights': [count * interval for _, count in stacks],
+        }],
+    }
+    path = base + '.speedscope.json'
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(profile, file, ensure_ascii=False)
+    return path
+
+
+class SlowRequestProfilerMiddleware:
+    """Профилирует каждый запрос и сохраняет профиль, если запрос оказался медленным."""
+
+    async_capable = sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        session = start_session()
+        response = None
+        try:
+            with execute_wrappers(session.queries):
+                response = self.get_response(request)
+        finally:
+            self.finish(session, request, response)
+        return response
+
+    async def __acall__(self, request):
+        # сэмплируется поток запроса, в котором sync_to_async выполняет синхронные части
+        session = await sync_to_async(start_session)()
+        stack = await sync_to_async(execute_wrappers)(session.queries)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            await sync_to_async(self.finish)(session, request, response)
+        return response
+
+    @staticmethod
+    def finish(session, request, response):
+        match = request.resolver_match
+        finish_session(session, 'request', match.view_name if match else request.path,
+                       method=request.method, path=request.get_full_path(),
+                       status=response.status_code if response is not None else None)
+
+
+_task_sessions = {}
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    session = start_session()
+    for connection in connections.all():
+        connection.execute_wrappers.append(session.queries)
+    _task_sessions[task_id] = session
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    session = _task_sessions.pop(task_id, None)
+    if session is None:
+        return
+    for connection in connections.all():
+        if session.queries in connection.execute_wrappers:
+            connection.execute_wrappers.remove(session.queries)
+    finish_session(session, 'task', task.name, task_id=task_id, state=state)
+
+
+def connect_task_signals():
+    """Подключает профилирование задач Celery, если профилировщик включён."""
+    if not settings.SLOW_PROFILER_ENABLED:
+        return
+    from celery.signals import task_prerun, task_postrun
+
+    task_prerun.connect(_task_prerun, weak=False, dispatch_uid='slow-profiler-prerun')
+    task_postrun.connect(_task_postrun, weak=False, dispatch_uid='slow-profiler-postrun')
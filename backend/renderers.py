@@ -0,0 +1,132 @@
+"""
+Быстрые JSON-рендерер и парсер для REST API.
+
+Бэкенд сериализации выбирается один раз при импорте модуля: orjson, msgspec
+или стандартный json (если ни одна из библиотек не установлена).
+Принудительно выбрать бэкенд можно настройкой ``FAST_JSON_BACKEND``
+('orjson', 'msgspec' или 'json').
+"""
+import re
+
+from django.conf import settings
+from rest_framework import renderers, parsers
+from rest_framework.utils import encoders
+from rest_framework.exceptions import ParseError
+
+from backend.metrics import timed
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+
+LINE_SEPARATORS = (b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+
+# числа, которые json пишет иначе: экспонента (1e20 вместо 1e+20, 1e-7 вместо 1e-07)
+# и 0.00001 вместо 1e-05; совпадение внутри строки лишь отправляет ответ в JSONRenderer
+FLOAT_MISMATCH = re.compile(rb'\de-?\d|(?:^|[^\d.])-?0\.0000')
+
+_default_encoder = encoders.JSONEncoder()
+
+
+def _default(obj):
+    """Приводит типы, которые бэкенд не знает (Decimal, lazy-строки, QuerySet...),
+    так же, как это делает JSONEncoder из DRF."""
+    return _default_encoder.default(obj)
+
+
+def _select_backend():
+    requested = getattr(settings, 'FAST_JSON_BACKEND', None)
+    available = {
+        'orjson': orjson is not None,
+        'msgspec': msgspec is not None,
+        'json': True,
+    }
+    if requested:
+        if not available.get(requested):
+            raise ValueError(f'JSON backend {requested!r} is not available')
+        return requested
+    for name in ('orjson', 'msgspec'):
+        if available[name]:
+            return name
+    return 'json'
+
+
+JSON_BACKEND = _select_backend()
+
+if JSON_BACKEND == 'orjson':
+    def dumps(data):
+        # даты форматирует _default, как JSONEncoder из DRF (Z, миллисекунды)
+        return orjson.dumps(data, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    loads = orjson.loads
+    DecodeError = orjson.JSONDecodeError
+elif JSON_BACKEND == 'msgspec':
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=_default)
+    _msgspec_decoder = msgspec.json.Decoder()
+
+    dumps = _msgspec_encoder.encode
+    loads = _msgspec_decoder.decode
+    DecodeError = msgspec.DecodeError
+else:
+    dumps = None
+    loads = None
+    DecodeError = ValueError
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON-рендерер на orjson/msgspec.
+
+    Выдаёт те же байты, что и стандартный JSONRenderer в компактном режиме
+    (msgspec отличается для Decimal и дат: он форматирует их сам, но поля
+    DecimalField и так приходят из сериализаторов строками). Ответы с числами
+    в экспоненциальной записи отдаются стандартным рендерером.
+    Запросы с отступами (``application/json; indent=4``, Browsable API)
+    и окружение без быстрых бэкендов обрабатываются стандартным рендерером.
+    """
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if dumps is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dumps(data)
+        if FLOAT_MISMATCH.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # как и JSONRenderer, экранируем U+2028/U+2029
+        if LINE_SEPARATORS[0] in ret or LINE_SEPARATORS[1] in ret:
+            ret = ret.replace(LINE_SEPARATORS[0], b'\\u2028').replace(LINE_SEPARATORS[1], b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    """JSON-парсер на orjson/msgspec с откатом на стандартный JSONParser."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        if loads is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return loads(stream.read())
+        except DecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,117 @@
+"""
+Маршрутизация чтения на реплики базы.
+
+GET/HEAD-запросы к view с атрибутом ``read_replica = True`` (каталог и история
+заказов) читают из реплик DATABASE_REPLICAS. Запись всегда идёт в default.
+Клиент, который что-то записал, REPLICA_PIN_SECONDS секунд читает
+только из default, чтобы видеть свои изменения, пока реплика догоняет.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+_state = ContextVar('replica_state', default=None)
+
+# токены и сессии читаются только из default: свежевыданный токен может ещё не дойти до реплики
+PRIMARY_ONLY_APPS = {'authtoken', 'sessions'}
+
+
+class ReplicaState:
+    """Состояние маршрутизации в рамках одного запроса."""
+
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+class PrimaryReplicaRouter:
+    """Роутер: чтение из реплики, если запрос это разрешает, запись — в default."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.use_replica and not state.wrote and settings.DATABASE_REPLICAS \
+                and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def _pin_key(request):
+    """Ключ закрепления за default: токен или сессия клиента (без запросов к базе)."""
+    credential = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return 'replica-pin:' + hashlib.sha1(credential.encode(), usedforsecurity=False).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    """Включает чтение из реплик для read-only view и закрепляет писавших клиентов за default."""
+
+    async_capable = sync_capable = True
+
+    def __init__(self, get_response):
+        # без реплик middleware не нужен: Django убирает его из цепочки при старте
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = ReplicaState(use_replica=False)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        key = _pin_key(request) if state.wrote else None
+        if key:
+            cache.set(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        # синхронные view и ORM получают копию контекста вместе с тем же объектом state
+        state = ReplicaState(use_replica=False)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        key = _pin_key(request) if state.wrote else None
+        if key:
+            await cache.aset(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is None or request.method not in ('GET', 'HEAD'):
+            return None
+
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if getattr(view_class, 'read_replica', False):
+            key = _pin_key(request)
+            state.use_replica = not (key and cache.get(key))
+        return None
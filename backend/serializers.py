@@ -1,6 +1,11 @@
+from operator import itemgetter
+
+from django.db.models import Sum, F
 from rest_framework import serializers
 
-from .models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact
+from .metrics import timed
+from .models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, \
+    Parameter, Webhook, WEBHOOK_EVENTS
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -36,6 +41,20 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class WebhookSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Webhook
+        fields = ('id', 'url', 'events', 'is_active', 'secret', 'created_at')
+        read_only_fields = ('id', 'secret', 'created_at')
+
+    def validate_events(self, value):
+        events = [event.strip() for event in value.split(',') if event.strip()]
+        unknown = set(events) - {event for event, _ in WEBHOOK_EVENTS}
+        if unknown:
+            raise serializers.ValidationError(f'Неизвестные события: {", ".join(sorted(unknown))}')
+        return ','.join(events)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField()
 
@@ -85,4 +104,218 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ('id', 'ordered_items', 'state', 'dt', 'total_sum', 'contact',)
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+# Быстрый путь для read-only списков.
+# Функции ниже собирают те же структуры, что ProductInfoSerializer и OrderSerializer,
+# но из строк values(), без создания моделей и обхода полей DRF.
+# Набор полей задаётся FieldSelection (?fields= и ?expand=): невостребованные
+# колонки не выбираются, а лишние запросы связей не выполняются.
+
+CONTACT_VALUES = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'phone')
+
+_datetime_field = serializers.DateTimeField()
+
+
+class FieldSelection:
+    """
+    Набор полей ответа, заданный параметрами ``?fields=`` и ``?expand=``.
+
+    fields — пути через точку (``id,product.name,price``); без параметра выводятся все поля.
+    expand — связи, раскрываемые во вложенные объекты; без параметра раскрыты все связи,
+    иначе нераскрытые связи выводятся идентификаторами. Связь, для которой в fields
+    запрошены вложенные поля, раскрывается всегда.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        params = getattr(request, 'query_params', request.GET)
+        return cls(cls._parse(params.get('fields')), cls._parse(params.get('expand')))
+
+    @staticmethod
+    def _parse(value):
+        if value is None:
+            return None
+        items = {item.strip() for item in value.split(',') if item.strip()}
+        return items or None
+
+    @staticmethod
+    def _has_descendant(paths, path):
+        prefix = path + '.'
+        return any(item.startswith(prefix) for item in paths)
+
+    def includes(self, path):
+        """Нужно ли поле path в ответе."""
+        if self.fields is None or path in self.fields or self._has_descendant(self.fields, path):
+            return True
+        parts = path.split('.')
+        return any('.'.join(parts[:i]) in self.fields for i in range(1, len(parts)))
+
+    def expands(self, path):
+        """Выводится ли связь path вложенным объектом, а не идентификатором."""
+        if self.expand is None or path in self.expand or self._has_descendant(self.expand, path):
+            return True
+        return self.fields is not None and self._has_descendant(self.fields, path)
+
+
+ALL_FIELDS = FieldSelection()
+
+
+def product_info_values(selection=ALL_FIELDS, prefix=''):
+    """Колонки values() для serialize_product_infos с учётом выбранных полей."""
+    columns = ['id']
+    if selection.includes(prefix + 'model'):
+        columns.append('model')
+    if selection.includes(prefix + 'product'):
+        if selection.expands(prefix + 'product'):
+            if selection.includes(prefix + 'product.name'):
+                columns.append('product__name')
+            if selection.includes(prefix + 'product.category'):
+                columns.append('product__category__name')
+        else:
+            columns.append('product_id')
+    if selection.includes(prefix + 'shop'):
+        columns.append('shop_id')
+    columns.extend(name for name in ('quantity', 'price', 'price_rrc') if selection.includes(prefix + name))
+    return columns
+
+
+def _product_parameters(product_info_ids, expanded=True):
+    """Параметры товаров в разрезе product_info_id (как prefetch 'product_parameters__parameter')."""
+    queryset = ProductParameter.objects.filter(product_info_id__in=product_info_ids)
+    if not expanded:
+        parameters = {}
+        for product_info_id, parameter_id in queryset.values_list('product_info_id', 'id'):
+            parameters.setdefault(product_info_id, []).append(parameter_id)
+        return parameters
+
+    rows = list(queryset.values_list('product_info_id', 'parameter_id', 'value'))
+    names = dict(Parameter.objects.filter(id__in={row[1] for row in rows}).values_list('id', 'name'))
+
+    parameters = {}
+    for product_info_id, parameter_id, value in rows:
+        parameters.setdefault(product_info_id, []).append({'parameter': names[parameter_id], 'value': value})
+    return parameters
+
+
+def _column_getters(selection, prefix, fields):
+    """Пары (ключ, getter) для простых полей, попавших в выборку."""
+    return [(name, itemgetter(column)) for name, column in fields if selection.includes(prefix + name)]
+
+
+def _product_info_getters(rows, selection, prefix):
+    """Пары (ключ, getter) для строк товаров; параметры товаров загружаются здесь."""
+    getters = _column_getters(selection, prefix, (('id', 'id'), ('model', 'model')))
+    if selection.includes(prefix + 'product'):
+        if selection.expands(prefix + 'product'):
+            product_getters = _column_getters(selection, prefix + 'product.', (('name', 'product__name'),
+                                                                               ('category', 'product__category__name')))
+            getters.append(('product', lambda row: {name: getter(row) for name, getter in product_getters}))
+        else:
+            getters.append(('product', itemgetter('product_id')))
+    getters.extend(_column_getters(selection, prefix, (('shop', 'shop_id'), ('quantity', 'quantity'),
+                                                       ('price', 'price'), ('price_rrc', 'price_rrc'))))
+    if selection.includes(prefix + 'product_parameters'):
+        parameters = _product_parameters([row['id'] for row in rows],
+                                         selection.expands(prefix + 'product_parameters')) if rows else {}
+        getters.append(('product_parameters', lambda row: parameters.get(row['id'], [])))
+    return getters
+
+
+@timed('serialize')
+def serialize_product_infos(rows, selection=ALL_FIELDS, prefix=''):
+    """Аналог ProductInfoSerializer(many=True).data для строк values(*product_info_values(...))."""
+    rows = list(rows)
+    getters = _product_info_getters(rows, selection, prefix)
+    return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+def _ordered_items_getter(orders, selection):
+    """Getter позиций заказа: вложенные объекты или список идентификаторов."""
+    items = {}
+    product_info_ids = set()
+    for item_id, order_id, product_info_id, quantity in OrderItem.objects.filter(
+            order_id__in=[order['id'] for order in orders]).values_list('id', 'order_id', 'product_info_id',
+                                                                        'quantity'):
+        items.setdefault(order_id, []).append((item_id, product_info_id, quantity))
+        product_info_ids.add(product_info_id)
+
+    if not selection.expands('ordered_items'):
+        return lambda order: [item[0] for item in items.get(order['id'], [])]
+
+    item_getters = []
+    if selection.includes('ordered_items.id'):
+        item_getters.append(('id', itemgetter(0)))
+    if selection.includes('ordered_items.product_info'):
+        prefix = 'ordered_items.product_info.'
+        if selection.expands('ordered_items.product_info'):
+            rows = list(ProductInfo.objects.filter(id__in=product_info_ids).values(
+                *product_info_values(selection, prefix))) if product_info_ids else []
+            info_getters = _product_info_getters(rows, selection, prefix)
+            product_infos = {row['id']: {name: getter(row) for name, getter in info_getters} for row in rows}
+            item_getters.append(('product_info', lambda item: product_infos[item[1]]))
+        else:
+            item_getters.append(('product_info', itemgetter(1)))
+    if selection.includes('ordered_items.quantity'):
+        item_getters.append(('quantity', itemgetter(2)))
+
+    return lambda order: [{name: getter(item) for name, getter in item_getters}
+                          for item in items.get(order['id'], [])]
+
+
+def _contact_getter(orders, selection):
+    """Getter контакта заказа: вложенный объект или идентификатор."""
+    if not selection.expands('contact'):
+        return itemgetter('contact_id')
+
+    contact_ids = {order['contact_id'] for order in orders if order['contact_id'] is not None}
+    columns = [name for name in CONTACT_VALUES if name == 'id' or selection.includes('contact.' + name)]
+    contacts = {contact['id']: contact for contact in
+                Contact.objects.filter(id__in=contact_ids).values(*columns)} if contact_ids else {}
+    if not selection.includes('contact.id'):
+        contacts = {contact_id: {name: value for name, value in contact.items() if name != 'id'}
+                    for contact_id, contact in contacts.items()}
+    return lambda order: contacts.get(order['contact_id'])
+
+
+@timed('serialize')
+def serialize_orders(queryset, selection=ALL_FIELDS):
+    """Аналог OrderSerializer(many=True).data для queryset заказов (total_sum добавляется здесь)."""
+    if selection.includes('total_sum'):
+        queryset = queryset.annotate(
+            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price')))
+    columns = ['id'] + [name for name in ('state', 'dt', 'total_sum') if selection.includes(name)]
+    if selection.includes('contact'):
+        columns.append('contact_id')
+    orders = list(queryset.distinct().values(*columns))
+    if not orders:
+        return []
+
+    getters = []
+    if selection.includes('id'):
+        getters.append(('id', itemgetter('id')))
+    if selection.includes('ordered_items'):
+        getters.append(('ordered_items', _ordered_items_getter(orders, selection)))
+    if selection.includes('state'):
+        getters.append(('state', itemgetter('state')))
+    if selection.includes('dt'):
+        getters.append(('dt', lambda order: _datetime_field.to_representation(order['dt'])))
+    if selection.includes('total_sum'):
+        getters.append(('total_sum', lambda order: None if order['total_sum'] is None else int(order['total_sum'])))
+    if selection.includes('contact'):
+        getters.append(('contact', _contact_getter(orders, selection)))
+
+    return [{name: getter(order) for name, getter in getters} for order in orders]
+
+
+def serialize_archived_orders(orders):
+    """Архивные заказы в форме ответа OrderView; позиции и контакт — снимки на момент переноса."""
+    return [{'id': order.id, 'ordered_items': order.items, 'state': order.state,
+             'dt': _datetime_field.to_representation(order.dt), 'total_sum': order.total, 'shop': order.shop_id,
+             'contact': order.contact}
+            for order in orders]
@@ -0,0 +1,146 @@
+"""
+Метрики задач Celery: ожидание в очереди, время выполнения, повторы и ошибки.
+
+Включаются настройкой TASK_METRICS_ENABLED. При публикации задачи в
+заголовок сообщения пишется время отправки (before_task_publish), воркер
+по нему считает ожидание в очереди (task_prerun), а по task_postrun —
+время выполнения и итог: success, failure или retry.
+
+Воркер и веб-процессы — разные процессы (а prefork — ещё и несколько
+дочерних), поэтому значения копятся не в памяти, а в кэше
+TASK_METRICS_CACHE атомарными incr: по ключу на корзину гистограммы, сумму
+и количество. /api/v1/metrics отдаёт их вместе с метриками запросов в том
+же формате Prometheus, а manage.py task_stats печатает сводку.
+"""
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+
+from backend.metrics import DURATION_BUCKETS, Histogram, render_prometheus
+
+PREFIX = 'task-metrics'
+# время ожидания бывает заметно дольше выполнения: письма стоят за импортами
+WAIT_BUCKETS = DURATION_BUCKETS + (30, 60, 300, 900)
+STATES = ('success', 'failure', 'retry')
+
+HISTOGRAMS = {
+    'celery_task_queue_wait_seconds': (WAIT_BUCKETS, 'Время от публикации задачи до начала выполнения'),
+    'celery_task_runtime_seconds': (DURATION_BUCKETS, 'Время выполнения задачи'),
+}
+COUNTERS = {
+    'celery_task_total': 'Завершённые задачи по итогу (success, failure, retry)',
+}
+HELP = {name: help_text for name, (_, help_text) in HISTOGRAMS.items()} | COUNTERS
+
+_started = {}
+
+
+def get_cache():
+    return caches[settings.TASK_METRICS_CACHE]
+
+
+def _incr(cache, key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # ключа ещё нет; если его успел создать другой процесс, add вернёт False
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def observe(name, task, value):
+    """Добавляет значение в гистограмму name задачи task; сумма хранится в микросекундах."""
+    cache = get_cache()
+    index = bisect_left(HISTOGRAMS[name][0], value)
+    _incr(cache, f'{PREFIX}:{name}:{task}:{index}')
+    _incr(cache, f'{PREFIX}:{name}:{task}:sum', round(value * 1_000_000))
+    _incr(cache, f'{PREFIX}:{name}:{task}:count')
+
+
+def inc(name, task, state):
+    _incr(get_cache(), f'{PREFIX}:{name}:{task}:{state}')
+
+
+def task_names():
+    """Задачи проекта из реестра Celery, без служебных celery.*."""
+    from orders.celery import app
+
+    return sorted(name for name in app.tasks if not name.startswith('celery.'))
+
+
+def snapshot(tasks=None):
+    """Данные из кэша в виде MetricsRegistry.snapshot(): гистограммы и счётчики с меткой task."""
+    tasks = task_names() if tasks is None else tasks
+    keys = []
+    for task in tasks:
+        for name, (buckets, _) in HISTOGRAMS.items():
+            keys += [f'{PREFIX}:{name}:{task}:{index}' for index in range(len(buckets) + 1)]
+            keys += [f'{PREFIX}:{name}:{task}:sum', f'{PREFIX}:{name}:{task}:count']
+        keys += [f'{PREFIX}:{name}:{task}:{state}' for name in COUNTERS for state in STATES]
+    values = get_cache().get_many(keys)
+
+    histograms, counters = {}, {}
+    for task in tasks:
+        for name, (buckets, _) in HISTOGRAMS.items():
+            count = values.get(f'{PREFIX}:{name}:{task}:count')
+            if not count:
+                continue
+            histogram = Histogram(buckets)
+            histogram.counts = [values.get(f'{PREFIX}:{name}:{task}:{index}', 0) for index in range(len(buckets) + 1)]
+            histogram.sum = values.get(f'{PREFIX}:{name}:{task}:sum', 0) / 1_000_000
+            histogram.count = count
+            histograms[(name, (('task', task),))] = histogram
+        for name in COUNTERS:
+            for state in STATES:
+                value = values.get(f'{PREFIX}:{name}:{task}:{state}')
+                if value:
+                    counters[(name, (('state', state), ('task', task)))] = value
+    return histograms, counters
+
+
+def render():
+    return render_prometheus(*snapshot(), HELP)
+
+
+def clear(tasks=None):
+    tasks = task_names() if tasks is None else tasks
+    get_cache().delete_many([
+        f'{PREFIX}:{name}:{task}:{suffix}'
+        for task in tasks
+        for name, (buckets, _) in HISTOGRAMS.items()
+        for suffix in [*range(len(buckets) + 1), 'sum', 'count']
+    ] + [f'{PREFIX}:{name}:{task}:{state}' for task in tasks for name in COUNTERS for state in STATES])
+
+
+def _before_publish(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+    # в воркере заголовки сообщения становятся атрибутами request, при apply() лежат в request.headers
+    published = getattr(task.request, 'published_at', None) or (task.request.headers or {}).get('published_at')
+    if published:
+        observe('celery_task_queue_wait_seconds', task.name, max(0.0, time.time() - published))
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _started.pop(task_id, None)
+    if start is not None:
+        observe('celery_task_runtime_seconds', task.name, time.perf_counter() - start)
+    if state and state.lower() in STATES:
+        inc('celery_task_total', task.name, state.lower())
+
+
+def connect_task_signals():
+    """Подключает сбор метрик задач, если он включён; вызывается и в веб-процессе (публикация), и в воркере."""
+    if not settings.TASK_METRICS_ENABLED:
+        return
+    from celery.signals import before_task_publish, task_prerun, task_postrun
+
+    before_task_publish.connect(_before_publish, weak=False, dispatch_uid='task-metrics-publish')
+    task_prerun.connect(_task_prerun, weak=False, dispatch_uid='task-metrics-prerun')
+    task_postrun.connect(_task_postrun, weak=False, dispatch_uid='task-metrics-postrun')
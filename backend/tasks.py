@@ -1,12 +1,54 @@
-from celery import shared_task
+import time
+from functools import partial
+from smtplib import SMTPException
+
+from celery import shared_task, Task
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
 from easy_thumbnails.files import get_thumbnailer
 from django.core.files.storage import default_storage
-from backend.models import ConfirmEmailToken, User
+from django.utils import timezone
+from requests import get, post, RequestException
+
+from backend.archive import archive_orders
+from backend import cleanup
+from backend.imports import parse_price_list, import_price_list
+from backend.models import ConfirmEmailToken, User, Order, STATE_CHOICES, Webhook, WebhookEvent
+from backend.webhooks import pending_batch, encode_batch, sign, schedule_delivery, reschedule_pending, SCHEDULE_KEY, \
+    SCHEDULE_TTL, MAX_RETRIES, RETRY_BACKOFF_MAX
+
+# сколько помнить выполненные задачи; больше visibility_timeout брокера
+DONE_TTL = 60 * 60 * 24
+
+
+class IdempotentTask(Task):
+    """
+    Задача, которую безопасно доставить повторно.
+
+    При acks_late сообщение подтверждается после выполнения, и если воркер упал
+    после отправки письма, задача придёт ещё раз с тем же id. Отметка в кэше
+    не даёт выполнить её второй раз.
+    """
+
+    abstract = True
+
+    def __call__(self, *args, **kwargs):
+        key = f'celery-done:{self.request.id}' if self.request.id else None
+        if key and cache.get(key):
+            return None
+        result = super().__call__(*args, **kwargs)
+        if key:
+            cache.set(key, 1, DONE_TTL)
+        return result
+
 
+# при сбое SMTP письмо отправляется повторно с нарастающей паузой
+email_task = partial(shared_task, base=IdempotentTask, autoretry_for=(SMTPException, ConnectionError),
+                     retry_backoff=True, max_retries=5)
 
-@shared_task(name="new_user_registered")
+
+@email_task(name="new_user_registered")
 def new_user_registered(user_id):
     """
     Отправляем письмо с подтверждением почты
@@ -26,7 +68,7 @@ def new_user_registered(user_id):
     msg.send()
 
 
-@shared_task(name="new_order")
+@email_task(name="new_order")
 def new_order(user_id):
     """
     Отправляем письмо при изменении статуса заказа
@@ -45,7 +87,104 @@ def new_order(user_id):
     )
     msg.send()
 
-@shared_task
+
+@email_task(name="orders_state_changed")
+def orders_state_changed(order_ids, state):
+    """
+    Сообщаем покупателям о смене статуса заказов: по письму на покупателя,
+    все письма уходят через одно соединение с SMTP
+    """
+    orders = {}
+    for order_id, email in Order.objects.filter(id__in=order_ids).values_list('id', 'user__email'):
+        orders.setdefault(email, []).append(order_id)
+    label = dict(STATE_CHOICES)[state]
+    messages = [
+        EmailMultiAlternatives(
+            f"Обновление статуса заказа",
+            '\n'.join(f'Заказ {order_id}: {label}' for order_id in sorted(ids)),
+            settings.EMAIL_HOST_USER,
+            [email]
+        )
+        for email, ids in orders.items()
+    ]
+    get_connection().send_messages(messages)
+
+
+@shared_task(name="do_import", base=IdempotentTask, ignore_result=False)
+def do_import(user_id, url):
+    """
+    Загружает прайс поставщика по url; результат нужен вызывающему, поэтому сохраняется
+    """
+    shop = import_price_list(user_id, parse_price_list(get(url).content))
+    return {'shop_id': shop.id}
+
+
+@shared_task(name="do_archive")
+def do_archive(days=None):
+    """
+    Переносит в архив завершённые заказы старше days (по умолчанию ORDER_ARCHIVE_DAYS) дней
+    """
+    return archive_orders(days)
+
+
+@shared_task(name="collect_garbage")
+def collect_garbage():
+    """
+    Удаляет брошенные корзины, просроченные токены и профили без пользователя, возвращает отчёт
+    """
+    return cleanup.collect_garbage()
+
+
+class WebhookDeliveryError(Exception):
+    pass
+
+
+# доставка идемпотентна сама по себе: отправляются только недоставленные события,
+# получатель отсеивает повторы по id события
+@shared_task(name="deliver_webhooks", autoretry_for=(RequestException, WebhookDeliveryError),
+             retry_backoff=True, retry_backoff_max=RETRY_BACKOFF_MAX, max_retries=MAX_RETRIES)
+def deliver_webhooks(webhook_id):
+    """
+    Отправляет накопившиеся события подписки пачками по WEBHOOK_BATCH_SIZE
+    """
+    webhook = Webhook.objects.filter(id=webhook_id, is_active=True).first()
+    if webhook is None:
+        cache.delete(SCHEDULE_KEY.format(webhook_id))
+        return
+
+    try:
+        while events := pending_batch(webhook_id):
+            body = encode_batch(events)
+            timestamp = int(time.time())
+            response = post(webhook.url, data=body, timeout=settings.WEBHOOK_TIMEOUT, headers={
+                'Content-Type': 'application/json',
+                'X-Webhook-Timestamp': str(timestamp),
+                'X-Webhook-Signature': sign(webhook.secret, timestamp, body),
+            })
+            if not 200 <= response.status_code < 300:
+                raise WebhookDeliveryError(f'{webhook.url}: HTTP {response.status_code}')
+            WebhookEvent.objects.filter(id__in=[event['id'] for event in events]) \
+                .update(delivered_at=timezone.now())
+    except (RequestException, WebhookDeliveryError):
+        # задача уходит на повтор: новые события не должны ставить вторую доставку до него
+        cache.set(SCHEDULE_KEY.format(webhook_id), 1, SCHEDULE_TTL)
+        raise
+
+    # события, пришедшие после последней выборки, планируют доставку заново
+    cache.delete(SCHEDULE_KEY.format(webhook_id))
+    if WebhookEvent.objects.filter(webhook_id=webhook_id, delivered_at__isnull=True).exists():
+        schedule_delivery([webhook_id])
+
+
+@shared_task(name="reschedule_webhooks")
+def reschedule_webhooks():
+    """
+    Заново планирует доставку подписок, у которых остались недоставленные события
+    """
+    return reschedule_pending()
+
+
+@shared_task(base=IdempotentTask)
 def generate_thumbnails(image_path, sizes):
     thumbnailer = get_thumbnailer(default_storage.open(image_path))
     for alias, size in sizes.items():
@@ -55,4 +194,4 @@ def generate_thumbnails(image_path, sizes):
         })
         thumbnail_path = f"{image_path}_{alias}.jpg"
         with default_storage.open(thumbnail_path, 'wb') as f:
-            thumbnail.save(f)
\ No newline at end of file
+            thumbnail.save(f)
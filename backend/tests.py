@@ -1,8 +1,72 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import queue
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from smtplib import SMTPException
+from unittest.mock import patch, Mock
+
+import rollbar
+import yaml
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import ProtectedError, Sum, F
+from django.http import HttpResponse
+from django.test import TestCase, AsyncClient, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from django_rest_passwordreset.models import ResetPasswordToken
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from backend.models import User, Category, Shop, ProductInfo, Order, Contact
+from backend.archive import archive_orders
+from backend.catalog import bump_shop_catalog, bump_catalog_version
+from backend import cleanup
+from backend.cleanup import collect_garbage
+from backend import category_index
+from backend.imports import parse_price_list, import_price_list
+from backend.log import JsonFormatter, BackgroundQueueHandler, BatchingRollbarHandler, configure_logging, \
+    stop_listeners
+from backend import task_metrics
+from backend.management.commands.webhook_receiver import make_receiver
+from backend.metrics import registry
+from backend.offers import refresh_offers
+from backend.price_history import record_prices, price_series
+from backend.ordering import split_order
+from backend.profiling import start_session, finish_session
+from backend.webhooks import SCHEDULE_KEY
+from backend.models import User, Category, Shop, ProductInfo, Order, Contact, Product, Parameter, \
+    ProductParameter, OrderItem, Webhook, WebhookEvent, ArchivedOrder, ConfirmEmailToken, Profile, PriceSeries, \
+    ProductOffers
+from backend.renderers import FastJSONRenderer, FastJSONParser
+from backend.routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+from backend.serializers import ProductInfoSerializer, OrderSerializer, FieldSelection, product_info_values, \
+    serialize_product_infos, serialize_orders
+from backend.tasks import new_order, do_import, deliver_webhooks, reschedule_webhooks
+from backend.views import CategoryView, BasketView, OrderView, ShopView, ProductInfoViewSet, PartnerOrders, \
+    ContactView, AccountDetails, PartnerState, LoginAccount, PartnerUpdate, PartnerOrderState, \
+    PartnerStock, PartnerWebhooks, OfferView, OrderArchiveView, PriceHistoryView
+from orders.celery import app as celery_app
 
 class RegisterAccountTests(TestCase):
     def setUp(self):
@@ -137,3 +201,1358 @@ class ContactViewTest(TestCase):
         Contact.objects.create(user=self.user, **self.contact_data)
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class FastJSONRendererTest(TestCase):
+    def setUp(self):
+        self.data = {
+            'count': 1,
+            'results': [{'id': 1, 'name': 'Смартфон ', 'price': 10.5, 'state': gettext_lazy('Новый'),
+                         'dt': datetime.datetime(2025, 1, 1, 12, 0), 'tags': ('a', 'b')}],
+        }
+
+    def test_render_matches_stdlib(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_render_matches_stdlib_for_aware_datetimes_and_floats(self):
+        data = {'dt': datetime.datetime(2025, 1, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+                'day': datetime.date(2025, 1, 1), 'small': [1e-05, -2.5e-07, 0.0001], 'large': 1e20,
+                'model': 'X-1e5', 'plain': [0.1, 100.0, 1e15]}
+        for value in (data, {'plain': data['plain'], 'dt': data['dt']}, data['small'], data['large']):
+            self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+
+    def test_render_indent_falls_back(self):
+        rendered = FastJSONRenderer().render(self.data, 'application/json; indent=4')
+        self.assertEqual(rendered, JSONRenderer().render(self.data, 'application/json; indent=4'))
+
+    def test_parse(self):
+        parsed = FastJSONParser().parse(io.BytesIO('{"items": [1, "два"]}'.encode()))
+        self.assertEqual(parsed, {'items': [1, 'два']})
+
+    def test_parse_error(self):
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"items": '))
+
+
+def create_catalog(shops=2, products=3, parameters=('Цвет', 'Вес')):
+    """Заполняет каталог: магазины, категория, товары с параметрами."""
+    category = Category.objects.create(name='Смартфоны')
+    parameter_objects = [Parameter.objects.create(name=name) for name in parameters]
+    # bulk_create, потому что Product.save() ставит задачу генерации миниатюр
+    product_objects = Product.objects.bulk_create(
+        [Product(name=f'Товар {i}', category=category) for i in range(products)])
+    infos = []
+    for shop_index in range(shops):
+        shop = Shop.objects.create(name=f'Магазин {shop_index}', state=True)
+        for i, product in enumerate(product_objects):
+            info = ProductInfo.objects.create(product=product, shop=shop, external_id=i, model=f'model-{i}',
+                                              quantity=10, price=100 + i, price_rrc=120 + i)
+            for parameter in parameter_objects:
+                ProductParameter.objects.create(product_info=info, parameter=parameter, value=str(i))
+            infos.append(info)
+    return infos
+
+
+class FastSerializationTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', phone='123')
+        for state, contact_object in (('new', contact), ('basket', None)):
+            order = Order.objects.create(user=self.user, state=state, contact=contact_object)
+            for info in self.infos[::2]:
+                OrderItem.objects.create(order=order, product_info=info, quantity=2)
+        Order.objects.create(user=self.user, state='new')
+
+    def test_product_infos_match_serializer(self):
+        queryset = ProductInfo.objects.select_related('shop', 'product__category').prefetch_related(
+            'product_parameters__parameter')
+        expected = JSONRenderer().render(ProductInfoSerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(serialize_product_infos(queryset.values(*product_info_values())))
+        self.assertEqual(actual, expected)
+
+    def test_orders_match_serializer(self):
+        queryset = Order.objects.filter(user=self.user).prefetch_related(
+            'ordered_items__product_info__product__category',
+            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
+            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        expected = JSONRenderer().render(OrderSerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(serialize_orders(Order.objects.filter(user=self.user)))
+        self.assertEqual(actual, expected)
+
+    def test_product_list_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('backend:products-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], len(self.infos))
+        self.assertEqual(len(response.json()['results'][0]['product_parameters']), 2)
+
+    def test_product_list_sparse_fields(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        # версии каталога для ETag, count и страница без запроса параметров
+        with self.assertNumQueries(3):
+            response = client.get(reverse('backend:products-list'), {'fields': 'id,product.name,price'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0].keys(), {'id', 'product', 'price'})
+        self.assertEqual(response.json()['results'][0]['product'].keys(), {'name'})
+
+    def test_orders_expand(self):
+        selection = FieldSelection(fields={'id', 'ordered_items', 'contact'}, expand={'ordered_items'})
+        with self.assertNumQueries(2):
+            data = serialize_orders(Order.objects.filter(user=self.user, state='new'), selection)
+        self.assertEqual(len(data), 2)
+        for order in data:
+            self.assertEqual(order.keys(), {'id', 'ordered_items', 'contact'})
+            for item in order['ordered_items']:
+                self.assertIsInstance(item['product_info'], int)
+
+    def test_orders_nested_fields(self):
+        selection = FieldSelection(fields={'id', 'ordered_items.product_info.price', 'contact.city'})
+        data = serialize_orders(Order.objects.filter(user=self.user, state='new', contact__isnull=False), selection)
+        self.assertEqual(data[0]['ordered_items'][0], {'product_info': {'price': 100}})
+        self.assertEqual(data[0]['contact'], {'city': 'Москва'})
+
+
+class CatalogConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.shop = Shop.objects.create(name='Test Shop', state=True)
+        Category.objects.create(name='Test Category').shops.add(self.shop)
+
+    def test_not_modified(self):
+        for name in ('backend:categories', 'backend:shops'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('ETag', response.headers)
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response.headers['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_bump_invalidates(self):
+        etag = self.client.get(reverse('backend:shops')).headers['ETag']
+        bump_shop_catalog(self.shop.id)
+        response = self.client.get(reverse('backend:shops'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(Category.objects.get().catalog_version, 1)
+
+    def test_products_not_modified(self):
+        user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        self.client.force_authenticate(user=user)
+        url = reverse('backend:products-list')
+        etag = self.client.get(url, {'shop_id': self.shop.id}).headers['ETag']
+        response = self.client.get(url, {'shop_id': self.shop.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+PRICE_LIST = '''
+shop: Связной
+categories:
+  - id: 224
+    name: Смартфоны
+goods:
+  - id: 4216292
+    category: 224
+    model: apple/iphone/xs-max
+    name: Смартфон Apple iPhone XS Max 512GB (золотистый)
+    price: 110000
+    price_rrc: 116990
+    quantity: 14
+    parameters:
+      "Диагональ (дюйм)": 6.5
+      "Цвет": золотистый
+'''
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(shops=1)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password',
+                                             is_active=True)
+        self.contact = Contact.objects.create(user=self.user, city='Москва', street='Тверская', phone='123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    async def test_login_required(self):
+        response = await self.client.get(reverse('backend:async-basket'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_basket_and_order(self):
+        items = [{'product_info': info.id, 'quantity': 2} for info in self.infos]
+        response = await self.client.post(reverse('backend:async-basket'), {'items': items},
+                                          content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = await self.client.get(reverse('backend:async-basket'), headers=self.headers)
+        basket = response.json()[0]
+        self.assertEqual(len(basket['ordered_items']), len(self.infos))
+        self.assertEqual(basket['total_sum'], sum(2 * info.price for info in self.infos))
+
+        with patch('backend.async_views.new_order') as task:
+            response = await self.client.post(reverse('backend:async-order'),
+                                              {'id': basket['id'], 'contact': self.contact.id},
+                                              content_type='application/json', headers=self.headers)
+        self.assertEqual(response.json(), {'Status': True})
+        task.delay.assert_called_once_with(user_id=self.user.id)
+        self.assertEqual((await Order.objects.aget(id=basket['id'])).state, 'new')
+
+    async def test_malformed_basket_items(self):
+        url = reverse('backend:async-basket')
+        for method, items in (('post', 'строка'), ('post', [1, 2]), ('post', [{'product_info': [1]}]),
+                              ('post', [{'product_info': '1', 'quantity': 1}]), ('put', 'строка'), ('put', [1])):
+            with self.subTest(method=method, items=items):
+                response = await getattr(self.client, method)(url, {'items': items},
+                                                              content_type='application/json', headers=self.headers)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.json()['Errors'], 'Не указаны все необходимые аргументы')
+        response = await self.client.post(url, [], content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(await Order.objects.filter(user=self.user).aexists())
+
+    async def test_middleware_runs_natively_under_asgi(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # с DEBUG Django пишет «Asynchronous handler adapted ...» для каждого синхронного middleware
+        with self.settings(DEBUG=True, REQUEST_METRICS_ENABLED=True, SLOW_PROFILER_ENABLED=True,
+                           SLOW_PROFILER_THRESHOLD_MS=0, SLOW_PROFILER_DIR=directory, DATABASE_REPLICAS=['replica']), \
+                self.assertNoLogs('django.request', 'DEBUG'):
+            response = await self.client.get(reverse('backend:async-basket'), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # запросы синхронного ORM в потоке запроса тоже посчитаны
+        self.assertRegex(response.headers['Server-Timing'], r'desc="[1-9]\d* queries"')
+        [name] = os.listdir(directory)
+        with open(os.path.join(directory, name), encoding='utf-8') as file:
+            self.assertGreater(json.load(file)['metadata']['queries'], 0)
+
+    async def test_partner_update(self):
+        self.user.type = 'shop'
+        await self.user.asave()
+        with patch('backend.async_views.fetch', return_value=PRICE_LIST.encode()):
+            response = await self.client.post(reverse('backend:async-partner-update'),
+                                              {'url': 'http://example.com/shop.yaml'},
+                                              content_type='application/json', headers=self.headers)
+        self.assertEqual(response.json(), {'Status': True})
+        shop = await Shop.objects.aget(user=self.user)
+        self.assertEqual(await ProductInfo.objects.filter(shop=shop).acount(), 1)
+        self.assertEqual(shop.catalog_version, 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def route(self, view_class, request, write=False):
+        """Прогоняет запрос через middleware и возвращает базу, выбранную для чтения внутри view."""
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(ProductInfo))
+            if write:
+                self.router.db_for_write(OrderItem)
+                databases.append(self.router.db_for_read(ProductInfo))
+            return HttpResponse()
+
+        view.cls = view_class
+        middleware = ReplicaRoutingMiddleware(lambda request: middleware.process_view(request, view, (), {}) or
+                                              view(request))
+        middleware(request)
+        return databases
+
+    def test_read_only_view_uses_replica(self):
+        self.assertEqual(self.route(CategoryView, self.factory.get('/')), ['replica'])
+        self.assertEqual(self.route(CategoryView, self.factory.post('/')), [None])
+        self.assertEqual(self.route(BasketView, self.factory.get('/')), [None])
+        self.assertIsNone(self.router.db_for_read(ProductInfo))
+        self.assertIsNone(self.router.db_for_read(Token))
+
+    def test_writer_is_pinned_to_primary(self):
+        headers = {'Authorization': 'Token abc'}
+        self.assertEqual(self.route(BasketView, self.factory.post('/', headers=headers), write=True), [None, None])
+        self.assertEqual(self.route(OrderView, self.factory.get('/', headers=headers)), [None])
+        self.assertEqual(self.route(OrderView, self.factory.get('/', headers={'Authorization': 'Token xyz'})),
+                         ['replica'])
+
+    def test_write_in_request_switches_to_primary(self):
+        self.assertEqual(self.route(OrderView, self.factory.get('/'), write=True), ['replica', None])
+
+    def test_async_chain_pins_writer(self):
+        databases = []
+
+        async def view(request):
+            databases.append(await sync_to_async(self.router.db_for_read)(ProductInfo))
+            await sync_to_async(self.router.db_for_write)(OrderItem)
+            return HttpResponse()
+
+        view.cls = OrderView
+
+        async def get_response(request):
+            return middleware.process_view(request, view, (), {}) or await view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = self.factory.get('/', headers={'Authorization': 'Token abc'})
+        async_to_sync(middleware)(request)
+        self.assertEqual(databases, ['replica'])
+        self.assertEqual(self.route(OrderView, self.factory.get('/', headers={'Authorization': 'Token abc'})),
+                         [None])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_unused_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        create_catalog()
+        registry.clear()
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('backend:products-list'))
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(self.client.get(reverse('backend:metrics')).status_code, 404)
+
+    @override_settings(REQUEST_METRICS_ENABLED=True, METRICS_TOKEN='metrics-key')
+    def test_server_timing_and_histograms(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='buyer', email='buyer@example.com'))
+        response = client.get(reverse('backend:products-list'), {'fields': 'id,price'})
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="3 queries", ')
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+        text = client.get(reverse('backend:metrics'), headers={'Authorization': 'Bearer metrics-key'}) \
+            .content.decode()
+        labels = 'method="GET",view="backend:products-list"'
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="5"}} 1', text)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="2"}} 0', text)
+        self.assertIn(f'http_request_db_queries_sum{{{labels}}} 3', text)
+
+    @override_settings(REQUEST_METRICS_ENABLED=True, METRICS_TOKEN='metrics-key')
+    def test_metrics_require_token_or_staff(self):
+        url = reverse('backend:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer другой'}).status_code, 403)
+        user = User.objects.create_user(username='buyer', email='buyer@example.com')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        User.objects.filter(id=user.id).update(is_staff=True)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.settings(METRICS_TOKEN=''):
+            self.client.logout()
+            # без настроенного ключа пустой Bearer не подходит
+            self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer '}).status_code, 403)
+
+
+def price_list(shop, count):
+    """YAML-прайс магазина shop с count позициями."""
+    goods = [{'id': i, 'category': 224, 'model': f'model-{i}', 'name': f'Товар {i}', 'price': 100 + i,
+              'price_rrc': 120 + i, 'quantity': 5, 'parameters': {'Цвет': 'черный', 'Вес': i}}
+             for i in range(count)]
+    return yaml.dump({'shop': shop, 'categories': [{'id': 224, 'name': 'Смартфоны'}], 'goods': goods},
+                     allow_unicode=True).encode()
+
+
+# view, метод, имя url, клиент, данные запроса, список (число запросов не должно расти с размером)
+QUERY_BUDGET_ENDPOINTS = (
+    (CategoryView, 'get', 'categories', None, None, True),
+    (ShopView, 'get', 'shops', None, None, True),
+    (OfferView, 'get', 'offers', None, None, True),
+    (PriceHistoryView, 'get', 'price-history', 'buyer',
+     lambda fixture: {'shop_id': fixture['other_shop'][0].shop_id,
+                      'external_id': ','.join(str(info.external_id) for info in fixture['other_shop'])}, True),
+    (ProductInfoViewSet, 'get', 'products-list', 'buyer', None, True),
+    (BasketView, 'get', 'basket', 'buyer', None, True),
+    (OrderView, 'get', 'order', 'buyer', None, True),
+    (OrderArchiveView, 'get', 'order-archive', 'buyer', None, True),
+    (PartnerOrders, 'get', 'partner-orders', 'partner', None, True),
+    (ContactView, 'get', 'user-contact', 'buyer', None, True),
+    (PartnerWebhooks, 'get', 'partner-webhooks', 'partner', None, True),
+    (AccountDetails, 'get', 'user-details', 'buyer', None, False),
+    (PartnerState, 'get', 'partner-state', 'partner', None, False),
+    (LoginAccount, 'post', 'user-login', None,
+     lambda fixture: {'email': 'buyer@example.com', 'password': 'password'}, False),
+    (BasketView, 'post', 'basket', 'buyer',
+     lambda fixture: {'items': [{'product_info': info.id, 'quantity': 1} for info in fixture['other_shop'][:2]]},
+     False),
+    (BasketView, 'put', 'basket', 'buyer',
+     lambda fixture: {'items': [{'product_info_id': item.product_info_id, 'quantity': 3}
+                                for item in fixture['basket_items'][:2]]}, False),
+    (BasketView, 'delete', 'basket', 'buyer',
+     lambda fixture: {'items': ','.join(str(item.id) for item in fixture['basket_items'][:2])}, False),
+    (OrderView, 'post', 'order', 'buyer',
+     lambda fixture: {'id': str(fixture['basket'].id), 'contact': fixture['contact'].id}, False),
+    (ContactView, 'post', 'user-contact', 'buyer',
+     lambda fixture: {'city': 'Казань', 'street': 'Баумана', 'phone': '456'}, False),
+    (PartnerState, 'post', 'partner-state', 'partner', lambda fixture: {'state': 'false'}, False),
+    (PartnerUpdate, 'post', 'partner-update', 'partner',
+     lambda fixture: {'url': 'http://example.com/shop.yaml'}, False),
+    (PartnerStock, 'post', 'partner-stock', 'partner',
+     lambda fixture: {'items': [[index, 500, 600, 7] for index in range(len(fixture['orders']))]}, True),
+    (PartnerOrderState, 'post', 'partner-orders-state', 'partner',
+     lambda fixture: {'ids': fixture['orders'], 'state': 'confirmed'}, True),
+)
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Число запросов каждого endpoint не превышает query_budget его view,
+    а у списков не зависит от объёма данных. При превышении печатается весь SQL запроса.
+    """
+
+    SIZES = (3, 30)
+
+    def seed(self, size):
+        """Каталог из size товаров в двух магазинах, size заказов покупателя и корзина из size позиций."""
+        infos = create_catalog(products=size)
+        refresh_offers(info.product_id for info in infos)
+        for info in infos:
+            record_prices(info.shop_id, {info.external_id: (info.price, info.price_rrc, info.quantity)})
+        buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='password',
+                                         is_active=True)
+        partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop',
+                                           is_active=True)
+        partner_shop = Shop.objects.get(id=infos[0].shop_id)
+        partner_shop.user = partner
+        partner_shop.save()
+        contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', phone='123')
+        own_shop, other_shop = infos[:size], infos[size:]
+        orders = []
+        for i in range(size):
+            order = Order.objects.create(user=buyer, state='new', contact=contact)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=own_shop[i], quantity=1),
+                                           OrderItem(order=order, product_info=other_shop[i], quantity=2)])
+            # заказ своего магазина идёт первым: его магазин создан раньше
+            orders.append(split_order(order.id, buyer.id, contact.id, 'new')[0])
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(id=10 ** 6 + i, user=buyer, shop_id=partner_shop.id, state='delivered',
+                          dt=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc), total=100,
+                          items=[{'product_info': own_shop[i].id, 'quantity': 1, 'price': 100}])
+            for i in range(size)])
+        basket = Order.objects.create(user=buyer, state='basket')
+        basket_items = OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=info, quantity=1)
+                                                      for info in own_shop])
+        return {'buyer': Token.objects.create(user=buyer), 'partner': Token.objects.create(user=partner),
+                'contact': contact, 'basket': basket, 'basket_items': basket_items, 'other_shop': other_shop,
+                'orders': orders,
+                'price_list': price_list(partner_shop.name, size)}
+
+    def measure(self, size, method, url_name, client_name, data):
+        """Засевает данные размера size, выполняет запрос и откатывает всё обратно."""
+        with transaction.atomic():
+            fixture = self.seed(size)
+            client = APIClient()
+            if client_name:
+                client.credentials(HTTP_AUTHORIZATION=f'Token {fixture[client_name].key}')
+            payload = data(fixture) if data else None
+            cache.clear()
+            category_index.clear()
+            with patch('backend.views.new_order'), \
+                    patch('backend.tasks.get', return_value=Mock(content=fixture['price_list'])), \
+                    CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)(reverse(f'backend:{url_name}'), payload, format='json')
+            transaction.set_rollback(True)
+        self.assertLess(response.status_code, 300, response.content)
+        return queries.captured_queries
+
+    @staticmethod
+    def format_queries(queries):
+        return '\n'.join(f'{number}. {query["sql"]}' for number, query in enumerate(queries, 1))
+
+    def test_query_budgets(self):
+        for view_class, method, url_name, client_name, data, is_list in QUERY_BUDGET_ENDPOINTS:
+            with self.subTest(view=view_class.__name__, method=method):
+                budget = view_class.query_budget[method]
+                counts = {}
+                for size in self.SIZES:
+                    queries = self.measure(size, method, url_name, client_name, data)
+                    counts[size] = len(queries)
+                    self.assertLessEqual(
+                        len(queries), budget,
+                        f'{view_class.__name__}.{method}: {len(queries)} запросов при размере {size}, '
+                        f'бюджет {budget}\n{self.format_queries(queries)}')
+                if is_list:
+                    self.assertEqual(len(set(counts.values())), 1,
+                                     f'{view_class.__name__}.{method}: число запросов растёт с объёмом данных '
+                                     f'{counts}\n{self.format_queries(queries)}')
+
+
+class GenerateDataCommandTest(TestCase):
+    def test_generates_database(self):
+        call_command('generate_data', shops=2, products=20, offers=10, users=5, orders=8, batch_size=7,
+                     stdout=io.StringIO())
+        self.assertEqual(Shop.objects.count(), 2)
+        self.assertEqual(ProductInfo.objects.count(), 20)
+        self.assertTrue(ProductParameter.objects.exists())
+        self.assertEqual(Order.objects.count(), 8)
+        self.assertEqual(OrderItem.objects.values('order').distinct().count(), 8)
+
+    def test_reuses_parameters_and_refuses_second_run(self):
+        Parameter.objects.create(name='Цвет')
+        call_command('generate_data', shops=1, products=5, offers=5, users=1, orders=1, stdout=io.StringIO())
+        self.assertEqual(Parameter.objects.filter(name='Цвет').count(), 1)
+        with self.assertRaises(CommandError):
+            call_command('generate_data', shops=1, products=5, offers=5, users=1, orders=1, stdout=io.StringIO())
+        self.assertEqual(Shop.objects.count(), 1)
+
+    def test_same_seed_same_feed(self):
+        feeds = []
+        for extension in ('yaml', 'json', 'yaml'):
+            with tempfile.NamedTemporaryFile(suffix=f'.{extension}') as file:
+                call_command('generate_data', feed=file.name, feed_size=30, stdout=io.StringIO())
+                feeds.append(parse_price_list(file.read()))
+        self.assertEqual(feeds[0], feeds[1])
+        self.assertEqual(feeds[0], feeds[2])
+        self.assertEqual(len(feeds[0]['goods']), 30)
+
+        user = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        shop = import_price_list(user.id, feeds[0])
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 30)
+
+
+class SlowProfilerTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        create_catalog()
+        category_index.clear()
+
+    def profile_files(self):
+        return sorted(os.listdir(self.directory))
+
+    @override_settings(SLOW_PROFILER_ENABLED=True, SLOW_PROFILER_THRESHOLD_MS=0, SLOW_PROFILER_INTERVAL_MS=1)
+    def test_slow_request_saves_speedscope_profile(self):
+        with self.settings(SLOW_PROFILER_DIR=self.directory):
+            self.client.get(reverse('backend:categories'))
+        [name] = self.profile_files()
+        self.assertTrue(name.startswith('request-') and name.endswith('.speedscope.json'))
+        with open(os.path.join(self.directory, name), encoding='utf-8') as file:
+            profile = json.load(file)
+        self.assertEqual(profile['metadata']['name'], 'backend:categories')
+        self.assertEqual(profile['metadata']['status'], 200)
+        # версия каталога и сборка индекса категорий
+        self.assertEqual(profile['metadata']['queries'], 4)
+        samples = profile['profiles'][0]
+        self.assertEqual(len(samples['samples']), len(samples['weights']))
+        for stack in samples['samples']:
+            self.assertTrue(all(0 <= index < len(profile['shared']['frames']) for index in stack))
+
+    @override_settings(SLOW_PROFILER_ENABLED=True, SLOW_PROFILER_THRESHOLD_MS=60000)
+    def test_fast_request_is_not_saved(self):
+        with self.settings(SLOW_PROFILER_DIR=self.directory):
+            self.client.get(reverse('backend:categories'))
+        self.assertEqual(self.profile_files(), [])
+
+    @override_settings(SLOW_PROFILER_ENABLED=True, SLOW_PROFILER_THRESHOLD_MS=0, SLOW_PROFILER_FORMAT='collapsed')
+    def test_collapsed_stacks(self):
+        with self.settings(SLOW_PROFILER_DIR=self.directory):
+            session = start_session()
+            session.add(sys._getframe(), max_depth=128, max_samples=10)
+            session.add(sys._getframe(), max_depth=128, max_samples=10)
+            path = finish_session(session, 'task', 'new_order', task_id='1')
+        with open(path, encoding='utf-8') as file:
+            [line] = file.read().splitlines()
+        stack, count = line.rsplit(' ', 1)
+        self.assertEqual(count, '2')
+        self.assertRegex(stack, r';test_collapsed_stacks \(backend/tests\.py:\d+\)$')
+        self.assertIn('task-', os.path.basename(path))
+        with open(path.replace('.collapsed.txt', '.meta.json'), encoding='utf-8') as file:
+            self.assertEqual(json.load(file)['name'], 'new_order')
+
+
+class LoggingPipelineTest(TestCase):
+    def make_record(self, message, level=logging.ERROR, exc_info=None, **extra):
+        record = logging.LogRecord('backend.test', level, __file__, 1, message, None, exc_info)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        request = RequestFactory().get('/api/v1/basket')
+        data = json.loads(JsonFormatter().format(self.make_record('ошибка', status_code=500, request=request)))
+        self.assertEqual(data['level'], 'ERROR')
+        self.assertEqual(data['message'], 'ошибка')
+        self.assertEqual((data['status_code'], data['method'], data['path']), (500, 'GET', '/api/v1/basket'))
+
+    def test_queue_handler_drops_when_full(self):
+        handler = BackgroundQueueHandler(queue.Queue(1))
+        handler.handle(self.make_record('первая'))
+        handler.handle(self.make_record('вторая'))
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.get_nowait().msg, 'первая')
+
+    def test_configure_moves_handlers_to_listener(self):
+        records = []
+        logger = logging.getLogger('backend.test.pipeline')
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                records.append((threading.current_thread(), record.getMessage()))
+
+        configure_logging({'version': 1, 'disable_existing_loggers': False,
+                           'handlers': {'collect': {'()': lambda: Collect()}},
+                           'loggers': {'backend.test.pipeline': {'handlers': ['collect'], 'level': 'INFO'}}})
+        self.addCleanup(stop_listeners)
+        self.assertIsInstance(logger.handlers[0], BackgroundQueueHandler)
+        logger.info('заказ %s', 42)
+        stop_listeners()
+        self.assertEqual(len(records), 1)
+        self.assertNotEqual(records[0][0], threading.current_thread())
+        self.assertEqual(records[0][1], 'заказ 42')
+
+    @patch.dict(rollbar.SETTINGS, {'access_token': 'test'})
+    def test_rollbar_batches_duplicates(self):
+        handler = BatchingRollbarHandler(flush_interval=60)
+        handler.setLevel(logging.ERROR)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            exc_info = sys.exc_info()
+        for _ in range(3):
+            handler.handle(self.make_record('сбой импорта', exc_info=exc_info))
+        handler.handle(self.make_record('другая ошибка'))
+        handler.handle(self.make_record('предупреждение', level=logging.WARNING))
+        with patch('rollbar.report_exc_info') as report_exc_info, patch('rollbar.report_message') as report_message:
+            handler.flush()
+        self.assertEqual(report_exc_info.call_count, 1)
+        self.assertEqual(report_exc_info.call_args.kwargs['extra_data']['occurrences'], 3)
+        self.assertEqual(report_message.call_count, 1)
+
+
+class CeleryQueuesTest(TestCase):
+    def test_routing(self):
+        router = celery_app.amqp.router
+        for task_name, queue_name in (('new_user_registered', 'emails'), ('new_order', 'emails'),
+                                      ('do_import', 'imports'), ('backend.tasks.generate_thumbnails', 'media')):
+            self.assertEqual(router.route({}, task_name)['queue'].name, queue_name)
+        self.assertTrue(celery_app.conf.task_acks_late)
+        self.assertTrue(new_order.ignore_result)
+        self.assertFalse(do_import.ignore_result)
+
+    def test_redelivered_task_runs_once(self):
+        cache.clear()
+        user = User.objects.create_user(username='buyer', email='buyer@example.com')
+        new_order.apply(kwargs={'user_id': user.id}, task_id='redelivered')
+        new_order.apply(kwargs={'user_id': user.id}, task_id='redelivered')
+        new_order.apply(kwargs={'user_id': user.id}, task_id='another')
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_eager_mode_without_redis(self):
+        # CELERY_EAGER=1 — единственная переменная: ни брокер, ни кэш, ни cachalot не ходят в Redis
+        with patch.dict(os.environ, {'CELERY_EAGER': '1'}):
+            eager = runpy.run_path(os.path.join(settings.BASE_DIR, 'orders', 'settings.py'))
+        self.assertEqual(eager['CELERY_BROKER_URL'], 'memory://')
+        self.assertFalse(eager['CACHALOT_ENABLED'])
+        user = User.objects.create_user(username='buyer', email='buyer@example.com')
+        with override_settings(CACHES=eager['CACHES']), \
+                patch('django_redis.cache.RedisCache.get', side_effect=ConnectionError):
+            new_order.apply(kwargs={'user_id': user.id}, task_id='eager')
+            new_order.apply(kwargs={'user_id': user.id}, task_id='eager')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_partner_update_enqueues_import(self):
+        user = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        client = APIClient()
+        client.force_authenticate(user)
+        with patch('backend.views.do_import.delay', return_value=Mock(id='import-1')) as delay:
+            response = client.post(reverse('backend:partner-update'), {'url': 'http://example.com/shop.yaml'})
+        self.assertEqual(response.json(), {'Status': True, 'Task': 'import-1'})
+        delay.assert_called_once_with(user.id, 'http://example.com/shop.yaml')
+
+    def test_import_task_returns_shop(self):
+        user = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        with patch('backend.tasks.get', return_value=Mock(content=PRICE_LIST.encode())):
+            result = do_import.apply(args=(user.id, 'http://example.com/shop.yaml'))
+        self.assertEqual(result.get(), {'shop_id': Shop.objects.get(user=user).id})
+
+
+@override_settings(TASK_METRICS_ENABLED=True)
+class TaskMetricsTest(TestCase):
+    def setUp(self):
+        from celery.signals import before_task_publish, task_prerun, task_postrun
+
+        cache.clear()
+        task_metrics.connect_task_signals()
+        self.addCleanup(before_task_publish.disconnect, dispatch_uid='task-metrics-publish')
+        self.addCleanup(task_prerun.disconnect, dispatch_uid='task-metrics-prerun')
+        self.addCleanup(task_postrun.disconnect, dispatch_uid='task-metrics-postrun')
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com')
+
+    def test_runtime_wait_and_retries(self):
+        new_order.apply(kwargs={'user_id': self.user.id}, headers={'published_at': time.time() - 2})
+        with patch('backend.tasks.EmailMultiAlternatives.send', side_effect=[SMTPException, 1]):
+            new_order.apply(kwargs={'user_id': self.user.id})
+
+        histograms, counters = task_metrics.snapshot(['new_order'])
+        labels = (('task', 'new_order'),)
+        self.assertEqual(histograms[('celery_task_runtime_seconds', labels)].count, 3)
+        wait = histograms[('celery_task_queue_wait_seconds', labels)]
+        self.assertEqual(wait.count, 1)
+        self.assertGreaterEqual(wait.sum, 2)
+        self.assertEqual(counters[('celery_task_total', (('state', 'success'),) + labels)], 2)
+        self.assertEqual(counters[('celery_task_total', (('state', 'retry'),) + labels)], 1)
+
+    def test_publish_header_and_prometheus(self):
+        headers = {}
+        task_metrics._before_publish(headers=headers)
+        self.assertAlmostEqual(headers['published_at'], time.time(), delta=5)
+
+        new_order.apply(kwargs={'user_id': self.user.id})
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('backend:metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE celery_task_runtime_seconds histogram', body)
+        self.assertIn('celery_task_total{state="success",task="new_order"} 1', body)
+
+        out = io.StringIO()
+        call_command('task_stats', '--once', stdout=out)
+        row = next(line for line in out.getvalue().splitlines() if line.startswith('new_order'))
+        self.assertEqual(row.split()[1:4], ['1', '0', '0'])
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class PartnerExportTest(TestCase):
+    def setUp(self):
+        infos = create_catalog(products=5)
+        partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        Shop.objects.filter(id=infos[0].shop_id).update(user=partner)
+        buyer = User.objects.create_user(username='buyer', email='buyer@example.com')
+        contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', phone='123')
+        for state in ('new', 'delivered', 'basket'):
+            order = Order.objects.create(user=buyer, state=state, contact=contact)
+            # позиция чужого магазина в выгрузку не попадает
+            OrderItem.objects.bulk_create([OrderItem(order=order, product_info=infos[0], quantity=2),
+                                           OrderItem(order=order, product_info=infos[5], quantity=1)])
+            if state != 'basket':
+                split_order(order.id, buyer.id, contact.id, state)
+        self.client = APIClient()
+        self.client.force_authenticate(partner)
+
+    def export(self, name, export_format, **params):
+        response = self.client.get(reverse(f'backend:partner-{name}-export', args=[export_format]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('orders', 'csv'))))
+        self.assertEqual([row['state'] for row in rows], ['new', 'delivered'])
+        self.assertEqual(rows[0]['sum'], '200')
+        self.assertEqual(rows[0]['city'], 'Москва')
+        rows = self.export('orders', 'ndjson', state='delivered').splitlines()
+        self.assertEqual([json.loads(row)['state'] for row in rows], ['delivered'])
+
+    def test_orders_since_date(self):
+        today = timezone.localdate()
+        # дата без времени — полночь текущей зоны, без предупреждения о naive datetime
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            self.assertEqual(len(self.export('orders', 'ndjson', since=today.isoformat()).splitlines()), 2)
+            self.assertEqual(self.export('orders', 'ndjson', since=str(today + datetime.timedelta(days=1))), '')
+        self.assertEqual(self.client.get(reverse('backend:partner-orders-export', args=['csv']),
+                                         {'since': 'вчера'}).status_code, 400)
+
+    def test_catalog_ndjson_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = self.export('catalog', 'ndjson').splitlines()
+        offers = [json.loads(line) for line in lines]
+        self.assertEqual([offer['external_id'] for offer in offers], [0, 1, 2, 3, 4])
+        self.assertEqual(offers[1]['parameters'], {'Цвет': '1', 'Вес': '1'})
+        # магазин + 5 предложений порциями по 2: курсор и по запросу параметров на порцию
+        self.assertLessEqual(len(queries), 5)
+        self.assertIn('Цвет=0; Вес=0', self.export('catalog', 'csv'))
+
+    def test_streams_under_asgi(self):
+        response = self.client.get(reverse('backend:partner-catalog-export', args=['csv']))
+
+        async def consume(queries):
+            # так отдаёт ответ ASGIHandler: через __aiter__, а не streaming_content
+            parts = []
+            async for part in response:
+                parts.append((part, len(queries)))
+            return parts
+
+        with CaptureQueriesContext(connection) as queries, warnings.catch_warnings():
+            warnings.simplefilter('error')
+            parts = async_to_sync(consume)(queries)
+        # заголовок ушёл до первого запроса к базе, строки — следующими порциями
+        self.assertEqual(parts[0], (b'id,external_id,model,product,category,price,price_rrc,quantity,parameters\r\n', 0))
+        self.assertGreater(len(parts), 1)
+        self.assertIn('Цвет=0; Вес=0', b''.join(part for part, _ in parts).decode())
+
+    def test_rejects_buyers_and_unknown_format(self):
+        self.assertEqual(self.client.get(reverse('backend:partner-orders-export', args=['xml'])).status_code, 400)
+        self.client.force_authenticate(User.objects.get(username='buyer'))
+        self.assertEqual(self.client.get(reverse('backend:partner-orders-export', args=['csv'])).status_code, 403)
+
+
+class PartnerOrderStateTest(TestCase):
+    def setUp(self):
+        infos = create_catalog(products=2)
+        self.partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        Shop.objects.filter(id=infos[0].shop_id).update(user=self.partner)
+        self.orders = {}
+        for index, state in enumerate(('new', 'new', 'sent', 'basket')):
+            buyer = User.objects.create_user(username=f'buyer{index % 2}', email=f'buyer{index % 2}@example.com') \
+                if index < 2 else User.objects.get(username='buyer0')
+            order = Order.objects.create(user=buyer, state=state, shop_id=infos[0].shop_id)
+            OrderItem.objects.create(order=order, product_info=infos[0], quantity=1)
+            self.orders[index] = order
+        self.foreign = Order.objects.create(user=User.objects.get(username='buyer0'), state='new',
+                                            shop_id=infos[2].shop_id)
+        OrderItem.objects.create(order=self.foreign, product_info=infos[2], quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+
+    def post(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('backend:partner-orders-state'), data, format='json')
+
+    def test_bulk_transition(self):
+        ids = [order.id for order in self.orders.values()] + [self.foreign.id]
+        response = self.post({'ids': ids, 'state': 'confirmed'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['Обновлено объектов'], 2)
+        self.assertEqual(set(response.json()['Errors']), {str(self.orders[2].id), str(self.orders[3].id),
+                                                          str(self.foreign.id)})
+        states = dict(Order.objects.values_list('id', 'state'))
+        self.assertEqual([states[self.orders[index].id] for index in range(4)],
+                         ['confirmed', 'confirmed', 'sent', 'basket'])
+        self.assertEqual(states[self.foreign.id], 'new')
+        # одно письмо на покупателя
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['buyer0@example.com', 'buyer1@example.com'])
+
+    def test_validation(self):
+        self.assertEqual(self.post({'ids': '1,2', 'state': 'basket'}).status_code, 400)
+        self.assertEqual(self.post({'ids': 'a,b', 'state': 'sent'}).status_code, 400)
+        response = self.post({'ids': str(self.orders[2].id), 'state': 'delivered'})
+        self.assertEqual(response.json()['Обновлено объектов'], 1)
+        self.client.force_authenticate(User.objects.get(username='buyer0'))
+        self.assertEqual(self.post({'ids': '1', 'state': 'sent'}).status_code, 403)
+
+
+class PartnerStockTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(products=3)
+        self.partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        Shop.objects.filter(id=self.infos[0].shop_id).update(user=self.partner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+
+    def post(self, items):
+        return self.client.post(reverse('backend:partner-stock'), {'items': items}, format='json')
+
+    def test_updates_changed_rows_of_own_shop(self):
+        version = Shop.objects.get(id=self.infos[0].shop_id).catalog_version
+        # позиция 0 не меняется, позиции 99 нет
+        response = self.post([[0, 100, 120, 10], [1, 150, 160, 0], [2, 90, 95, 3], [99, 1, 1, 1]])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['Обновлено объектов'], 2)
+        self.assertEqual(response.json()['Не найдено'], [99])
+        own = ProductInfo.objects.filter(shop_id=self.infos[0].shop_id).order_by('external_id')
+        self.assertEqual([(info.price, info.price_rrc, info.quantity) for info in own],
+                         [(100, 120, 10), (150, 160, 0), (90, 95, 3)])
+        # у другого магазина те же external_id, но он не затронут
+        self.assertEqual(ProductInfo.objects.get(id=self.infos[4].id).price, 101)
+        self.assertEqual(Shop.objects.get(id=self.infos[0].shop_id).catalog_version, version + 1)
+
+    def test_refreshes_offers_only_when_summary_changes(self):
+        # позиции 0 и 2: рекомендуемая цена и остаток без перехода через ноль, 1 закончилась
+        with patch('backend.imports.refresh_offers') as refresh:
+            self.post([[0, 100, 130, 10], [1, 101, 120, 0], [2, 102, 120, 4]])
+        refresh.assert_called_once_with({self.infos[1].product_id})
+        # цена позиции не в наличии сводку не меняет
+        with patch('backend.imports.refresh_offers') as refresh:
+            self.post([[1, 200, 120, 0]])
+        refresh.assert_called_once_with(set())
+        refresh_offers([self.infos[1].product_id])
+        summary = ProductOffers.objects.get(product_id=self.infos[1].product_id)
+        self.assertEqual((summary.min_price, summary.offer_count, summary.in_stock_count), (101, 2, 1))
+
+    def test_validation(self):
+        self.assertEqual(self.post([[1, 150, 160]]).status_code, 400)
+        self.assertEqual(self.post([[1, -5, 160, 1]]).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+class WebhookDeliveryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.infos = create_catalog(products=2)
+        partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        Shop.objects.filter(id=self.infos[0].shop_id).update(user=partner)
+        self.partner = APIClient()
+        self.partner.force_authenticate(partner)
+
+        self.batches = []
+        self.receiver = make_receiver(on_batch=self.batches.append)
+        threading.Thread(target=self.receiver.serve_forever, daemon=True).start()
+        self.addCleanup(self.receiver.server_close)
+        self.addCleanup(self.receiver.shutdown)
+
+        response = self.partner.post(reverse('backend:partner-webhooks'), {
+            'url': f'http://127.0.0.1:{self.receiver.server_port}/hook', 'events': 'order.created, order.state_changed'},
+            format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.receiver.secret = response.json()['secret']
+
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com')
+        self.contact = Contact.objects.create(user=self.buyer, city='Москва', street='Тверская', phone='123')
+
+    def place_order(self):
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        # позиция своего магазина и позиция чужого
+        OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=self.infos[0], quantity=2),
+                                       OrderItem(order=basket, product_info=self.infos[2], quantity=1)])
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('backend:order'), {'id': str(basket.id), 'contact': self.contact.id},
+                                   format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return Order.objects.get(parent=basket, shop_id=self.infos[0].shop_id)
+
+    def test_order_events_are_signed_and_batched(self):
+        orders = [self.place_order(), self.place_order()]
+        self.assertEqual([len(batch) for batch in self.batches], [1, 1])
+        event = self.batches[0][0]
+        self.assertEqual((event['event'], event['order_id'], event['state']), ('order.created', orders[0].id, 'new'))
+        self.assertEqual(event['items'], [{'external_id': 0, 'quantity': 2, 'price': 100}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.partner.post(reverse('backend:partner-orders-state'),
+                              {'ids': [order.id for order in orders], 'state': 'confirmed'}, format='json')
+        self.assertEqual([(event['event'], event['state']) for event in self.batches[2]],
+                         [('order.state_changed', 'confirmed')] * 2)
+        self.assertFalse(WebhookEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_failed_delivery_keeps_events(self):
+        self.receiver.secret = 'другой ключ'
+        self.place_order()
+        self.assertEqual(self.batches, [])
+        pending = WebhookEvent.objects.filter(delivered_at__isnull=True)
+        self.assertEqual(pending.count(), 1)
+
+        # ключ планирования продлевается каждой неудачной попыткой и не истекает посреди повторов
+        key = SCHEDULE_KEY.format(pending.get().webhook_id)
+        cache.delete(key)
+        deliver_webhooks.apply(args=(pending.get().webhook_id,))
+        self.assertIsNotNone(cache.get(key))
+
+        self.receiver.secret = None
+        deliver_webhooks.apply(args=(pending.get().webhook_id,))
+        self.assertEqual(len(self.batches), 1)
+        self.assertFalse(pending.exists())
+
+    def test_beat_reschedules_exhausted_delivery(self):
+        self.receiver.secret = 'другой ключ'
+        self.place_order()
+        key = SCHEDULE_KEY.format(WebhookEvent.objects.get().webhook_id)
+        # пока задача запланирована, периодическая задача вторую не ставит
+        self.assertEqual(reschedule_webhooks.apply().get(), 0)
+
+        # повторы исчерпаны, ключ истёк, события так и лежат недоставленными
+        cache.delete(key)
+        self.receiver.secret = None
+        self.assertEqual(reschedule_webhooks.apply().get(), 1)
+        self.assertEqual(len(self.batches), 1)
+        self.assertFalse(WebhookEvent.objects.filter(delivered_at__isnull=True).exists())
+
+
+class OrderSplitTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(products=2)
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com')
+        self.contact = Contact.objects.create(user=self.buyer, city='Москва', street='Тверская', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def checkout(self, items):
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=info, quantity=quantity)
+                                       for info, quantity in items])
+        response = self.client.post(reverse('backend:order'), {'id': str(basket.id), 'contact': self.contact.id},
+                                    format='json')
+        return basket, response
+
+    def test_multi_shop_basket_is_split(self):
+        basket, response = self.checkout([(self.infos[0], 2), (self.infos[1], 1), (self.infos[3], 3)])
+        self.assertEqual(response.status_code, 200, response.content)
+        basket.refresh_from_db()
+        self.assertEqual((basket.state, basket.shop_id, basket.total), ('new', None, 2 * 100 + 101 + 3 * 101))
+        sub_orders = {order.shop_id: order for order in basket.sub_orders.all()}
+        self.assertEqual({shop_id: order.total for shop_id, order in sub_orders.items()},
+                         {self.infos[0].shop_id: 301, self.infos[3].shop_id: 303})
+        self.assertEqual(sub_orders[self.infos[0].shop_id].ordered_items.count(), 2)
+        self.assertFalse(basket.ordered_items.exists())
+
+        # покупатель видит заказы магазинов, поставщик — только свой
+        listed = self.client.get(reverse('backend:order')).json()
+        self.assertEqual(sorted(order['id'] for order in listed), sorted(order.id for order in sub_orders.values()))
+        partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        Shop.objects.filter(id=self.infos[3].shop_id).update(user=partner)
+        self.client.force_authenticate(partner)
+        listed = self.client.get(reverse('backend:partner-orders')).json()
+        self.assertEqual([order['id'] for order in listed], [sub_orders[self.infos[3].shop_id].id])
+        self.assertEqual(listed[0]['total_sum'], 303)
+
+    def test_single_shop_and_empty_basket(self):
+        basket, response = self.checkout([(self.infos[0], 1)])
+        basket.refresh_from_db()
+        self.assertEqual((basket.shop_id, basket.total, basket.sub_orders.count()), (self.infos[0].shop_id, 100, 0))
+        basket, response = self.checkout([])
+        self.assertEqual(response.status_code, 400)
+        basket.refresh_from_db()
+        self.assertEqual(basket.state, 'basket')
+
+    def test_shop_with_orders_is_protected(self):
+        basket, _ = self.checkout([(self.infos[0], 1)])
+        with self.assertRaises(ProtectedError):
+            Shop.objects.get(id=self.infos[0].shop_id).delete()
+        self.assertEqual(Order.objects.get(id=basket.id).ordered_items.count(), 1)
+
+
+class OfferViewTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(shops=3, products=2)
+        refresh_offers(info.product_id for info in self.infos)
+        self.partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        Shop.objects.filter(id=self.infos[0].shop_id).update(user=self.partner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+        self.product_id = self.infos[0].product_id
+
+    def offers(self, **params):
+        response = self.client.get(reverse('backend:offers'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_offers_sorted_by_availability_and_price(self):
+        # у магазина 1 товар закончился, магазин 0 снизил цену
+        ProductInfo.objects.filter(id=self.infos[2].id).update(quantity=0)
+        refresh_offers([self.product_id])
+        self.client.post(reverse('backend:partner-stock'), {'items': [[0, 50, 120, 5]]}, format='json')
+
+        [product] = self.offers(product_id=str(self.product_id))
+        self.assertEqual((product['min_price'], product['offer_count'], product['in_stock_count']), (50, 3, 2))
+        self.assertEqual([(offer['shop'], offer['price'], offer['quantity']) for offer in product['offers']],
+                         [(self.infos[0].shop_id, 50, 5), (self.infos[4].shop_id, 100, 10),
+                          (self.infos[2].shop_id, 100, 0)])
+
+    def test_cheapest_list_follows_shop_state(self):
+        self.assertEqual([(row['product'], row['min_price']) for row in self.offers()],
+                         [(self.product_id, 100), (self.infos[1].product_id, 101)])
+        self.client.post(reverse('backend:partner-state'), {'state': 'false'}, format='json')
+        for row in self.offers():
+            self.assertEqual(row['offer_count'], 2)
+            self.assertNotIn(self.infos[0].shop_id, [offer['shop'] for offer in row['offers']])
+
+
+class CategoryIndexTest(TestCase):
+    def setUp(self):
+        category_index.clear()
+        self.user = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        other = create_catalog(shops=1, products=2)
+        self.other_shop_id = other[0].shop_id
+
+    def categories(self):
+        response = self.client.get(reverse('backend:categories'))
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['name']: row for row in response.json()['results']}
+
+    def import_price_list(self, count, categories=((224, 'Смартфоны 224'),)):
+        data = parse_price_list(price_list('Связной', count))
+        data['categories'] = [{'id': category_id, 'name': name} for category_id, name in categories]
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_price_list(self.user.id, data)
+
+    def test_import_updates_index_incrementally(self):
+        self.assertEqual(self.categories()['Смартфоны']['product_count'], 2)
+        shop = self.import_price_list(3)
+        # индекс уже обновлён импортом: запрос версии для ETag и больше ничего
+        with self.assertNumQueries(1):
+            rows = self.categories()
+        self.assertEqual(rows['Смартфоны']['shops'], [{'id': self.other_shop_id, 'product_count': 2}])
+        self.assertEqual(rows['Смартфоны 224']['product_count'], 3)
+        self.assertEqual(rows['Смартфоны 224']['shops'], [{'id': shop.id, 'product_count': 3}])
+
+        with patch('backend.category_index.build_index') as build_index:
+            self.import_price_list(1)
+            self.assertEqual(self.categories()['Смартфоны 224']['product_count'], 1)
+        build_index.assert_not_called()
+
+    def test_only_changed_links_are_written(self):
+        shop = self.import_price_list(2, categories=((224, 'Смартфоны 224'), (225, 'Планшеты')))
+        with CaptureQueriesContext(connection) as queries:
+            self.import_price_list(2, categories=((224, 'Смартфоны 224'), (226, 'Ноутбуки')))
+        link_writes = [query['sql'] for query in queries.captured_queries
+                       if 'backend_category_shops' in query['sql'] and not query['sql'].startswith('SELECT')]
+        self.assertEqual(len(link_writes), 2, link_writes)
+        self.assertEqual(sorted(shop.categories.values_list('id', flat=True)), [224, 226])
+        rows = self.categories()
+        self.assertEqual(rows['Планшеты']['shops'], [])
+        self.assertEqual(rows['Смартфоны 224']['shops'], [{'id': shop.id, 'product_count': 2}])
+
+    def test_concurrent_imports_drop_index(self):
+        self.categories()
+        category_id = Category.objects.get(name='Смартфоны').id
+        # два импорта начались с одной версии, второй закоммичен раньше, чем первый обновил индекс
+        base = category_index.index_version()
+        bump_catalog_version(category_ids=[category_id])
+        expected = category_index.index_version()
+        bump_catalog_version(category_ids=[category_id])
+        category_index.update_shop_index(self.other_shop_id, base, expected, {}, [category_id])
+        self.assertIsNone(cache.get(category_index.CACHE_KEY))
+        self.assertEqual(self.categories()['Смартфоны']['product_count'], 2)
+
+    def test_other_catalog_change_rebuilds_index(self):
+        Category.objects.get(name='Смартфоны').shops.add(self.other_shop_id)
+        self.categories()
+        Shop.objects.filter(id=self.other_shop_id).update(state=False)
+        bump_shop_catalog(self.other_shop_id)
+        self.assertEqual(self.categories()['Смартфоны']['product_count'], 0)
+
+
+class OrderArchiveTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(products=2)
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com')
+        self.contact = Contact.objects.create(user=self.buyer, city='Москва', street='Тверская', phone='123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.old = timezone.now() - datetime.timedelta(days=100)
+
+    def checkout(self, *infos):
+        basket = Order.objects.create(user=self.buyer, state='basket')
+        OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=info, quantity=2) for info in infos])
+        self.client.post(reverse('backend:order'), {'id': str(basket.id), 'contact': self.contact.id},
+                         format='json')
+        return basket, list(Order.objects.filter(parent=basket).order_by('shop_id'))
+
+    def test_completed_orders_move_to_archive(self):
+        basket, (first, second) = self.checkout(self.infos[0], self.infos[2])
+        Order.objects.filter(id=first.id).update(state='delivered', dt=self.old)
+        Order.objects.filter(id=second.id).update(state='canceled', dt=self.old)
+        recent, _ = self.checkout(self.infos[1])
+        Order.objects.filter(id=recent.id).update(state='delivered')
+
+        self.assertEqual(archive_orders(days=30, batch_size=1), 2)
+        # общий заказ уходит вместе с последним заказом магазина
+        self.assertEqual(set(Order.objects.exclude(state='basket').values_list('id', flat=True)), {recent.id})
+        self.assertEqual(OrderItem.objects.filter(order_id__in=[first.id, second.id]).count(), 0)
+        self.assertEqual(ArchivedOrder.objects.get(id=basket.id).total, 2 * 100 + 2 * 100)
+        archived = ArchivedOrder.objects.get(id=first.id)
+        self.assertEqual((archived.state, archived.total, archived.contact['city']), ('delivered', 200, 'Москва'))
+        self.assertEqual(archived.items, [{'product_info': self.infos[0].id, 'external_id': 0, 'product': 'Товар 0',
+                                           'shop': self.infos[0].shop_id, 'quantity': 2, 'price': 100}])
+
+        response = self.client.get(reverse('backend:order-archive'))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(sorted(order['id'] for order in response.json()['results']), [first.id, second.id])
+        response = self.client.get(reverse('backend:order-archive'), {'id': second.id})
+        [order] = response.json()['results']
+        self.assertEqual((order['state'], order['total_sum'], order['shop']), ('canceled', 200, self.infos[2].shop_id))
+        self.assertEqual([order['id'] for order in self.client.get(reverse('backend:order')).json()], [recent.id])
+
+    def test_parent_waits_for_all_shop_orders(self):
+        basket, (first, second) = self.checkout(self.infos[0], self.infos[2])
+        Order.objects.filter(id=first.id).update(state='delivered', dt=self.old)
+        Order.objects.filter(id=second.id).update(state='sent', dt=self.old)
+        self.assertEqual(archive_orders(days=30), 1)
+        self.assertTrue(Order.objects.filter(id=basket.id).exists())
+        self.assertFalse(ArchivedOrder.objects.filter(id=basket.id).exists())
+
+    def test_archive_survives_shop_deletion(self):
+        order, _ = self.checkout(self.infos[0])
+        Order.objects.filter(id=order.id).update(state='delivered', dt=self.old)
+        archive_orders(days=30)
+        Shop.objects.filter(id=self.infos[0].shop_id).delete()
+
+        [archived] = self.client.get(reverse('backend:order-archive')).json()['results']
+        self.assertEqual((archived['id'], archived['shop']), (order.id, self.infos[0].shop_id))
+
+
+class GarbageCollectionTest(TestCase):
+    def setUp(self):
+        self.infos = create_catalog(products=1)
+        self.now = timezone.now()
+
+    def basket(self, username, age, items=0):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com')
+        basket = Order.objects.create(user=user, state='basket')
+        OrderItem.objects.bulk_create([OrderItem(order=basket, product_info=info, quantity=1)
+                                       for info in self.infos[:items]])
+        Order.objects.filter(id=basket.id).update(dt=self.now - age)
+        return basket
+
+    def test_collects_baskets_tokens_and_profiles(self):
+        empty_old = self.basket('empty-old', datetime.timedelta(hours=30))
+        empty_fresh = self.basket('empty-fresh', datetime.timedelta(hours=1))
+        abandoned = self.basket('abandoned', datetime.timedelta(days=40), items=2)
+        active = self.basket('active', datetime.timedelta(days=5), items=1)
+        placed = self.basket('placed', datetime.timedelta(days=400), items=1)
+        Order.objects.filter(id=placed.id).update(state='delivered')
+
+        stale = ConfirmEmailToken.objects.create(user=active.user)
+        ConfirmEmailToken.objects.filter(id=stale.id).update(created_at=self.now - datetime.timedelta(days=4))
+        fresh = ConfirmEmailToken.objects.create(user=abandoned.user)
+        ResetPasswordToken.objects.create(user=active.user)
+        ResetPasswordToken.objects.update(created_at=self.now - datetime.timedelta(days=2))
+
+        orphan = User.objects.create_user(username='orphan', email='orphan@example.com')
+        Profile.objects.create(user=orphan)
+        Profile.objects.create(user=active.user)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM backend_user WHERE id = %s', [orphan.id])
+
+        # доставленное давно удаляется, недоставленное — нет, сколько бы ему ни было
+        webhook = Webhook.objects.create(shop_id=self.infos[0].shop_id, url='http://example.com/hook')
+        events = WebhookEvent.objects.bulk_create([
+            WebhookEvent(webhook=webhook, event='order.created', payload={}, delivered_at=delivered_at)
+            for delivered_at in (self.now - datetime.timedelta(days=10), self.now - datetime.timedelta(days=1), None)])
+        WebhookEvent.objects.update(created_at=self.now - datetime.timedelta(days=30))
+
+        report = collect_garbage()
+        self.assertEqual(report, {'baskets': 2, 'basket_items': 2, 'confirm_tokens': 1, 'reset_tokens': 1,
+                                  'profiles': 1, 'webhook_events': 1})
+        self.assertEqual(set(WebhookEvent.objects.values_list('id', flat=True)), {events[1].id, events[2].id})
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {empty_fresh.id, active.id, placed.id})
+        self.assertFalse(Order.objects.filter(id=empty_old.id).exists())
+        self.assertEqual(list(ConfirmEmailToken.objects.values_list('id', flat=True)), [fresh.id])
+        self.assertEqual(list(Profile.objects.values_list('user_id', flat=True)), [active.user_id])
+
+        # просроченный токен не подтверждает почту, даже если сборщик до него ещё не дошёл
+        ConfirmEmailToken.objects.filter(id=fresh.id).update(created_at=self.now - datetime.timedelta(days=4))
+        response = self.client.post(reverse('backend:user-register-confirm'),
+                                    {'email': abandoned.user.email, 'token': fresh.key})
+        self.assertFalse(response.json()['Status'])
+
+    @override_settings(GC_BATCH_SIZE=2, GC_MAX_BATCHES=1)
+    def test_batches_are_bounded(self):
+        for index in range(5):
+            self.basket(f'buyer{index}', datetime.timedelta(days=2))
+        self.assertEqual(collect_garbage()['baskets'], 2)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_basket_changed_after_selection_is_kept(self):
+        ordered = self.basket('ordered', datetime.timedelta(days=40), items=1)
+        refilled = self.basket('refilled', datetime.timedelta(hours=30))
+        batches = cleanup._batches
+
+        def checkout_during_batch(queryset):
+            for ids in batches(queryset):
+                # между выборкой и удалением корзину оформили или пополнили
+                if ordered.id in ids:
+                    Order.objects.filter(id=ordered.id).update(state='new')
+                if refilled.id in ids:
+                    OrderItem.objects.create(order=refilled, product_info=self.infos[0], quantity=1)
+                yield ids
+
+        with patch('backend.cleanup._batches', checkout_during_batch):
+            report = collect_garbage()
+        self.assertEqual((report['baskets'], report['basket_items']), (0, 0))
+        self.assertEqual(OrderItem.objects.filter(order_id__in=[ordered.id, refilled.id]).count(), 2)
+
+    def test_basket_activity_and_mutations(self):
+        user = User.objects.create_user(username='buyer', email='buyer@example.com')
+        client = APIClient()
+        client.force_authenticate(user)
+        # изменение и удаление позиций не создают пустую корзину
+        client.put(reverse('backend:basket'), {'items': [{'product_info_id': self.infos[0].id, 'quantity': 2}]},
+                   format='json')
+        client.delete(reverse('backend:basket'), {'items': '1'}, format='json')
+        self.assertFalse(Order.objects.filter(user=user).exists())
+
+        basket = self.basket('returning', datetime.timedelta(days=40), items=1)
+        client.force_authenticate(basket.user)
+        client.post(reverse('backend:basket'), {'items': [{'product_info': self.infos[1].id, 'quantity': 1}]},
+                    format='json')
+        collect_garbage()
+        self.assertEqual(Order.objects.get(id=basket.id).ordered_items.count(), 2)
+
+    def test_beat_schedule(self):
+        for entry in celery_app.conf.beat_schedule.values():
+            self.assertIn(entry['task'], celery_app.tasks)
+
+
+class PriceHistoryTest(TestCase):
+    def setUp(self):
+        self.partner = User.objects.create_user(username='partner', email='partner@example.com', type='shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+
+    def import_goods(self, *goods):
+        data = yaml.safe_load(price_list('Магазин', 0))
+        data['goods'] = [{'id': external_id, 'category': 224, 'model': f'model-{external_id}',
+                          'name': f'Товар {external_id}', 'price': price, 'price_rrc': price + 20,
+                          'quantity': quantity, 'parameters': {}}
+                         for external_id, price, quantity in goods]
+        return import_price_list(self.partner.id, data)
+
+    def history(self, shop, external_ids, **params):
+        response = self.client.get(reverse('backend:price-history'),
+                                   {'shop_id': shop.id, 'external_id': ','.join(map(str, external_ids)), **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['external_id']: row for row in response.json()}
+
+    def test_import_and_stock_append_changed_points(self):
+        shop = self.import_goods((1, 100, 5), (2, 200, 3), (3, 300, 0))
+        # позиция 1 не изменилась, 2 подешевела, 3 снята с продажи без остатка, 4 новая
+        self.import_goods((1, 100, 5), (2, 150, 3), (4, 400, 1))
+        self.client.post(reverse('backend:partner-stock'), {'items': [[1, 100, 120, 5], [4, 400, 420, 0]]},
+                         format='json')
+        # позиция 2 снята с продажи с остатком — в истории остаток обнуляется
+        self.import_goods((1, 100, 5), (4, 400, 0))
+
+        self.assertEqual(dict(PriceSeries.objects.values_list('external_id', 'count')), {1: 1, 2: 3, 3: 1, 4: 2})
+        history = self.history(shop, [4, 2, 1, 3, 99])
+        self.assertEqual(list(history), [4, 2, 1, 3])
+        self.assertEqual(history[2]['price'], [200, 150, 150])
+        self.assertEqual(history[2]['quantity'], [3, 3, 0])
+        self.assertEqual(history[4]['quantity'], [1, 0])
+        self.assertEqual(len(history[2]['dt']), 3)
+
+    def test_series_read_in_one_query_and_since(self):
+        shop = self.import_goods(*((external_id, 100, 1) for external_id in range(50)))
+        day = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        record_prices(shop.id, {external_id: (90, 110, 2) for external_id in range(50)}, at=day)
+        with self.assertNumQueries(1):
+            series = price_series(shop.id, list(range(50)))
+        self.assertEqual([row['price'] for row in series], [[100, 90]] * 50)
+
+        history = self.history(shop, [0, 1], since='2024-12-31')
+        self.assertEqual(history[0]['dt'][1], '2025-01-01T00:00:00+00:00')
+        self.assertEqual(history[1]['price'], [100, 90])
+        self.assertEqual(self.history(shop, [1], since='2025-01-01T00:00:01Z')[1]['price'], [100])
+
+    @patch('backend.price_history.CHUNK_POINTS', 2)
+    def test_full_chunks_are_not_rewritten(self):
+        shop = self.import_goods((1, 100, 5))
+        for price in (101, 102, 103, 104):
+            record_prices(shop.id, {1: (price, 120, 5)})
+        chunks = PriceSeries.objects.filter(shop=shop, external_id=1).order_by('chunk')
+        self.assertEqual([(chunk.chunk, chunk.count) for chunk in chunks], [(0, 2), (1, 2), (2, 1)])
+        first = bytes(chunks[0].points)
+        record_prices(shop.id, {1: (105, 120, 5)})
+        self.assertEqual(bytes(PriceSeries.objects.get(shop=shop, external_id=1, chunk=0).points), first)
+        self.assertEqual(price_series(shop.id, [1])[0]['price'], [100, 101, 102, 103, 104, 105])
+
+    def test_validation(self):
+        url = reverse('backend:price-history')
+        self.assertEqual(self.client.get(url, {'shop_id': 1}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'shop_id': 1, 'external_id': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'shop_id': 1, 'external_id': '1', 'since': 'вчера'}).status_code,
+                         400)
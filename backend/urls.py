@@ -4,7 +4,11 @@ from rest_framework.routers import DefaultRouter
 
 from backend import views
 from backend.views import PartnerUpdate, RegisterAccount, ConfirmAccount, LoginAccount, AccountDetails, CategoryView, \
-    ShopView, ProductInfoViewSet, BasketView, PartnerState, PartnerOrders, ContactView, OrderView, TestErrorView
+    ShopView, ProductInfoViewSet, BasketView, PartnerState, PartnerOrders, ContactView, OrderView, TestErrorView, \
+    PartnerOrdersExport, PartnerCatalogExport, PartnerOrderState, PartnerStock, \
+    PartnerWebhooks, OfferView, OrderArchiveView, PriceHistoryView
+from backend.async_views import AsyncPartnerUpdate, AsyncBasketView, AsyncOrderView
+from backend.metrics import metrics_view
 from drf_spectacular.views import SpectacularAPIView
 
 
@@ -27,13 +31,29 @@ urlpatterns = [
 
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/webhooks', PartnerWebhooks.as_view(), name='partner-webhooks'),
+    path('partner/stock', PartnerStock.as_view(), name='partner-stock'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
+    path('partner/orders/state', PartnerOrderState.as_view(), name='partner-orders-state'),
+    path('partner/orders/export/<str:export_format>', PartnerOrdersExport.as_view(), name='partner-orders-export'),
+    path('partner/catalog/export/<str:export_format>', PartnerCatalogExport.as_view(),
+         name='partner-catalog-export'),
 
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
+    path('offers', OfferView.as_view(), name='offers'),
+    path('prices/history', PriceHistoryView.as_view(), name='price-history'),
 
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
+    path('order/archive', OrderArchiveView.as_view(), name='order-archive'),
+
+    path('async/partner/update', AsyncPartnerUpdate.as_view(), name='async-partner-update'),
+    path('async/basket', AsyncBasketView.as_view(), name='async-basket'),
+    path('async/order', AsyncOrderView.as_view(), name='async-order'),
+
+    path('metrics', metrics_view, name='metrics'),
+
     path('auth/', include('social_django.urls', namespace='social')),
     path('test-error/', TestErrorView.as_view(), name='test-error'),
 
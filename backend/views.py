@@ -1,7 +1,11 @@
+import datetime
+
 from django.contrib.auth import authenticate
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
+from django.db import IntegrityError, router, transaction
+from django.db.models import Q
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from rest_framework import viewsets, generics,  status
 from rest_framework.authtoken.models import Token
@@ -11,21 +15,29 @@ from rest_framework.views import APIView
 from django.http import JsonResponse
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
-from requests import get
-from yaml import load as load_yaml, Loader
 from django.contrib.auth.password_validation import validate_password
 from rest_framework.response import Response
 
-from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken, User
+from backend.models import Shop, Category, Product, ProductInfo, Order, OrderItem, \
+    Contact, ConfirmEmailToken, User, ORDER_TRANSITIONS, Webhook, ProductOffers, ArchivedOrder
 from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderItemSerializer, OrderSerializer, ContactSerializer
-from backend.tasks import new_user_registered, new_order
+    OrderItemSerializer, ContactSerializer, FieldSelection, product_info_values, \
+    serialize_product_infos, serialize_orders, WebhookSerializer, serialize_archived_orders
+from backend.tasks import new_user_registered, new_order, orders_state_changed, do_import
+from backend import exports
+from backend.catalog import catalog_condition, bump_shop_catalog, product_catalog_shops, request_catalog_state
+from backend.category_index import category_index
+from backend.cleanup import confirm_token_cutoff
+from backend.imports import update_stock
+from backend.offers import refresh_shop_offers, product_offers
+from backend.ordering import place_order
+from backend.price_history import BATCH_SIZE as PRICE_HISTORY_LIMIT, price_series
+from backend.webhooks import emit_order_events
 
 from drf_spectacular.utils import extend_schema
 
 import rollbar
-from cachalot.decorators import cachalot
+from django.views.decorators.cache import cache_page
 
 
 
@@ -34,6 +46,18 @@ def str_to_bool(value):
     return str(value).lower() in ("true", "t", "yes", "y", "1")
 
 
+def parse_since(value):
+    """Дата или время ISO как aware datetime (дата — полночь текущей зоны); None, если формат неверный."""
+    since = parse_datetime(value) or parse_date(value)
+    if since is None:
+        return None
+    if not isinstance(since, datetime.datetime):
+        since = datetime.datetime.combine(since, datetime.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
 class RegisterAccount(APIView):
     """Для регистрации покупателей """
     throttle_scope = 'register'
@@ -89,7 +113,8 @@ class ConfirmAccount(APIView):
         # проверяем обязательные аргументы и подтверждает пользователя в системе.
         if {'email', 'token'}.issubset(request.data):
             token = ConfirmEmailToken.objects.filter(user__email=request.data['email'],
-                                                     key=request.data['token']).first()
+                                                     key=request.data['token'],
+                                                     created_at__gte=confirm_token_cutoff()).first()
             if token:
                 token.user.is_active = True
                 token.user.save()
@@ -105,6 +130,8 @@ class ConfirmAccount(APIView):
 class AccountDetails(generics.ListAPIView):
     """ Класс для работы данными пользователя """
 
+    # предельное число SQL-запросов по методам, проверяется QueryBudgetTest
+    query_budget = {'get': 4}
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
 
@@ -118,6 +145,8 @@ class AccountDetails(generics.ListAPIView):
 class LoginAccount(APIView):
     """Класс для авторизации пользователей"""
 
+    query_budget = {'post': 2}
+
     # Авторизация методом POST
     def post(self, request, *args, **kwargs):
         """Метод post проверяет наличие обязательных полей и создает token пользователю."""
@@ -144,6 +173,9 @@ class LoginAccount(APIView):
 class CategoryView(ListAPIView):
     """ Класс для просмотра категорий"""
 
+    query_budget = {'get': 4}
+    read_replica = True
+
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
@@ -151,15 +183,26 @@ class CategoryView(ListAPIView):
         request=CategorySerializer,
         responses={200: CategorySerializer},
     )
+    @catalog_condition(lambda request: Category.objects.all())
     def get(self, request):
-        """ Метод get возвращает список категорий. """
+        """ Метод get возвращает список категорий с числом товаров и предложений магазинов.
+        Список берётся из индекса категорий той же версии, что и ETag; shop_id оставляет
+        категории одного магазина. """
 
-        return super().get(request)
+        rows = category_index(request_catalog_state(request, lambda request: Category.objects.all()))['rows']
+        shop_id = request.query_params.get('shop_id')
+        if shop_id and shop_id.isdigit():
+            rows = [row for row in rows if any(shop['id'] == int(shop_id) for shop in row['shops'])]
+        return self.get_paginated_response(self.paginate_queryset(rows))
 
 
+@catalog_condition(lambda request: Shop.objects.all(), name='get')
 class ShopView(ListAPIView):
     """ Класс для просмотра списка магазинов """
 
+    query_budget = {'get': 3}
+    read_replica = True
+
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopSerializer
 
@@ -167,6 +210,8 @@ class ShopView(ListAPIView):
 class ProductInfoViewSet(viewsets.ReadOnlyModelViewSet):
     """ Класс для поиска товаров. """
 
+    query_budget = {'get': 6}
+    read_replica = True
     throttle_scope = 'anon'
     serializer_class = ProductInfoSerializer
     permission_classes = [IsAuthenticated]
@@ -200,10 +245,91 @@ class ProductInfoViewSet(viewsets.ReadOnlyModelViewSet):
 
         return queryset
 
+    @catalog_condition(product_catalog_shops)
+    def list(self, request, *args, **kwargs):
+        """Метод list отдаёт страницу товаров, собранную из values() без ModelSerializer.
+        Параметры fields и expand сокращают набор полей и запросов к базе."""
+
+        selection = FieldSelection.from_request(request)
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(
+            *product_info_values(selection))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_product_infos(page, selection))
+
+        return Response(serialize_product_infos(queryset, selection))
+
+
+@catalog_condition(lambda request: Shop.objects.all(), name='get')
+class OfferView(ListAPIView):
+    """Класс для сравнения предложений магазинов по товарам"""
+
+    query_budget = {'get': 4}
+    read_replica = True
+    throttle_scope = 'anon'
+
+    def get_queryset(self):
+        """Сводки товаров: product_id=1,2,3 — выбранные товары, иначе товары в наличии
+        (category_id сужает список) от самых дешёвых."""
+
+        queryset = ProductOffers.objects.values('product_id', 'product__name', 'product__category_id',
+                                                'min_price', 'offer_count', 'in_stock_count')
+        product_ids = self.request.query_params.get('product_id')
+        if product_ids:
+            return queryset.filter(product_id__in=[value for value in product_ids.split(',') if value.isdigit()]) \
+                .order_by('product_id')
+        queryset = queryset.filter(min_price__isnull=False)
+        category_id = self.request.query_params.get('category_id')
+        if category_id and category_id.isdigit():
+            queryset = queryset.filter(product__category_id=category_id)
+        return queryset.order_by('min_price', 'product_id')
+
+    def list(self, request, *args, **kwargs):
+        """Метод list отдаёт страницу сводок; предложения всех товаров страницы — одним запросом."""
+
+        page = self.paginate_queryset(self.get_queryset())
+        offers = product_offers([row['product_id'] for row in page])
+        return self.get_paginated_response([
+            {'product': row['product_id'], 'name': row['product__name'], 'category': row['product__category_id'],
+             'min_price': row['min_price'], 'offer_count': row['offer_count'],
+             'in_stock_count': row['in_stock_count'], 'offers': offers.get(row['product_id'], [])}
+            for row in page])
+
+
+class PriceHistoryView(APIView):
+    """Класс для чтения истории цен и остатков позиций магазина"""
+
+    query_budget = {'get': 2}
+    read_replica = True
+    throttle_scope = 'anon'
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """Метод get отдаёт ряды позиций shop_id по списку external_id=1,2,3 одним запросом;
+           необязательный since (дата или время ISO) отбрасывает более ранние точки."""
+
+        shop_id = request.query_params.get('shop_id', '')
+        external_ids = [value for value in request.query_params.get('external_id', '').split(',') if value]
+        if not shop_id.isdigit() or not external_ids or len(external_ids) > PRICE_HISTORY_LIMIT \
+                or not all(value.isdigit() for value in external_ids):
+            return Response({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        since = request.query_params.get('since')
+        if since:
+            since = parse_since(since)
+            if since is None:
+                return Response({'Status': False, 'Errors': 'Неверный формат since'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(price_series(int(shop_id), list(dict.fromkeys(map(int, external_ids))), since))
+
 
 class BasketView(APIView):
     """Класс для работы с корзиной пользователя"""
 
+    query_budget = {'get': 6, 'post': 9, 'put': 3, 'delete': 2}
     throttle_scope = 'user'
 
     def get(self, request, *args, **kwargs):
@@ -213,14 +339,9 @@ class BasketView(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'},
                                 status=status.HTTP_403_FORBIDDEN)
-        basket = Order.objects.filter(
-            user_id=request.user.id, state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        basket = Order.objects.filter(user_id=request.user.id, state='basket')
 
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
+        return Response(serialize_orders(basket, FieldSelection.from_request(request)))
 
     # редактировать корзину
     def post(self, request, *args, **kwargs):
@@ -239,7 +360,10 @@ class BasketView(APIView):
             except ValueError:
                 Response({'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+                basket, created = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+                if not created:
+                    # dt корзины — время последнего добавления: по нему сборщик мусора находит брошенные
+                    Order.objects.filter(id=basket.id).update(dt=timezone.now())
                 objects_created = 0
                 for order_item in items_dict:
                     order_item.update({'order': basket.id})
@@ -276,12 +400,12 @@ class BasketView(APIView):
             except ValueError:
                 JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
+                # корзину не создаём: без неё обновлять нечего
                 objects_updated = 0
                 for order_item in items_dict:
                     if type(order_item['product_info_id']) == int and type(order_item['quantity']) == int:
                         objects_updated += OrderItem.objects.filter(
-                            order_id=basket.id,
+                            order__user_id=request.user.id, order__state='basket',
                             product_info_id=order_item['product_info_id']).update(
                             quantity=order_item['quantity'])
 
@@ -299,16 +423,16 @@ class BasketView(APIView):
         items_sting = request.data.get('items')
         if items_sting:
             items_list = items_sting.split(',')
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
             query = Q()
             objects_deleted = False
             for order_item_id in items_list:
                 if order_item_id.isdigit():
-                    query = query | Q(order_id=basket.id, id=order_item_id)
+                    query = query | Q(id=order_item_id)
                     objects_deleted = True
 
             if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+                deleted_count = OrderItem.objects.filter(
+                    query, order__user_id=request.user.id, order__state='basket').delete()[0]
                 return Response({'Status': True, 'Удалено объектов': deleted_count})
         return Response({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
                         status=status.HTTP_400_BAD_REQUEST)
@@ -317,12 +441,13 @@ class BasketView(APIView):
 class PartnerUpdate(APIView):
     """Класс для обновления прайса от поставщика"""
 
+    query_budget = {'post': 26}
     throttle_scope = 'user'
 
 
     def post(self, request, *args, **kwargs):
         """Метод post проверяет наличие авторизации, проверяет,
-           что покупатель имеет тип shop, формирует актуальный каталог. """
+           что покупатель имеет тип shop, ставит загрузку прайса в очередь. """
 
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'},
@@ -340,39 +465,61 @@ class PartnerUpdate(APIView):
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
             else:
-                stream = get(url).content
-                data = load_yaml(stream, Loader=Loader)
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
-
-                return JsonResponse({'Status': True})
+                # прайс скачивается и загружается воркером очереди imports, клиент получает id задачи
+                task = do_import.delay(request.user.id, url)
+                return JsonResponse({'Status': True, 'Task': task.id})
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
                             status=status.HTTP_403_FORBIDDEN)
 
 
+class PartnerStock(APIView):
+    """Класс для быстрого обновления цен и остатков поставщиком"""
+
+    query_budget = {'post': 12}
+    throttle_scope = 'user'
+    max_items = 50000
+
+    def post(self, request, *args, **kwargs):
+        """Метод post проверяет наличие авторизации и тип shop, обновляет цены и остатки
+           по списку items из [external_id, price, price_rrc, quantity] без полного импорта прайса."""
+
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Log in required'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if request.user.type != 'shop':
+            return Response({'Status': False, 'Error': 'Только для магазинов'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_items:
+            return Response({'Status': False, 'Errors': f'Не больше {self.max_items} позиций за раз'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(item, list) and len(item) == 4
+                   and all(isinstance(value, int) and not isinstance(value, bool) and value >= 0 for value in item)
+                   for item in items):
+            return Response({'Status': False, 'Errors': 'Позиция: [external_id, price, price_rrc, quantity], '
+                                                        'целые неотрицательные числа'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        shop_id = Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True).first()
+        if shop_id is None:
+            return Response({'Status': False, 'Errors': 'Магазин не найден'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        updated, unknown = update_stock(shop_id, items)
+        return Response({'Status': True, 'Обновлено объектов': updated, 'Не найдено': unknown})
+
+
 class PartnerState(APIView):
     """Класс для работы со статусом поставщика"""
 
+    query_budget = {'get': 2, 'post': 8}
+
     def get(self, request, *args, **kwargs):
         """Метод get проверяет наличие авторизации,
            проверяет, что покупатель имеет тип shop,
@@ -406,6 +553,9 @@ class PartnerState(APIView):
         if state:
             try:
                 Shop.objects.filter(user_id=request.user.id).update(state=str_to_bool(state))
+                for shop_id in Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True):
+                    refresh_shop_offers(shop_id)
+                    bump_shop_catalog(shop_id)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)},
@@ -418,6 +568,9 @@ class PartnerState(APIView):
 class PartnerOrders(APIView):
     """Класс для получения заказов поставщиками """
 
+    query_budget = {'get': 7}
+    read_replica = True
+
     def get(self, request, *args, **kwargs):
         """Метод get проверяет наличие авторизации,
            проверяет, что покупатель имеет тип shop,
@@ -431,19 +584,192 @@ class PartnerOrders(APIView):
             return Response({'Status': False, 'Error': 'Только для магазинов'},
                                 status=status.HTTP_403_FORBIDDEN)
 
-        order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        order = Order.objects.filter(shop__user_id=request.user.id).exclude(state='basket')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return Response(serialize_orders(order, FieldSelection.from_request(request)))
+
+
+class PartnerOrderState(APIView):
+    """Класс для пакетной смены статуса заказов поставщиком"""
+
+    query_budget = {'post': 7}
+    throttle_scope = 'user'
+    # больше заказов за раз не принимаем: список id попадает в один SQL-запрос
+    max_orders = 1000
+
+    def post(self, request, *args, **kwargs):
+        """Метод post проверяет наличие авторизации и тип shop,
+           одним запросом проверяет переходы для всех заказов ids (список или строка через запятую),
+           одним UPDATE переводит допустимые в статус state, ставит одну задачу уведомления покупателей
+           и события вебхуков магазинов."""
+
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Log in required'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if request.user.type != 'shop':
+            return Response({'Status': False, 'Error': 'Только для магазинов'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        target = request.data.get('state')
+        ids = request.data.get('ids')
+        if isinstance(ids, str):
+            ids = ids.split(',')
+        if target not in {state for states in ORDER_TRANSITIONS.values() for state in states} \
+                or not isinstance(ids, list) or not ids:
+            return Response({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = {int(order_id) for order_id in ids}
+        except (TypeError, ValueError):
+            return Response({'Status': False, 'Errors': 'Неверный формат запроса'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_orders:
+            return Response({'Status': False, 'Errors': f'Не больше {self.max_orders} заказов за раз'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        sources = [state for state, targets in ORDER_TRANSITIONS.items() if target in targets]
+        with transaction.atomic():
+            # заказы магазина блокируются до UPDATE, чтобы статус не поменялся между проверкой и записью
+            current = dict(Order.objects.select_for_update().filter(
+                shop__user_id=request.user.id, id__in=ids).order_by().values_list('id', 'state'))
+            allowed = sorted(order_id for order_id, state in current.items() if state in sources)
+            updated = Order.objects.filter(id__in=allowed).update(state=target) if allowed else 0
+            if allowed:
+                emit_order_events('order.state_changed', allowed, target)
+                transaction.on_commit(lambda: orders_state_changed.delay(order_ids=allowed, state=target))
+
+        rejected = {order_id: 'Заказ не найден' if order_id not in current else f'{current[order_id]} -> {target}'
+                    for order_id in sorted(ids - set(allowed))}
+        return Response({'Status': True, 'Обновлено объектов': updated, 'Errors': rejected})
+
+
+class PartnerWebhooks(APIView):
+    """Класс для подписок магазина на события заказов"""
+
+    query_budget = {'get': 3, 'post': 4, 'delete': 3}
+
+    def check_partner(self, request):
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Log in required'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if request.user.type != 'shop':
+            return Response({'Status': False, 'Error': 'Только для магазинов'},
+                            status=status.HTTP_403_FORBIDDEN)
+        return None
+
+    def get(self, request, *args, **kwargs):
+        """Метод get возвращает подписки магазина вместе с ключами подписи."""
+
+        error = self.check_partner(request)
+        if error:
+            return error
+        webhooks = Webhook.objects.filter(shop__user_id=request.user.id).order_by('id')
+        return Response(WebhookSerializer(webhooks, many=True).data)
+
+    def post(self, request, *args, **kwargs):
+        """Метод post создаёт подписку: url и необязательный список событий events через запятую."""
+
+        error = self.check_partner(request)
+        if error:
+            return error
+        if 'url' not in request.data:
+            return Response({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        shop_id = Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True).first()
+        if shop_id is None:
+            return Response({'Status': False, 'Errors': 'Магазин не найден'},
+                            status=status.HTTP_404_NOT_FOUND)
+        serializer = WebhookSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'Status': False, 'Errors': serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer.save(shop_id=shop_id)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, *args, **kwargs):
+        """Метод delete удаляет подписки магазина по списку id через запятую."""
+
+        error = self.check_partner(request)
+        if error:
+            return error
+        items = [item for item in str(request.data.get('items', '')).split(',') if item.isdigit()]
+        if not items:
+            return Response({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        deleted_count = Webhook.objects.filter(shop__user_id=request.user.id, id__in=items).delete()[1] \
+            .get(Webhook._meta.label, 0)
+        return Response({'Status': True, 'Удалено объектов': deleted_count})
+
+
+class PartnerExportMixin:
+    """Проверки для потоковых выгрузок поставщика: авторизация, тип shop и формат."""
+
+    read_replica = True
+
+    def check_partner(self, request, export_format):
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Log in required'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if request.user.type != 'shop':
+            return Response({'Status': False, 'Error': 'Только для магазинов'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if export_format not in exports.CONTENT_TYPES:
+            return Response({'Status': False, 'Errors': 'Формат выгрузки: csv или ndjson'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+
+class PartnerOrdersExport(PartnerExportMixin, APIView):
+    """Потоковая выгрузка позиций заказов магазина в CSV или NDJSON"""
+
+    def get(self, request, export_format, *args, **kwargs):
+        """Метод get отдаёт позиции заказов магазина по строке на позицию;
+           необязательные параметры state и since (дата ISO) фильтруют заказы."""
+
+        error = self.check_partner(request, export_format)
+        if error:
+            return error
+
+        since = request.query_params.get('since')
+        if since:
+            since = parse_since(since)
+            if since is None:
+                return Response({'Status': False, 'Errors': 'Неверный формат since'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        rows = exports.order_rows(request.user.id, router.db_for_read(OrderItem),
+                                  state=request.query_params.get('state'), since=since)
+        return exports.streaming_export(export_format, exports.ORDER_COLUMNS, rows, 'orders')
+
+
+class PartnerCatalogExport(PartnerExportMixin, APIView):
+    """Потоковая выгрузка текущего каталога магазина в CSV или NDJSON"""
+
+    def get(self, request, export_format, *args, **kwargs):
+        """Метод get отдаёт предложения магазина с параметрами."""
+
+        error = self.check_partner(request, export_format)
+        if error:
+            return error
+
+        shop = Shop.objects.filter(user_id=request.user.id).only('id').first()
+        if shop is None:
+            return Response({'Status': False, 'Errors': 'Магазин не найден'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        rows = exports.catalog_rows(shop.id, router.db_for_read(ProductInfo))
+        return exports.streaming_export(export_format, exports.CATALOG_COLUMNS, rows, 'catalog')
 
 
 class ContactView(APIView):
     """Класс для работы с контактами покупателей"""
 
+    query_budget = {'get': 2, 'post': 3}
     throttle_scope = 'user'
 
     def get(self, request, *args, **kwargs):
@@ -530,6 +856,8 @@ class ContactView(APIView):
 class OrderView(APIView):
     """Класс для получения и размешения заказов пользователями"""
 
+    query_budget = {'get': 7, 'post': 8}
+    read_replica = True
     throttle_scope = 'user'
 
     def get(self, request, *args, **kwargs):
@@ -540,14 +868,10 @@ class OrderView(APIView):
             return Response({'Status': False, 'Error': 'Log in required'},
                             status=status.HTTP_403_FORBIDDEN)
 
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        # общие заказы не показываем: их позиции лежат в заказах магазинов
+        order = Order.objects.filter(user_id=request.user.id, shop__isnull=False).exclude(state='basket')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return Response(serialize_orders(order, FieldSelection.from_request(request)))
 
     def post(self, request, *args, **kwargs):
         """Метод get проверяет наличие авторизации,создает заказ."""
@@ -559,10 +883,7 @@ class OrderView(APIView):
         if {'id', 'contact'}.issubset(request.data):
             if request.data['id'].isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
-                        contact_id=request.data['contact'],
-                        state='new')
+                    is_updated = place_order(request.user.id, int(request.data['id']), request.data['contact'])
                 except IntegrityError as error:
                     return Response({'Status': False, 'Errors': 'Неправильно указаны аргументы'},
                                     status=status.HTTP_400_BAD_REQUEST)
@@ -579,6 +900,32 @@ class OrderView(APIView):
 
 
 
+class OrderArchiveView(ListAPIView):
+    """Класс для чтения архива заказов покупателя"""
+
+    query_budget = {'get': 3}
+    read_replica = True
+    throttle_scope = 'user'
+
+    def get(self, request, *args, **kwargs):
+        """Метод get проверяет наличие авторизации,
+           возвращает страницу архивных заказов покупателя, новые первыми (?id= — один заказ)."""
+
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Log in required'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        # общие заказы, как и в OrderView, не показываем
+        orders = ArchivedOrder.objects.filter(user_id=request.user.id, shop__isnull=False).order_by('-dt', '-id')
+        order_id = request.query_params.get('id')
+        if order_id:
+            if not order_id.isdigit():
+                return Response({'Status': False, 'Errors': 'Неправильно указаны аргументы'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            orders = orders.filter(id=order_id)
+        return self.get_paginated_response(serialize_archived_orders(self.paginate_queryset(orders)))
+
+
 class TestErrorView(APIView):
     def get(self, request, *args, **kwargs):
         try:
@@ -589,7 +936,7 @@ class TestErrorView(APIView):
             rollbar.report_exc_info()
             return Response({"status": "error", "message": str(e)}, status=500)
 
-@cachalot(timeout=60 * 15)  # Кэшировать результат на 15 минут
+@cache_page(60 * 15)  # Кэшировать результат на 15 минут
 def product_list(request):
     products = Product.objects.all()
     return render(request, 'product_list.html', {'products': products})
\ No newline at end of file
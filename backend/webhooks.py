@@ -0,0 +1,126 @@
+"""
+Вебхуки поставщиков: события о новых заказах и смене статуса.
+
+emit_order_events записывает события в таблицу WebhookEvent в той же
+транзакции, что и изменение заказа (одно событие на заказ и подписку
+магазина), и после коммита планирует доставку. Задача deliver_webhooks
+отправляет накопившиеся события подписки одним POST-запросом
+{"events": [...]} не чаще раза в WEBHOOK_BATCH_DELAY секунд, пачками по
+WEBHOOK_BATCH_SIZE. Тело подписывается HMAC-SHA256 ключом подписки:
+
+    X-Webhook-Timestamp: <unix time>
+    X-Webhook-Signature: sha256=<hex(hmac(secret, timestamp + "." + body))>
+
+При ошибке задача повторяется с нарастающей паузой; события остаются
+недоставленными, пока получатель не ответит 2xx. Когда повторы исчерпаны,
+доставку заново ставит периодическая задача reschedule_webhooks, а
+доставленные события удаляет сборщик мусора (backend.cleanup). Доставка
+«хотя бы один раз»: получатель отсеивает повторы по id события.
+"""
+import hashlib
+import hmac
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import OrderItem, Webhook, WebhookEvent
+
+# повторы deliver_webhooks: пауза растёт до RETRY_BACKOFF_MAX секунд
+MAX_RETRIES = 10
+RETRY_BACKOFF_MAX = 600
+
+SCHEDULE_KEY = 'webhook-scheduled:{}'
+# пока ключ жив, новые события не ставят вторую задачу; каждая неудачная попытка
+# продлевает его, поэтому ключ переживает паузу до следующей попытки с запасом на саму доставку
+SCHEDULE_TTL = RETRY_BACKOFF_MAX + 60 * 5
+
+
+def sign(secret, timestamp, body):
+    """Подпись тела body (bytes) для заголовка X-Webhook-Signature."""
+    message = str(timestamp).encode() + b'.' + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify(secret, timestamp, body, signature, tolerance=300):
+    """Проверка подписи на стороне получателя; tolerance защищает от повтора старых запросов."""
+    if abs(time.time() - int(timestamp)) > tolerance:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), signature)
+
+
+def emit_order_events(event, order_ids, state):
+    """
+    Создаёт события event для магазинов, чьи позиции есть в заказах order_ids.
+
+    Два запроса на любое число заказов: позиции заказов с магазинами и подписки этих магазинов.
+    """
+    items = {}
+    for order_id, shop_id, external_id, quantity, price in OrderItem.objects.filter(order_id__in=order_ids) \
+            .values_list('order_id', 'product_info__shop_id', 'product_info__external_id', 'quantity',
+                         'product_info__price'):
+        items.setdefault((order_id, shop_id), []).append(
+            {'external_id': external_id, 'quantity': quantity, 'price': price})
+    if not items:
+        return
+
+    webhooks = {}
+    for webhook in Webhook.objects.filter(shop_id__in={shop_id for _, shop_id in items}, is_active=True) \
+            .only('id', 'shop_id', 'events'):
+        if webhook.subscribed(event):
+            webhooks.setdefault(webhook.shop_id, []).append(webhook.id)
+    if not webhooks:
+        return
+
+    occurred_at = timezone.now().isoformat()
+    events = []
+    for (order_id, shop_id), shop_items in items.items():
+        payload = {'order_id': order_id, 'state': state, 'occurred_at': occurred_at}
+        if event == 'order.created':
+            payload['items'] = shop_items
+        events += [WebhookEvent(webhook_id=webhook_id, event=event, payload=payload)
+                   for webhook_id in webhooks.get(shop_id, ())]
+    WebhookEvent.objects.bulk_create(events)
+
+    webhook_ids = {event.webhook_id for event in events}
+    transaction.on_commit(lambda: schedule_delivery(webhook_ids))
+
+
+def schedule_delivery(webhook_ids):
+    """
+    Ставит доставку каждой подписки, если она ещё не запланирована: события копятся в одну пачку.
+
+    Возвращает число поставленных задач.
+    """
+    from backend.tasks import deliver_webhooks
+
+    scheduled = 0
+    for webhook_id in webhook_ids:
+        if cache.add(SCHEDULE_KEY.format(webhook_id), 1, SCHEDULE_TTL):
+            deliver_webhooks.apply_async(args=(webhook_id,), countdown=settings.WEBHOOK_BATCH_DELAY)
+            scheduled += 1
+    return scheduled
+
+
+def reschedule_pending():
+    """
+    Планирует доставку активных подписок с недоставленными событиями, у которых нет задачи:
+    повторы исчерпаны, ключ планирования истёк или задача потерялась вместе с брокером.
+    """
+    return schedule_delivery(WebhookEvent.objects.filter(delivered_at__isnull=True, webhook__is_active=True)
+                             .values_list('webhook_id', flat=True).distinct())
+
+
+def pending_batch(webhook_id):
+    """Недоставленные события подписки, старые первыми."""
+    return list(WebhookEvent.objects.filter(webhook_id=webhook_id, delivered_at__isnull=True)
+                .order_by('id').values('id', 'event', 'payload', 'created_at')[:settings.WEBHOOK_BATCH_SIZE])
+
+
+def encode_batch(events):
+    return json.dumps({'events': [
+        {'id': event['id'], 'event': event['event'], 'created_at': event['created_at'].isoformat(),
+         **event['payload']} for event in events]}, ensure_ascii=False).encode()
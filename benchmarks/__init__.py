@@ -0,0 +1,49 @@
+"""
+Микробенчмарки и нагрузочные сценарии.
+
+Запуск из корня проекта: ``python -m benchmarks.<имя_модуля>``.
+"""
+import os
+import statistics
+import time
+
+
+def setup_django(settings_module='orders.settings'):
+    """Настраивает Django для запуска бенчмарка вне manage.py."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def setup_database():
+    """Настраивает Django на benchmarks.settings и создаёт пустую базу."""
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    setup_django()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    database = settings.DATABASES['default']
+    is_sqlite = database['ENGINE'].endswith('sqlite3')
+    if is_sqlite:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database['NAME'] + suffix):
+                os.remove(database['NAME'] + suffix)
+    call_command('migrate', verbosity=0)
+    if not is_sqlite:
+        call_command('flush', interactive=False, verbosity=0)
+
+
+def timed(func, *args, **kwargs):
+    """Выполняет func и возвращает пару (результат, секунды)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentiles(values):
+    """p50/p95/p99 выборки длительностей (секунды)."""
+    if len(values) < 2:
+        return {'p50': values[0], 'p95': values[0], 'p99': values[0]}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
@@ -0,0 +1,145 @@
+"""
+Пропускная способность синхронного (WSGI) и асинхронного (ASGI) пути
+на эндпоинтах с ожиданием ввода-вывода.
+
+    python -m benchmarks.bench_asgi [--requests 200] [--workers 4] [--concurrency 50] [--latency 300]
+
+Поднимает локальный HTTP-сервер с прайсом, который отвечает с задержкой
+--latency мс, и одновременно отправляет --requests запросов:
+
+* WSGI — partner/update и basket через тестовый клиент в пуле из --workers потоков
+  (как воркеры gunicorn);
+* ASGI — async/partner/update и async/basket через AsyncClient, не более
+  --concurrency запросов одновременно в одном цикле событий.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import setup_database
+
+PRICE_LIST = '''
+shop: {shop}
+categories:
+  - id: 1
+    name: Смартфоны
+goods:
+  - id: 1
+    category: 1
+    model: apple/iphone/xs-max
+    name: Смартфон Apple iPhone XS Max 512GB ({shop})
+    price: 110000
+    price_rrc: 116990
+    quantity: 14
+    parameters:
+      "Цвет": золотистый
+'''
+
+
+def start_feed_server(latency):
+    """HTTP-сервер поставщика: отдаёт прайс магазина /<shop>.yaml через latency секунд."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = PRICE_LIST.format(shop=self.path.strip('/').split('.')[0]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-yaml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_users(count):
+    """Магазины-пользователи с токенами: отдельный пользователь на каждый запрос.
+    Категория создаётся заранее, а товары в прайсах разные, чтобы параллельные
+    импорты не конкурировали за get_or_create одних и тех же строк."""
+    from rest_framework.authtoken.models import Token
+    from backend.models import User, Category
+
+    Category.objects.create(id=1, name='Смартфоны')
+
+    users = User.objects.bulk_create([User(email=f'shop{i}@example.com', username=f'shop{i}', type='shop',
+                                           is_active=True) for i in range(count)])
+    return [(user.id, Token.objects.create(user=user).key) for user in users]
+
+
+def run_wsgi(path, requests, workers):
+    from django.test import Client
+
+    def call(request):
+        index, (user_id, key) = request
+        response = Client().post(path, {'url': f'{feed_url}/shop{index}.yaml'}, content_type='application/json',
+                                 headers={'Authorization': f'Token {key}'}) if path.endswith('update') else \
+            Client().get(path, headers={'Authorization': f'Token {key}'})
+        assert response.status_code == 200, response.content
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(call, enumerate(requests)))
+    return time.perf_counter() - start
+
+
+def run_asgi(path, requests, concurrency):
+    from django.test import AsyncClient
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def call(index, key):
+            async with semaphore:
+                headers = {'Authorization': f'Token {key}'}
+                if path.endswith('update'):
+                    response = await client.post(path, {'url': f'{feed_url}/shop{index}.yaml'},
+                                                 content_type='application/json', headers=headers)
+                else:
+                    response = await client.get(path, headers=headers)
+                assert response.status_code == 200, response.content
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call(index, key) for index, (_, key) in enumerate(requests)))
+        return time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+feed_url = None
+
+
+def main():
+    global feed_url
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=int, default=300, help='задержка ответа поставщика, мс')
+    args = parser.parse_args()
+
+    setup_database()
+    server = start_feed_server(args.latency / 1000)
+    feed_url = f'http://127.0.0.1:{server.server_port}'
+
+    users = create_users(args.requests)
+    for name, sync_path, async_path in (('partner/update', '/api/v1/partner/update', '/api/v1/async/partner/update'),
+                                        ('basket', '/api/v1/basket', '/api/v1/async/basket')):
+        wsgi_time = run_wsgi(sync_path, users, args.workers)
+        asgi_time = run_asgi(async_path, users, args.concurrency)
+        print(f'{name:>15}: WSGI x{args.workers} {args.requests / wsgi_time:8.1f} req/s   '
+              f'ASGI x{args.concurrency} {args.requests / asgi_time:8.1f} req/s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
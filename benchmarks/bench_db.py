@@ -0,0 +1,135 @@
+"""
+Конкурентная нагрузка на корзину и оформление заказа для разных профилей базы.
+
+    python -m benchmarks.bench_db [--profiles sqlite-plain sqlite postgres] [--threads 8] [--iterations 20]
+
+Каждый профиль (DB_PROFILE) запускается в отдельном процессе. --threads
+покупателей параллельно повторяют --iterations раз сценарий: наполнить
+корзину (POST basket), изменить количество (PUT basket), оформить заказ
+(POST order). Печатает пропускную способность, p50/p95 по шагам и число
+ошибок (например, «database is locked»).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_database
+
+
+def seed(buyers, products=200):
+    from rest_framework.authtoken.models import Token
+    from backend.models import Category, Shop, Product, ProductInfo, User, Contact
+
+    shop = Shop.objects.create(name='Магазин')
+    category = Category.objects.create(name='Смартфоны')
+    product_objects = Product.objects.bulk_create(
+        [Product(name=f'Товар {i}', category=category) for i in range(products)])
+    infos = ProductInfo.objects.bulk_create([
+        ProductInfo(product=product, shop=shop, external_id=i, quantity=100, price=100 + i, price_rrc=120 + i)
+        for i, product in enumerate(product_objects)])
+
+    result = []
+    for i in range(buyers):
+        user = User.objects.create(email=f'buyer{i}@example.com', username=f'buyer{i}', is_active=True)
+        contact = Contact.objects.create(user=user, city='Москва', street='Тверская', phone='123')
+        result.append((Token.objects.create(user=user).key, contact.id))
+    return [info.id for info in infos], result
+
+
+def buyer_flow(key, contact_id, product_info_ids, iterations, timings, errors):
+    from django.db import connection
+    from django.test import Client
+
+    client = Client(headers={'Authorization': f'Token {key}'})
+    rnd = random.Random(key)
+    for _ in range(iterations):
+        items = rnd.sample(product_info_ids, 3)
+        steps = (
+            ('basket POST', lambda: client.post('/api/v1/basket', {'items': [
+                {'product_info': item, 'quantity': 1} for item in items]}, content_type='application/json')),
+            ('basket PUT', lambda: client.put('/api/v1/basket', {'items': [
+                {'product_info_id': item, 'quantity': 2} for item in items]}, content_type='application/json')),
+            ('basket GET', lambda: client.get('/api/v1/basket')),
+        )
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                response = step()
+                ok = response.status_code < 400
+            except Exception as error:  # noqa: BLE001 — считаем любые ошибки базы
+                ok, response = False, error
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+            if not ok:
+                errors.append(f'{name}: {response}')
+
+        start = time.perf_counter()
+        try:
+            basket_id = client.get('/api/v1/basket').json()[0]['id']
+            response = client.post('/api/v1/order', {'id': str(basket_id), 'contact': contact_id},
+                                   content_type='application/json')
+            if response.status_code >= 400:
+                errors.append(f'order POST: {response.status_code}')
+        except Exception as error:  # noqa: BLE001
+            errors.append(f'order POST: {error}')
+        timings.setdefault('order POST', []).append(time.perf_counter() - start)
+    connection.close()
+
+
+def run_profile(threads, iterations):
+    """Выполняется в дочернем процессе с нужным DB_PROFILE, печатает JSON с результатами."""
+    setup_database()
+    product_info_ids, buyers = seed(threads)
+
+    timings, errors = {}, []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for future in [pool.submit(buyer_flow, key, contact_id, product_info_ids, iterations, timings, errors)
+                       for key, contact_id in buyers]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'flows_per_second': threads * iterations / elapsed,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'steps': {name: {'p50': statistics.median(values),
+                         'p95': statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]}
+                  for name, values in timings.items()},
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--profiles', nargs='+', default=['sqlite-plain', 'sqlite'])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args.threads, args.iterations)
+        return
+
+    for profile in args.profiles:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_db', '--child', '--threads', str(args.threads),
+             '--iterations', str(args.iterations)],
+            env={**os.environ, 'DB_PROFILE': profile}, capture_output=True, text=True)
+        if output.returncode:
+            print(f'{profile}: failed\n{output.stderr[-2000:]}')
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f'{profile}: {result["flows_per_second"]:.1f} flows/s, errors: {result["errors"]}'
+              + (f' ({result["first_error"]})' if result['first_error'] else ''))
+        for name, stats in result['steps'].items():
+            print(f'    {name:>11}: p50 {stats["p50"] * 1000:7.1f} ms   p95 {stats["p95"] * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
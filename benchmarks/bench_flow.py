@@ -0,0 +1,236 @@
+"""
+Нагрузочный сценарий полного пути покупателя и поставщика.
+
+    python -m benchmarks.bench_flow [--users 8] [--iterations 5] [--shops 4] [--products 500]
+                                    [--output results.json] [--baseline old.json]
+    python -m benchmarks.bench_flow --compare old.json new.json
+
+--users виртуальных покупателей параллельно проходят шаги: регистрация
+(POST user/register), подтверждение почты (POST user/register/confirm),
+вход (POST user/login) и --iterations раз просмотр каталога (GET products),
+наполнение корзины (POST basket), оформление заказа (GET basket + POST order)
+и просмотр заказов поставщиком (GET partner/orders).
+
+База берётся из DB_PROFILE (SQLite или PostgreSQL), почта — locmem, задачи
+Celery выполняются сразу. Для каждого шага печатаются пропускная способность
+и p50/p95/p99, результаты сохраняются в JSON (по умолчанию
+benchmarks/results/flow-<коммит>.json) для сравнения между коммитами.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks import setup_database, percentiles
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+STEPS = ('register', 'confirm', 'login', 'products', 'basket', 'checkout', 'partner orders')
+
+
+def seed(shops, products):
+    """Магазины с владельцами-поставщиками и товарами; возвращает id позиций и токены поставщиков."""
+    from rest_framework.authtoken.models import Token
+    from backend.models import Category, Shop, Product, ProductInfo, Parameter, ProductParameter, User
+
+    category = Category.objects.create(name='Смартфоны')
+    parameters = Parameter.objects.bulk_create([Parameter(name='Цвет'), Parameter(name='Вес')])
+    product_objects = Product.objects.bulk_create(
+        [Product(name=f'Товар {i}', category=category) for i in range(products)])
+
+    partner_keys, info_ids = [], []
+    for index in range(shops):
+        owner = User.objects.create(email=f'shop{index}@example.com', username=f'shop{index}', type='shop',
+                                    is_active=True)
+        shop = Shop.objects.create(name=f'Магазин {index}', user=owner)
+        category.shops.add(shop)
+        infos = ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, external_id=i, model=f'model-{i}', quantity=1000,
+                        price=100 + i, price_rrc=120 + i)
+            for i, product in enumerate(product_objects)])
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info=info, parameter=parameter, value=str(i))
+            for i, info in enumerate(infos) for parameter in parameters])
+        partner_keys.append(Token.objects.create(user=owner).key)
+        info_ids.extend(info.id for info in infos)
+    return info_ids, partner_keys
+
+
+class Recorder:
+    """Потокобезопасный сбор длительностей и ошибок по шагам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {step: [] for step in STEPS}
+        self.errors = {}
+
+    def step(self, name, call):
+        """Выполняет шаг call() и записывает время; возвращает ответ или None при ошибке."""
+        start = time.perf_counter()
+        try:
+            response = call()
+            error = None if response.status_code < 400 else f'HTTP {response.status_code}'
+        except Exception as exc:  # noqa: BLE001 — любые ошибки шага попадают в отчёт
+            response, error = None, f'{type(exc).__name__}: {exc}'
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.timings[name].append(elapsed)
+            if error:
+                self.errors.setdefault(name, []).append(error)
+        return None if error else response
+
+
+def user_flow(index, iterations, info_ids, partner_keys, recorder):
+    from django.db import connection
+    from django.test import Client
+    from backend.models import ConfirmEmailToken
+
+    rnd = random.Random(index)
+    client = Client()
+    email = f'buyer{index}@example.com'
+    password = f'Bench-Password-{index}'
+    try:
+        if not recorder.step('register', lambda: client.post('/api/v1/user/register', {
+                'first_name': 'Иван', 'last_name': 'Петров', 'email': email, 'password': password,
+                'company': 'Компания', 'position': 'Менеджер'}, content_type='application/json')):
+            return
+        key = ConfirmEmailToken.objects.filter(user__email=email).values_list('key', flat=True).first()
+        if not recorder.step('confirm', lambda: client.post('/api/v1/user/register/confirm', {
+                'email': email, 'token': key}, content_type='application/json')):
+            return
+        response = recorder.step('login', lambda: client.post('/api/v1/user/login', {
+            'email': email, 'password': password}, content_type='application/json'))
+        if not response:
+            return
+        headers = {'Authorization': f'Token {response.json()["Token"]}'}
+        client.post('/api/v1/user/contact', {'city': 'Москва', 'street': 'Тверская', 'phone': '123'},
+                    content_type='application/json', headers=headers)
+        contact_id = client.get('/api/v1/user/contact', headers=headers).json()[0]['id']
+
+        pages = max(1, len(info_ids) // 40)
+        for _ in range(iterations):
+            recorder.step('products', lambda: client.get('/api/v1/products/', {'page': rnd.randint(1, pages)},
+                                                         headers=headers))
+            items = rnd.sample(info_ids, 3)
+            recorder.step('basket', lambda: client.post('/api/v1/basket', {'items': [
+                {'product_info': item, 'quantity': rnd.randint(1, 3)} for item in items]},
+                content_type='application/json', headers=headers))
+
+            def checkout():
+                basket = client.get('/api/v1/basket', headers=headers).json()
+                return client.post('/api/v1/order', {'id': str(basket[0]['id']), 'contact': contact_id},
+                                   content_type='application/json', headers=headers)
+
+            recorder.step('checkout', checkout)
+            partner_key = rnd.choice(partner_keys)
+            recorder.step('partner orders', lambda: client.get('/api/v1/partner/orders',
+                                                               headers={'Authorization': f'Token {partner_key}'}))
+    finally:
+        connection.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    setup_database()
+    from django.conf import settings
+
+    info_ids, partner_keys = seed(args.shops, args.products)
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.users) as pool:
+        for future in [pool.submit(user_flow, index, args.iterations, info_ids, partner_keys, recorder)
+                       for index in range(args.users)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'db_profile': settings.DB_PROFILE,
+            'db_engine': settings.DATABASES['default']['ENGINE'],
+            'python': platform.python_version(),
+            'users': args.users, 'iterations': args.iterations,
+            'shops': args.shops, 'products': args.products,
+        },
+        'elapsed': elapsed,
+        'requests_per_second': sum(map(len, recorder.timings.values())) / elapsed,
+        'steps': {
+            name: {'count': len(values), 'errors': len(recorder.errors.get(name, ())),
+                   'throughput': len(values) / elapsed, **percentiles(values)}
+            for name, values in recorder.timings.items() if values},
+        'first_errors': {name: errors[0] for name, errors in recorder.errors.items()},
+    }
+
+
+def print_results(results):
+    meta = results['meta']
+    print(f'{meta["revision"]} {meta["db_profile"]}: {meta["users"]} users x {meta["iterations"]} iterations, '
+          f'{results["requests_per_second"]:.1f} steps/s')
+    for name, stats in results['steps'].items():
+        print(f'{name:>15}: {stats["throughput"]:7.1f}/s  p50 {stats["p50"] * 1000:7.1f} ms  '
+              f'p95 {stats["p95"] * 1000:7.1f} ms  p99 {stats["p99"] * 1000:7.1f} ms  errors {stats["errors"]}')
+    for name, error in results['first_errors'].items():
+        print(f'{name:>15}: {error}')
+
+
+def compare(baseline, results):
+    """Печатает изменение пропускной способности и перцентилей относительно baseline."""
+    print(f'{baseline["meta"]["revision"]} -> {results["meta"]["revision"]}')
+    for name, stats in results['steps'].items():
+        old = baseline['steps'].get(name)
+        if not old:
+            continue
+        changes = [f'{key} {(stats[key] / old[key] - 1) * 100:+6.1f}%' if old[key] else f'{key}      n/a'
+                   for key in ('throughput', 'p50', 'p95', 'p99')]
+        print(f'{name:>15}: ' + '  '.join(changes))
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=8, help='число параллельных покупателей')
+    parser.add_argument('--iterations', type=int, default=5, help='заказов на покупателя')
+    parser.add_argument('--shops', type=int, default=4)
+    parser.add_argument('--products', type=int, default=500, help='товаров в каждом магазине')
+    parser.add_argument('--output', help='куда сохранить JSON с результатами')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='сравнить два сохранённых прогона')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(load(args.compare[0]), load(args.compare[1]))
+        return
+
+    results = run(args)
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f'flow-{results["meta"]["revision"]}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f'results: {output}')
+
+    if args.baseline:
+        compare(load(args.baseline), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Сравнение JSON-рендереров на странице каталога из 40 товаров.
+
+    python -m benchmarks.bench_json [--rounds 2000]
+
+Печатает скорость сериализации (МБ/с и страниц/с) для стандартного
+JSONRenderer и FastJSONRenderer.
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup_django
+
+
+def product_page(size=40, seed=0):
+    """Ответ ProductInfoViewSet.list с пагинацией: 40 позиций с параметрами."""
+    rnd = random.Random(seed)
+    parameters = ['Диагональ (дюйм)', 'Разрешение (пикс)', 'Встроенная память (Гб)', 'Цвет',
+                  'Вес (г)', 'Аккумулятор (мАч)', 'Процессор', 'Гарантия (мес)']
+    results = []
+    for i in range(size):
+        results.append({
+            'id': i + 1,
+            'model': f'apple/iphone/xs-max-{rnd.randint(100, 999)}',
+            'product': {'name': f'Смартфон Apple iPhone XS Max {rnd.choice([64, 256, 512])}GB (золотистый)',
+                        'category': 'Смартфоны'},
+            'shop': rnd.randint(1, 20),
+            'quantity': rnd.randint(0, 500),
+            'price': rnd.randint(1000, 200000),
+            'price_rrc': rnd.randint(1000, 200000),
+            'product_parameters': [
+                {'parameter': name, 'value': str(rnd.randint(1, 4096))}
+                for name in rnd.sample(parameters, rnd.randint(4, len(parameters)))
+            ],
+        })
+    return {
+        'count': 12000,
+        'next': 'http://example.com/api/v1/products/?page=3',
+        'previous': 'http://example.com/api/v1/products/?page=1',
+        'results': results,
+    }
+
+
+def measure(renderer, data, rounds):
+    size = len(renderer.render(data))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        renderer.render(data)
+    elapsed = time.perf_counter() - start
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from backend.renderers import FastJSONRenderer, JSON_BACKEND
+
+    data = product_page()
+    baseline = JSONRenderer().render(data)
+    assert FastJSONRenderer().render(data) == baseline, 'рендереры дают разный результат'
+
+    print(f'payload: {len(baseline)} bytes, fast backend: {JSON_BACKEND}')
+    results = {}
+    for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+        size, elapsed = measure(renderer, data, args.rounds)
+        results[name] = elapsed
+        print(f'{name:>18}: {size * args.rounds / elapsed / 2 ** 20:8.1f} MB/s '
+              f'{args.rounds / elapsed:10.0f} pages/s')
+    print(f'speedup: {results["JSONRenderer"] / results["FastJSONRenderer"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Сравнение ModelSerializer и быстрых функций сериализации на списках.
+
+    python -m benchmarks.bench_serializers [--sizes 1000 10000 100000]
+
+Для каждого размера заполняет базу (benchmarks.settings) и замеряет
+время получения JSON для каталога (ProductInfoSerializer против
+serialize_product_infos) и истории заказов (OrderSerializer против
+serialize_orders; заказы разложены по покупателям, по ORDERS_PER_USER
+на каждого, и сериализуются так же, как в OrderView — по одному
+покупателю за запрос). Проверяет, что результат побайтно совпадает.
+"""
+import argparse
+import random
+
+from benchmarks import setup_database, timed
+
+ORDERS_PER_USER = 200
+
+
+def seed(size, parameters_per_item=5, items_per_order=3, seed=0):
+    from backend.models import Category, Shop, Product, ProductInfo, Parameter, ProductParameter, User, Order, \
+        OrderItem, Contact
+
+    rnd = random.Random(seed)
+    for model in (OrderItem, Order, ProductParameter, ProductInfo, Product, Parameter, Category, Shop, Contact):
+        model.objects.all().delete()
+
+    shops = Shop.objects.bulk_create([Shop(name=f'Магазин {i}') for i in range(10)])
+    categories = Category.objects.bulk_create([Category(name=f'Категория {i}') for i in range(20)])
+    parameters = Parameter.objects.bulk_create([Parameter(name=f'Параметр {i}') for i in range(20)])
+    products = Product.objects.bulk_create(
+        [Product(name=f'Товар {i}', category=rnd.choice(categories)) for i in range(max(size // 4, 1))],
+        batch_size=5000)
+    infos = ProductInfo.objects.bulk_create([
+        ProductInfo(product=rnd.choice(products), shop=shops[i % len(shops)], external_id=i, model=f'model-{i}',
+                    quantity=rnd.randint(0, 100), price=rnd.randint(100, 10000), price_rrc=rnd.randint(100, 10000))
+        for i in range(size)], batch_size=5000)
+    ProductParameter.objects.bulk_create([
+        ProductParameter(product_info=info, parameter=parameter, value=str(rnd.randint(1, 1000)))
+        for info in infos for parameter in rnd.sample(parameters, parameters_per_item)], batch_size=5000)
+
+    User.objects.filter(email__startswith='bench').delete()
+    users = User.objects.bulk_create([User(email=f'bench{i}@example.com', username=f'bench{i}')
+                                      for i in range((size + ORDERS_PER_USER - 1) // ORDERS_PER_USER)])
+    contacts = Contact.objects.bulk_create(
+        [Contact(user=user, city='Москва', street='Тверская', phone='123') for user in users])
+    orders = Order.objects.bulk_create(
+        [Order(user=users[i // ORDERS_PER_USER], state='new', contact=contacts[i // ORDERS_PER_USER])
+         for i in range(size)], batch_size=5000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_info=info, quantity=rnd.randint(1, 5))
+        for order in orders for info in rnd.sample(infos, min(items_per_order, len(infos)))], batch_size=5000)
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    setup_database()
+    from django.db.models import Sum, F
+    from rest_framework.renderers import JSONRenderer
+    from backend.models import ProductInfo, Order
+    from backend.serializers import ProductInfoSerializer, OrderSerializer, product_info_values, \
+        serialize_product_infos, serialize_orders
+
+    render = JSONRenderer().render
+    for size in args.sizes:
+        users = seed(size)
+
+        infos = ProductInfo.objects.select_related('shop', 'product__category').prefetch_related(
+            'product_parameters__parameter')
+        plain_orders = Order.objects.all()
+        orders = Order.objects.prefetch_related(
+            'ordered_items__product_info__product__category',
+            'ordered_items__product_info__product_parameters__parameter').select_related('contact').annotate(
+            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+
+        cases = (
+            ('products', lambda: render(ProductInfoSerializer(infos.all(), many=True).data),
+             lambda: render(serialize_product_infos(infos.values(*product_info_values())))),
+            ('orders', lambda: [render(OrderSerializer(orders.filter(user=user), many=True).data)
+                                for user in users],
+             lambda: [render(serialize_orders(plain_orders.filter(user=user))) for user in users]),
+        )
+        for name, slow, fast in cases:
+            slow_data, slow_time = timed(slow)
+            fast_data, fast_time = timed(fast)
+            assert slow_data == fast_data, f'{name}: результаты различаются'
+            print(f'{name:>8} {size:>7} rows: serializer {slow_time:8.3f}s  fast {fast_time:8.3f}s  '
+                  f'speedup {slow_time / fast_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Обновление цен и остатков: update_stock против bulk_update.
+
+    python -m benchmarks.bench_stock [--sizes 1000 10000] [--changed 0.5]
+
+Для каждого размера создаёт магазин с size позициями и дважды обновляет
+цены и остатки доли --changed позиций: через update_stock (PartnerStock) и
+через ProductInfo.objects.bulk_update тех же позиций.
+"""
+import argparse
+import random
+
+from benchmarks import setup_database, timed
+
+
+def seed(size):
+    from backend.models import Category, Shop, Product, ProductInfo
+
+    ProductInfo.objects.all().delete()
+    shop = Shop.objects.create(name='Магазин')
+    category = Category.objects.create(name='Смартфоны')
+    products = Product.objects.bulk_create([Product(name=f'Товар {i}', category=category) for i in range(size)])
+    ProductInfo.objects.bulk_create([
+        ProductInfo(product=product, shop=shop, external_id=i, quantity=10, price=100, price_rrc=120)
+        for i, product in enumerate(products)], batch_size=5000)
+    return shop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--changed', type=float, default=0.5, help='доля позиций с новой ценой или остатком')
+    args = parser.parse_args()
+
+    setup_database()
+    from backend.imports import update_stock
+    from backend.models import ProductInfo
+
+    rnd = random.Random(0)
+    for size in args.sizes:
+        shop = seed(size)
+        items = [[i, 100 + rnd.randint(1, 50), 120, rnd.randint(0, 20)] if rnd.random() < args.changed
+                 else [i, 100, 120, 10] for i in range(size)]
+        (updated, _), fast = timed(update_stock, shop.id, items)
+
+        ids = dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'id'))
+        objects = [ProductInfo(id=ids[external_id], price=price + 1, price_rrc=price_rrc, quantity=quantity)
+                   for external_id, price, price_rrc, quantity in items]
+        _, slow = timed(ProductInfo.objects.bulk_update, objects, ['price', 'price_rrc', 'quantity'],
+                        batch_size=1000)
+        print(f'{size:>7} позиций, изменено {updated:>7}: update_stock {fast * 1000:8.1f} ms  '
+              f'bulk_update {slow * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
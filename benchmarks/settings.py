@@ -0,0 +1,33 @@
+"""
+Настройки для бенчмарков: отдельная база SQLite и сервисы в памяти
+(кэш, почта, Celery), чтобы замеры не зависели от Redis и SMTP.
+"""
+import os
+import tempfile
+
+from orders.settings import *  # noqa: F401,F403
+
+# профиль базы (DB_PROFILE) берётся из основных настроек, для SQLite — отдельный файл;
+# профиль sqlite-plain — SQLite без прагм и постоянных соединений, для сравнения
+if DB_PROFILE != 'postgres':
+    DATABASES['default']['NAME'] = os.getenv('BENCH_DB', os.path.join(tempfile.gettempdir(), 'orders_bench.sqlite3'))
+if DB_PROFILE == 'sqlite-plain':
+    DATABASES['default'].update({'CONN_MAX_AGE': 0, 'OPTIONS': {}})
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+CACHALOT_ENABLED = False
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+
+LOGGING = {'version': 1, 'disable_existing_loggers': False}
+
+# ограничения частоты запросов мешают замерам пропускной способности
+REST_FRAMEWORK = {**REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': []}
@@ -2,6 +2,8 @@
 ASGI config for orders project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server, e.g. ``uvicorn orders.asgi:application --workers 4``;
+the async endpoints live under ``/api/v1/async/`` (see README).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
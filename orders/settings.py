@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 import rollbar
 
@@ -20,12 +21,63 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 
-CELERY_BROKER_URL = 'redis://localhost:6379/1'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/2'
+# CELERY_EAGER=1 — задачи выполняются сразу в процессе, брокер и результаты в памяти (тесты, локальная отладка)
+CELERY_EAGER = os.getenv('CELERY_EAGER', 'false').lower() in ('1', 'true', 'yes')
+
+CELERY_BROKER_URL = 'memory://' if CELERY_EAGER else os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/1')
+CELERY_RESULT_BACKEND = 'cache+memory://' if CELERY_EAGER else \
+    os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/2')
+CELERY_TASK_ALWAYS_EAGER = CELERY_EAGER
+CELERY_TASK_EAGER_PROPAGATES = CELERY_EAGER
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Очереди: письма не ждут за миниатюрами и импортами прайсов. Воркеры запускаются
+# на каждую очередь отдельно со своей конкурентностью и prefetch (см. README).
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = {
+    'default': {},
+    'emails': {},
+    'imports': {},
+    'media': {},
+    'webhooks': {},
+}
+CELERY_TASK_ROUTES = {
+    'new_user_registered': {'queue': 'emails', 'priority': 0},
+    'new_order': {'queue': 'emails', 'priority': 3},
+    'orders_state_changed': {'queue': 'emails', 'priority': 3},
+    'do_import': {'queue': 'imports'},
+    'backend.tasks.generate_thumbnails': {'queue': 'media'},
+    'deliver_webhooks': {'queue': 'webhooks'},
+    'reschedule_webhooks': {'queue': 'webhooks'},
+}
+# приоритеты внутри очереди Redis: 0 — самый высокий
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    # больше самого долгого импорта, иначе Redis передоставит неподтверждённую задачу
+    'visibility_timeout': 60 * 60,
+}
+
+# подтверждение после выполнения: задача, потерянная вместе с воркером, выполнится снова,
+# поэтому все задачи идемпотентны (backend.tasks.IdempotentTask)
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_PREFETCH_MULTIPLIER', 1))
+
+# результаты хранятся только у задач, которые их возвращают (ignore_result=False)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = 60 * 60 * 24
+
+# периодические задачи: celery -A orders beat (расписание по UTC)
+CELERY_BEAT_SCHEDULE = {
+    'collect-garbage': {'task': 'collect_garbage', 'schedule': crontab(minute=15)},
+    'reschedule-webhooks': {'task': 'reschedule_webhooks', 'schedule': crontab(minute='*/10')},
+    'archive-orders': {'task': 'do_archive', 'schedule': crontab(hour=3, minute=30)},
+}
+
 SOCIAL_AUTH_YANDEX_OAUTH2_KEY = os.getenv('YANDEX_OAUTH2_KEY')
 SOCIAL_AUTH_YANDEX_OAUTH2_SECRET = os.getenv('YANDEX_OAUTH2_SECRET')
 SOCIAL_AUTH_VK_OAUTH2_KEY = os.getenv('VK_OAUTH2_KEY')
@@ -66,15 +118,17 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'backend.metrics.RequestMetricsMiddleware',
+    'backend.profiling.SlowRequestProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'backend.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
-    'rollbar.contrib.django.middleware.RollbarNotifierMiddleware',
 ]
 
 ROOT_URLCONF = 'orders.urls'
@@ -104,30 +158,59 @@ ROLLBAR = {
     'environment': 'development' if DEBUG else 'production',
     'code_version': '1.0',
     'root': BASE_DIR,
+    # прямые вызовы rollbar.report_* отправляют отчёт в отдельном потоке
+    'handler': 'thread',
 }
 
 def report_exception(request=None):
     rollbar.report_exc_info(request=request)
 
+# Логирование через очереди (backend.log): запрос только кладёт запись в очередь,
+# вывод и отправка в Rollbar идут в фоновых потоках. Ошибки запросов попадают
+# в Rollbar через логгер django.request, без синхронного middleware.
+LOGGING_CONFIG = 'backend.log.configure_logging'
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+# уровни отдельных логгеров, например LOG_LEVELS=django.db.backends=DEBUG,backend=WARNING
+LOG_LEVELS = {'django.db.backends': 'WARNING'}
+LOG_LEVELS.update(item.split('=', 1) for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'queue_size': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    'formatters': {
+        'json': {
+            '()': 'backend.log.JsonFormatter',
+        },
+        'text': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
     'handlers': {
         'rollbar': {
             'level': 'ERROR',
-            'class': 'rollbar.logger.RollbarHandler',
+            'class': 'backend.log.BatchingRollbarHandler',
         },
         'console': {
-            'level': 'DEBUG',
             'class': 'logging.StreamHandler',
+            # 'json' или 'text'
+            'formatter': os.getenv('LOG_FORMAT', 'json'),
         },
     },
     'loggers': {
         'django': {
             'handlers': ['console', 'rollbar'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': True,
         },
+        'backend': {
+            'handlers': ['console', 'rollbar'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        **{name: {'level': level} for name, level in LOG_LEVELS.items()},
     },
 }
 
@@ -136,12 +219,116 @@ LOGGING = {
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, "db.sqlite3"),
+# Профиль базы выбирается переменной DB_PROFILE:
+#   sqlite   — файл SQLite в режиме WAL: чтения не блокируются записью,
+#              synchronous=NORMAL, mmap и ожидание блокировки вместо ошибки;
+#   postgres — PostgreSQL с постоянными соединениями (CONN_MAX_AGE)
+#              или пулом соединений psycopg (DB_POOL=1, нужен psycopg[pool]).
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'orders'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if os.getenv('DB_POOL'):
+        # пул и CONN_MAX_AGE взаимоисключающие: соединения держит пул
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+            'timeout': 10,
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 600))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', os.path.join(BASE_DIR, "db.sqlite3")),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=268435456;'
+                    'PRAGMA busy_timeout=5000;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+                # запись сразу берёт блокировку, без взаимоблокировки при апгрейде чтения до записи
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 5,
+            },
+        }
+    }
+
+# Реплики только для чтения: каталог и история заказов читаются из них
+# (backend.routers). Для SQLite реплику изображает второй файл SQLITE_REPLICA_PATH,
+# для PostgreSQL — хосты из POSTGRES_REPLICA_HOSTS через запятую.
+DATABASE_REPLICAS = []
+if DB_PROFILE == 'postgres':
+    for index, host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+        DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+        DATABASE_REPLICAS.append(f'replica{index}')
+elif os.getenv('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': os.getenv('SQLITE_REPLICA_PATH'),
+                            'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append('replica')
+
+DATABASE_ROUTERS = ['backend.routers.PrimaryReplicaRouter']
+
+# сколько секунд клиент после записи читает только из default
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# метрики запросов (backend.metrics): Server-Timing и /api/v1/metrics, по умолчанию выключены
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# ключ сборщика метрик (Authorization: Bearer <ключ>); без ключа /api/v1/metrics видит только персонал
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# размер порции строк для потоковых выгрузок поставщика (backend.exports)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# вебхуки поставщиков (backend.webhooks): пауза для накопления пачки, размер пачки и таймаут, секунды
+WEBHOOK_BATCH_DELAY = int(os.getenv('WEBHOOK_BATCH_DELAY', 2))
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', 100))
+WEBHOOK_TIMEOUT = int(os.getenv('WEBHOOK_TIMEOUT', 5))
+# через сколько дней сборщик мусора удаляет доставленные события
+WEBHOOK_EVENT_RETENTION_DAYS = int(os.getenv('WEBHOOK_EVENT_RETENTION_DAYS', 7))
+
+# архив заказов (backend.archive): возраст завершённых заказов в днях и размер пачки переноса
+ORDER_ARCHIVE_DAYS = int(os.getenv('ORDER_ARCHIVE_DAYS', 180))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+
+# сборка мусора (backend.cleanup): когда корзина считается брошенной, срок жизни токена
+# подтверждения почты и размер пачек удаления
+BASKET_ABANDONED_DAYS = int(os.getenv('BASKET_ABANDONED_DAYS', 30))
+EMPTY_BASKET_HOURS = int(os.getenv('EMPTY_BASKET_HOURS', 24))
+CONFIRM_TOKEN_TTL_HOURS = int(os.getenv('CONFIRM_TOKEN_TTL_HOURS', 72))
+GC_BATCH_SIZE = int(os.getenv('GC_BATCH_SIZE', 1000))
+GC_MAX_BATCHES = int(os.getenv('GC_MAX_BATCHES', 100))
+
+# метрики задач Celery (backend.task_metrics): копятся в кэше, общем для веб-процессов и воркеров
+TASK_METRICS_ENABLED = os.getenv('TASK_METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TASK_METRICS_CACHE = os.getenv('TASK_METRICS_CACHE', 'default')
+
+# профили медленных запросов и задач Celery (backend.profiling), по умолчанию выключены
+SLOW_PROFILER_ENABLED = os.getenv('SLOW_PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SLOW_PROFILER_THRESHOLD_MS = int(os.getenv('SLOW_PROFILER_THRESHOLD_MS', 1000))
+SLOW_PROFILER_INTERVAL_MS = float(os.getenv('SLOW_PROFILER_INTERVAL_MS', 5))
+SLOW_PROFILER_MAX_DEPTH = 128
+SLOW_PROFILER_MAX_SAMPLES = 20000
+SLOW_PROFILER_DIR = os.getenv('SLOW_PROFILER_DIR', os.path.join(BASE_DIR, 'profiles'))
+# 'speedscope' или 'collapsed'
+SLOW_PROFILER_FORMAT = os.getenv('SLOW_PROFILER_FORMAT', 'speedscope')
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -200,13 +387,21 @@ AUTHENTICATION_BACKENDS = (
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Бэкенд для backend.renderers: 'orjson', 'msgspec', 'json' или None (автовыбор)
+FAST_JSON_BACKEND = os.getenv('FAST_JSON_BACKEND') or None
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 40,
 
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'backend.renderers.FastJSONRenderer',
+    ) + (('rest_framework.renderers.BrowsableAPIRenderer',) if DEBUG else ()),
+
+    'DEFAULT_PARSER_CLASSES': (
+        'backend.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -244,6 +439,11 @@ CACHES = {
     }
 }
 
+# в режиме CELERY_EAGER Redis не нужен: кэш в памяти процесса, cachalot выключен
+if CELERY_EAGER:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    CACHALOT_ENABLED = False
+
 
 SOCIAL_AUTH_PIPELINE = (
     'social_core.pipeline.social_auth.social_details',